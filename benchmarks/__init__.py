@@ -0,0 +1,106 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmarks are run from the repository root, e.g. `python -m benchmarks.decimal_encoder`,
+and print their results as JSON so they can be compared between releases.
+"""
+
+import json
+import platform
+import sys
+import threading
+import time
+import timeit
+
+from django.conf import settings
+
+
+def configure_settings(**overrides):
+    """
+    Minimal Django settings for running the benchmarks outside of a project
+    """
+    if not settings.configured:
+        base = {
+            'INFLUXDB_DISABLED': True,
+            'ENVIRONMENT': 'BENCHMARK',
+        }
+        base.update(overrides)
+        settings.configure(**base)
+
+
+def time_per_call(func, number, repeat=5):
+    """
+    Best of `repeat` runs, in seconds per call
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def latency_summary(durations):
+    """
+    p50/p99/max of a list of durations in seconds, in milliseconds
+    """
+    durations = sorted(durations)
+    if not durations:
+        return {}
+
+    def percentile(fraction):
+        return round(durations[min(len(durations) - 1, int(len(durations) * fraction))] * 1000, 3)
+
+    return {'p50_ms': percentile(0.5), 'p99_ms': percentile(0.99), 'max_ms': round(durations[-1] * 1000, 3)}
+
+
+def run_load(client, operation, thread_count, total_requests, errors=Exception):
+    """
+    Call `operation(client)` from `thread_count` threads, `total_requests` times in all.
+    Calls raising `errors` are counted as failed instead of aborting the run.
+    """
+    per_thread = max(1, total_requests // thread_count)
+    durations = [[] for _ in range(thread_count)]
+    error_counts = [0] * thread_count
+
+    def worker(index):
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            try:
+                operation(client)
+            except errors:
+                error_counts[index] += 1
+            durations[index].append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(thread_count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = [duration for thread_durations in durations for duration in thread_durations]
+    return {
+        'threads': thread_count,
+        'requests': len(samples),
+        'errors': sum(error_counts),
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        **latency_summary(samples),
+    }
+
+
+def emit(benchmark, results):
+    json.dump({
+        'benchmark': benchmark,
+        'python': platform.python_version(),
+        'results': results,
+    }, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
@@ -0,0 +1,104 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Load-tests the AWS API Gateway clients against a local stand-in gateway verifying their SigV4 signatures:
+    python -m benchmarks.aws_client [--threads 1,8,32] [--requests 1000] [--latency-ms 0] [--throttle-rate 0]
+        [--client-error-rate 0] [--error-rate 0] [--slow-rate 0] [--slow-ms 1000]
+"""
+
+import argparse
+import logging
+import os
+from uuid import uuid4
+
+from django.conf import settings
+
+from . import configure_settings, emit, run_load
+
+AWS_HOST = 'not-really-aws.com'
+ACCESS_KEY, SECRET_KEY = 'AKIDEXAMPLE', 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY'
+
+configure_settings(URL_SHORTENER_URL=f'https://{AWS_HOST}/stage', URL_SHORTENER_HOST=AWS_HOST,
+                   IOT_AWS_HOST=AWS_HOST, IOT_GATEWAY_STAGE='stage')
+
+# Credentials resolved by boto from the environment, matching the ones the stand-in verifies
+os.environ['AWS_ACCESS_KEY_ID'] = ACCESS_KEY
+os.environ['AWS_SECRET_ACCESS_KEY'] = SECRET_KEY
+
+# pylint: disable=wrong-import-position
+from src.shipchain_common.aws import URLShortenerClient  # noqa: E402
+from src.shipchain_common.exceptions import AWSIoTError  # noqa: E402
+from src.shipchain_common.iot import AWSIoTClient  # noqa: E402
+from src.shipchain_common.test_utils.aws_server import APIGatewayServer  # noqa: E402
+
+DEVICE_ID = str(uuid4())
+DEVICE_IDS = [str(uuid4()) for _ in range(16)]
+
+OPERATIONS = {
+    'iot.get_device': (AWSIoTClient, lambda client: client._get(f'devices/{DEVICE_ID}')),
+    'iot.put_device_shadow': (AWSIoTClient, lambda client: client._put(
+        f'devices/{DEVICE_ID}/shadow', {'state': {'desired': {'reportingInterval': 60}}})),
+    'iot.get_devices[16]': (AWSIoTClient, lambda client: client.get_devices(DEVICE_IDS)),
+    'urlshortener.post': (URLShortenerClient, lambda client: client._post(
+        'shorten', {'long_url': f'https://example.com/shipments/{DEVICE_ID}/tracking'})),
+}
+
+
+def local_client(client_class, server):
+    return type(f'Local{client_class.__name__}', (client_class,), {'url': f'{server.url}/stage'})()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[-1])
+    parser.add_argument('--threads', default='1,8,32', help='comma separated thread counts')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per operation and thread count')
+    parser.add_argument('--latency-ms', type=float, default=0, help='latency added to every response')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='fraction of requests throttled with a 429')
+    parser.add_argument('--retry-after', type=float, default=0.1, help='Retry-After of the 429s, in seconds')
+    parser.add_argument('--client-error-rate', type=float, default=0, help='fraction of requests failing with a 404')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests failing with a 503')
+    parser.add_argument('--slow-rate', type=float, default=0, help='fraction of requests delayed by --slow-ms')
+    parser.add_argument('--slow-ms', type=float, default=1000)
+    args = parser.parse_args()
+
+    # Errors injected by the stand-in would otherwise be logged for every failed request
+    logging.getLogger('python-common').setLevel(logging.CRITICAL)
+
+    thread_counts = [int(count) for count in args.threads.split(',')]
+    settings.HTTP_TRANSPORT = {'default': {'pool_maxsize': max(thread_counts)}}
+
+    results = {}
+    with APIGatewayServer(AWS_HOST, ACCESS_KEY, SECRET_KEY, latency=args.latency_ms / 1000,
+                          throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+                          client_error_rate=args.client_error_rate, error_rate=args.error_rate,
+                          slow_rate=args.slow_rate, slow_latency=args.slow_ms / 1000, seed=0) as server:
+        for name, (client_class, operation) in OPERATIONS.items():
+            client = local_client(client_class, server)
+
+            # Warm up the connection pool
+            run_load(client, operation, max(thread_counts), max(thread_counts), errors=AWSIoTError)
+            results[name] = [run_load(client, operation, thread_count, args.requests, errors=AWSIoTError)
+                             for thread_count in thread_counts]
+
+        results['server'] = {
+            'requests': server.request_count,
+            'status_counts': {str(code): count for code, count in sorted(server.status_counts.items())},
+        }
+
+    emit('aws_client', {'config': vars(args), **results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Compares the per request and per client SigV4 signing overhead of BotoAWSRequestsAuth and CachedBotoAWSRequestsAuth:
+    python -m benchmarks.aws_signing [--number 5000]
+"""
+
+import argparse
+import datetime
+import os
+
+import requests
+from botocore.credentials import Credentials, RefreshableCredentials
+
+from . import configure_settings, emit, time_per_call
+
+configure_settings(URL_SHORTENER_URL='https://not-really-aws.com/stage', URL_SHORTENER_HOST='not-really-aws.com')
+
+# Credentials resolved by boto from the environment, unless real ones are configured
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'AKIDEXAMPLE')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY')
+
+# pylint: disable=wrong-import-position
+from aws_requests_auth.boto_utils import BotoAWSRequestsAuth  # noqa: E402
+from src.shipchain_common.aws import CachedBotoAWSRequestsAuth, URLShortenerClient  # noqa: E402
+
+AUTH_ARGS = ('not-really-aws.com', 'us-east-1', 'execute-api')
+
+
+def build_credentials():
+    expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    return {
+        'static': Credentials('AKIDEXAMPLE', 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY'),
+        'refreshable': RefreshableCredentials.create_from_metadata(
+            metadata={'access_key': 'ASIAEXAMPLE', 'secret_key': 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY',
+                      'token': 'session-token', 'expiry_time': expiry.isoformat()},
+            refresh_using=lambda: None,
+            method='benchmark'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[-1])
+    parser.add_argument('--number', type=int, default=5000)
+    args = parser.parse_args()
+
+    request = requests.Request('POST', 'https://not-really-aws.com/stage/shorten?ttl=3600',
+                               data=b'{"long_url": "https://example.com/shipments/1"}').prepare()
+
+    results = {}
+    for credentials_name, credentials in build_credentials().items():
+        for auth_class in (BotoAWSRequestsAuth, CachedBotoAWSRequestsAuth):
+            auth = auth_class(*AUTH_ARGS)
+            auth._refreshable_credentials = credentials
+            seconds = time_per_call(lambda: auth(request.copy()), args.number)
+            results[f'request.{credentials_name}.{auth_class.__name__}'] = {'us_per_request': round(seconds * 1e6, 3)}
+
+        before = results[f'request.{credentials_name}.BotoAWSRequestsAuth']['us_per_request']
+        after = results[f'request.{credentials_name}.CachedBotoAWSRequestsAuth']['us_per_request']
+        results[f'request.{credentials_name}.CachedBotoAWSRequestsAuth']['speedup'] = round(before / after, 2)
+
+    # Every client instantiation used to resolve the boto credentials again, it now only does on the first
+    before = time_per_call(lambda: BotoAWSRequestsAuth(*AUTH_ARGS), max(1, args.number // 50))
+    URLShortenerClient()
+    after = time_per_call(URLShortenerClient, args.number)
+    results['client_init'] = {
+        'us_before': round(before * 1e6, 3),
+        'us_after': round(after * 1e6, 3),
+        'speedup': round(before / after, 2),
+    }
+
+    emit('aws_signing', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Compares the DecimalEncoder modes when encoding large arrays of amounts:
+    python -m benchmarks.decimal_encoder [--size 10000]
+"""
+
+import argparse
+import json
+from decimal import Decimal
+
+from . import configure_settings, emit, time_per_call
+
+configure_settings()
+
+from src.shipchain_common.utils import DecimalEncoder  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def build_payloads(size):
+    amounts = [Decimal('1000000000000000000.000000000000000001') + index for index in range(size)]
+    return {
+        'flat': amounts,
+        'nested': {'transfers': [{'amount': amount, 'to': '0x94Fad76b5Be2b746598BCe12e7b45D7C06D8DA1F'}
+                                 for amount in amounts]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[-1])
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+
+    results = {}
+    for payload_name, payload in build_payloads(args.size).items():
+        for mode in ('float', 'string', 'number'):
+            seconds = time_per_call(lambda: json.dumps(payload, cls=DecimalEncoder, decimal_mode=mode), args.number)
+            results[f'{payload_name}.{mode}'] = {
+                'size': args.size,
+                'ms_per_encode': round(seconds * 1000, 3),
+                'us_per_decimal': round(seconds * 1e6 / args.size, 3),
+            }
+
+        baseline = results[f'{payload_name}.float']['ms_per_encode']
+        for mode in ('string', 'number'):
+            results[f'{payload_name}.{mode}']['speedup_vs_float'] = round(
+                baseline / results[f'{payload_name}.{mode}']['ms_per_encode'], 2)
+
+    emit('decimal_encoder', results)
+
+
+if __name__ == '__main__':
+    main()
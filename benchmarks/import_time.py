@@ -0,0 +1,63 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Measures the time taken to import the client modules in a fresh interpreter, once Django is configured:
+    python -m benchmarks.import_time [--repeat 7]
+"""
+
+import argparse
+import statistics
+import subprocess  # nosec #B404
+import sys
+
+from . import emit
+
+MODULES = ('src.shipchain_common.aws', 'src.shipchain_common.iot', 'src.shipchain_common.rpc')
+
+# Settings are configured first, their own imports are not part of the measure. No client settings are defined:
+# importing the client modules must not need them.
+SCRIPT = '''
+import time
+from benchmarks import configure_settings
+configure_settings()
+import influxdb_metrics.loader, rest_framework.status, django.db.models
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+'''
+
+
+def time_import(module):
+    output = subprocess.run([sys.executable, '-c', SCRIPT.format(module=module)],  # nosec #B603
+                            check=True, stdout=subprocess.PIPE).stdout
+    return float(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[-1])
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    results = {}
+    for module in MODULES:
+        seconds = [time_import(module) for _ in range(args.repeat)]
+        results[module] = {'ms_median': round(statistics.median(seconds) * 1000, 1),
+                           'ms_min': round(min(seconds) * 1000, 1)}
+
+    emit('import_time', results)
+
+
+if __name__ == '__main__':
+    main()
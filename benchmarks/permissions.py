@@ -0,0 +1,81 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Measures PermissionedTokenUser permission checks for tokens with many features:
+    python -m benchmarks.permissions [--features 50,200,500] [--permissions-per-feature 4] [--checked 10]
+"""
+
+import argparse
+import time
+
+import django
+
+from . import configure_settings, emit, time_per_call
+
+configure_settings(SECRET_KEY='benchmark', INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes'],
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+# The simplejwt authentication module needs the user model
+django.setup()
+
+# pylint: disable=wrong-import-position
+from src.shipchain_common.authentication import PermissionedTokenUser  # noqa: E402
+
+
+def build_token(feature_count, permissions_per_feature):
+    issued_at = int(time.time())
+    return {
+        'jti': f'benchmark-{feature_count}-{permissions_per_feature}',
+        'iat': issued_at,
+        'exp': issued_at + 300,
+        'features': {f'feature{feature}': [f'permission{permission}' for permission in range(permissions_per_feature)]
+                     for feature in range(feature_count)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[-1])
+    parser.add_argument('--features', default='50,200,500', help='comma separated feature counts')
+    parser.add_argument('--permissions-per-feature', type=int, default=4)
+    parser.add_argument('--checked', type=int, default=10, help='permissions checked by has_perms')
+    parser.add_argument('--number', type=int, default=10000)
+    args = parser.parse_args()
+
+    results = {}
+    for feature_count in (int(count) for count in args.features.split(',')):
+        token = build_token(feature_count, args.permissions_per_feature)
+        user = PermissionedTokenUser(token)
+        permissions = user.get_all_permissions()
+
+        # The last permissions of the token, the worst case of a scan of the permission list
+        checked = permissions[-args.checked:]
+        last = permissions[-1]
+
+        results[str(feature_count)] = {
+            'permissions': len(permissions),
+            'us_has_perm': round(time_per_call(lambda: user.has_perm(last), args.number) * 1e6, 3),
+            'us_has_perms': round(time_per_call(lambda: user.has_perms(checked), args.number) * 1e6, 3),
+            # A new user per request, its permissions found in the process' permission cache
+            'us_new_user_has_perms': round(time_per_call(
+                lambda: PermissionedTokenUser(token).has_perms(checked), args.number) * 1e6, 3),
+            # Linear scans of the permission list, as done before the permission set
+            'us_list_scan_has_perms': round(time_per_call(
+                lambda: all(perm in permissions for perm in checked), args.number) * 1e6, 3),
+        }
+
+    emit('permissions', {'config': vars(args), **results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Load-tests RPCClient against a local stand-in Engine, reporting latency, throughput, serialization and metric costs:
+    python -m benchmarks.rpc_client [--threads 1,8,32] [--requests 2000] [--latency-ms 0] [--error-rate 0]
+"""
+
+import argparse
+import logging
+import time
+from unittest import mock
+
+from django.conf import settings
+
+from . import configure_settings, emit, run_load, time_per_call
+
+# The breaker would stop the load as soon as the stand-in returns errors
+configure_settings(CIRCUIT_BREAKERS={'engine_rpc': {'enabled': False}})
+
+# pylint: disable=wrong-import-position
+from src.shipchain_common import rpc  # noqa: E402
+from src.shipchain_common.codec import get_codec  # noqa: E402
+from src.shipchain_common.exceptions import RPCError  # noqa: E402
+from src.shipchain_common.test_utils.rpc_server import EngineRPCServer, default_rpc_result  # noqa: E402
+
+WALLET_ID = 'e1a8e7b8-3c16-4d3b-9dc2-1b9c2d5f6f0a'
+TRANSACTION = {
+    'to': '0x94Fad76b5Be2b746598BCe12e7b45D7C06D8DA1F',
+    'data': '0x' + 'ab' * 256,
+    'gasLimit': '0x7a120',
+    'gasPrice': '0x4a817c800',
+    'nonce': '0x1',
+    'chainId': 3,
+    'value': '0x0',
+}
+SIGNED_TRANSACTION = '0x' + 'cd' * 400
+CALLBACK_URL = 'https://example.com/api/v1/transactions/callback/'
+
+OPERATIONS = {
+    'call': (lambda client: client.call('wallet.balance', {'wallet': WALLET_ID, 'token': 'SHIP'}),
+             'wallet.balance', {'wallet': WALLET_ID, 'token': 'SHIP'}),
+    'sign_transaction': (lambda client: client.sign_transaction(WALLET_ID, TRANSACTION),
+                         'transaction.sign', rpc.BaseRPCClient._build_sign_params(WALLET_ID, TRANSACTION)),
+    'send_transaction': (lambda client: client.send_transaction(SIGNED_TRANSACTION, CALLBACK_URL),
+                         'transaction.send', rpc.BaseRPCClient._build_send_params(SIGNED_TRANSACTION, CALLBACK_URL)),
+}
+
+
+class NullTimingMetric:
+    """
+    Stands in for TimingMetric when measuring the client without metrics
+    """
+
+    def __init__(self, measurement, tags=None):
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start_time
+
+
+def measure_serialization(client, method, params, number):
+    payload = client._build_request(method, params).as_payload()
+    response = get_codec().dumps({'jsonrpc': '2.0', 'result': default_rpc_result(method, params), 'id': 0})
+    if isinstance(response, str):
+        response = response.encode()
+    return {
+        'request_bytes': len(client._serialize(payload)),
+        'us_per_serialize': round(time_per_call(lambda: client._serialize(payload), number) * 1e6, 3),
+        'us_per_parse': round(time_per_call(lambda: get_codec().loads(response), number) * 1e6, 3),
+    }
+
+
+def measure_metrics(client, operation, requests):
+    """
+    Metric calls made per request and their cost, along with the single threaded latency with metrics disabled
+    """
+    with mock.patch.object(rpc, 'log_metric', wraps=rpc.log_metric) as counted_metric, \
+            mock.patch.object(rpc, 'TimingMetric', wraps=rpc.TimingMetric) as counted_timing:
+        operation(client)
+        metric_calls = counted_metric.call_count + counted_timing.call_count
+
+    us_per_metric = time_per_call(lambda: rpc.log_metric(
+        'engine_rpc.call', tags={'method': 'wallet.balance', 'module': rpc.__name__}), 1000) * 1e6
+
+    with mock.patch.object(rpc, 'log_metric', lambda *args, **kwargs: None), \
+            mock.patch.object(rpc, 'TimingMetric', NullTimingMetric):
+        without_metrics = run_load(client, operation, 1, requests, errors=RPCError)
+
+    return {
+        'metric_calls_per_request': metric_calls,
+        'us_per_metric_call': round(us_per_metric, 3),
+        'us_metric_overhead_per_request': round(us_per_metric * metric_calls, 3),
+        'p50_ms_without_metrics': without_metrics['p50_ms'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[-1])
+    parser.add_argument('--threads', default='1,8,32', help='comma separated thread counts')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per operation and thread count')
+    parser.add_argument('--latency-ms', type=float, default=0, help='latency added by the stand-in server')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests failing with a 503')
+    parser.add_argument('--number', type=int, default=2000, help='iterations of the serialization timings')
+    args = parser.parse_args()
+
+    # Errors injected by the stand-in would otherwise be logged for every failed request
+    logging.getLogger('python-common').setLevel(logging.CRITICAL)
+
+    thread_counts = [int(count) for count in args.threads.split(',')]
+    settings.HTTP_TRANSPORT = {'engine_rpc': {'pool_maxsize': max(thread_counts)}}
+
+    results = {}
+    with EngineRPCServer(latency=args.latency_ms / 1000, error_rate=args.error_rate, seed=0) as server:
+        settings.ENGINE_RPC_URL = server.url
+        client = rpc.RPCClient()
+
+        for name, (operation, method, params) in OPERATIONS.items():
+            # Warm up the connection pool
+            run_load(client, operation, max(thread_counts), max(thread_counts), errors=RPCError)
+
+            results[name] = {
+                'load': [run_load(client, operation, thread_count, args.requests, errors=RPCError)
+                         for thread_count in thread_counts],
+                'serialization': measure_serialization(client, method, params, args.number),
+                'metrics': measure_metrics(client, operation, args.requests),
+            }
+        results['server_requests'] = server.request_count
+
+    emit('rpc_client', {
+        'config': {'latency_ms': args.latency_ms, 'error_rate': args.error_rate, 'codec': get_codec().name},
+        **results,
+    })
+
+
+if __name__ == '__main__':
+    main()
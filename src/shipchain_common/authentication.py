@@ -14,17 +14,71 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import hashlib
+import time
+
 from django.conf import settings
-from django.core.cache import cache
+from django.utils.functional import cached_property
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import BasePermission
 from rest_framework_simplejwt.authentication import JWTTokenUserAuthentication
 from rest_framework_simplejwt.models import TokenUser
 
+from .caching import LRUCache, MISSING, get_two_tier_cache
+from .custom_logging.middleware import get_token_context, set_token_context
 from .utils import parse_dn
 
+# Validated tokens by SHA-256 of the raw token, each expiring with its token
+VERIFIED_TOKENS = LRUCache(maxsize=1024)
+
+
+def get_verified_token(raw_token, validate):
+    """
+    The validated token returned by `validate(raw_token)`, which is only called the first time an unexpired token
+    is seen by the process: the signature verification is skipped for tokens that already passed it
+    """
+    key = hashlib.sha256(raw_token.encode() if isinstance(raw_token, str) else raw_token).digest()
+    validated_token = VERIFIED_TOKENS.get(key)
+    if validated_token is MISSING:
+        validated_token = validate(raw_token)
+
+        ttl = validated_token.payload.get('exp', 0) - time.time()
+        if ttl > 0:
+            VERIFIED_TOKENS.set(key, validated_token, ttl)
+
+    return validated_token
+
+
+class CachedJWTTokenUserAuthentication(JWTTokenUserAuthentication):
+    """
+    Drop-in JWTTokenUserAuthentication verifying each token once per process, see get_verified_token.
+    Use it in REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'] to share the verified tokens with
+    UserOrganizationMiddleware and passive_credentials_auth, and to reuse the token the middleware
+    already decoded for the request (see TokenContext).
+    """
+
+    def get_validated_token(self, raw_token):
+        return get_verified_token(raw_token, super().get_validated_token)
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
 
-PASSIVE_JWT_AUTHENTICATION = JWTTokenUserAuthentication()
+        # Already decoded and verified by UserOrganizationMiddleware
+        context = get_token_context(request)
+        if context is None or not context.verified or context.raw_token != raw_token:
+            validated_token = self.get_validated_token(raw_token)
+            context = set_token_context(request, raw_token, self.get_user(validated_token), validated_token)
+
+        return context.user, context.validated_token
+
+
+PASSIVE_JWT_AUTHENTICATION = CachedJWTTokenUserAuthentication()
 
 
 def passive_credentials_auth(jwt):
@@ -38,6 +92,9 @@ def get_jwt_from_request(request):
     This is for retrieving the decoded JWT from the a request via the simplejwt authenticator.
     """
     if settings.PROFILES_ENABLED and request.user and request.user.is_authenticated:
+        context = get_token_context(request)
+        if context is not None:
+            return context.raw_token.decode()
         return (request.authenticators[-1].get_raw_token(request.authenticators[-1].get_header(request)).decode()
                 if request.authenticators else None)
     return None
@@ -75,8 +132,13 @@ class PermissionedTokenUser(TokenUser):
     """
     This Requires the JWT from Profiles to have been generated with the `permissions` scope
     Override the default class by setting SIMPLE_JWT['TOKEN_USER_CLASS'] = 'path.to.this.class'
+    Permissions are cached by token in the 'permissions' TwoTierCache, see settings.TWO_TIER_CACHES
     """
 
+    @property
+    def permission_cache(self):
+        return get_two_tier_cache('permissions')
+
     def save(self):
         raise NotImplementedError('Token users have no DB representation')
 
@@ -127,42 +189,54 @@ class PermissionedTokenUser(TokenUser):
 
         return life
 
-    def get_all_permissions(self, obj=None):
+    @cached_property
+    def _permissions(self):
         """
         For each Feature/FeaturePermission, build a dot-pathed permission
         These values are cached if we can find a suitable unique key in the token.
         This prevents re-parsing the permissions over the lifetime of this token
-        as they will not change until a new token is received
+        as they will not change until a new token is received.
+        Returns (permissions in token order, their frozenset), the set being built once per token.
         """
-        permissions = None
         unique_key = self._get_permission_cache_key()
+        cache_life = self._get_permission_cache_life()
 
         if unique_key:
-            permissions = cache.get(unique_key)
-
-        if not permissions:
-            features = self.token.get('features')
-            if not features:
-                return []
+            permissions, _ = self.permission_cache.get(unique_key, ttl=cache_life)
+            if permissions is not MISSING:
+                return permissions
 
-            permissions = []
-            for feature in features:
-                for permission in features[feature]:
-                    permissions.append(f'{feature}.{permission}')
+        features = self.token.get('features') or {}
+        ordered = tuple(f'{feature}.{permission}' for feature in features for permission in features[feature])
+        permissions = ordered, frozenset(ordered)
 
-            if unique_key:
-                cache.set(unique_key, permissions, self._get_permission_cache_life())
+        # Tokens without features are cached too
+        if unique_key:
+            self.permission_cache.set(unique_key, permissions, cache_life)
 
         return permissions
 
+    @property
+    def permission_set(self):
+        """
+        The token's permissions as a frozenset, for constant time lookups
+        """
+        return self._permissions[1]
+
+    def get_all_permissions(self, obj=None):
+        """
+        Dot-pathed permissions of the token, in the order of its features
+        """
+        return list(self._permissions[0])
+
     def has_perm(self, perm, obj=None):
         """
         Validate perm is in token feature permissions
         """
-        return perm in self.get_all_permissions(obj)
+        return perm in self.permission_set
 
     def has_perms(self, perm_list, obj=None):
         """
         Validate perm_list is in token feature permissions
         """
-        return all(self.has_perm(perm, obj) for perm in perm_list)
+        return self.permission_set.issuperset(perm_list)
@@ -14,30 +14,201 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import json
+import asyncio
+import datetime
+import functools
+import hashlib
+import hmac
 import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 
 import requests
-from aws_requests_auth.boto_utils import BotoAWSRequestsAuth
+from aws_requests_auth.aws_auth import getSignatureKey
+from aws_requests_auth.boto_utils import BotoAWSRequestsAuth, get_credentials
 from django.conf import settings
 from influxdb_metrics.loader import log_metric, TimingMetric
 from rest_framework import status
 
+from .caching import LRUCache, MISSING, get_or_create, get_two_tier_cache
+from .codec import get_codec
 from .exceptions import AWSIoTError
-from .utils import DecimalEncoder
+from .latency import get_latency_histograms, get_slow_call_sampler
+from .resilience import RetryPolicy, get_rate_limiter, parse_retry_after
+from .utils import classproperty
+from .transport import get_async_session, get_connection_timings, get_session, import_aiohttp, \
+    reset_connection_timings
 
 LOG = logging.getLogger('python-common')
 
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson')
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Derived SigV4 signing keys by (secret key, date, region, service); a key is valid for a whole day
+SIGNING_KEYS = LRUCache(maxsize=32)
+
+
+def get_signing_key(secret_key, datestamp, region, service):
+    cache_key = (secret_key, datestamp, region, service)
+    signing_key = SIGNING_KEYS.get(cache_key)
+    if signing_key is MISSING:
+        signing_key = getSignatureKey(secret_key, datestamp, region, service)
+        SIGNING_KEYS.set(cache_key, signing_key)
+    return signing_key
+
+
+class CachedBotoAWSRequestsAuth(BotoAWSRequestsAuth):
+    """
+    BotoAWSRequestsAuth that keeps the resolved boto credentials until they are due for refresh (static
+    credentials are resolved once), and reuses the signing key derived for the day, region and service.
+    Signatures are identical to those of BotoAWSRequestsAuth.
+    """
+
+    # Resolve credentials again this long before they expire, as botocore would refresh them from then on
+    CREDENTIALS_REFRESH_MARGIN = 15 * 60
+
+    def __init__(self, aws_host, aws_region, aws_service):
+        super().__init__(aws_host, aws_region, aws_service)
+        self._credentials = None
+        self._credentials_valid_until = 0
+        self._credentials_lock = threading.Lock()
+
+    def _credentials_lifetime(self):
+        # Only RefreshableCredentials (e.g. from an instance role) have an expiry
+        expiry_time = getattr(self._refreshable_credentials, '_expiry_time', None)
+        if expiry_time is None:
+            return float('inf')
+        seconds_left = (expiry_time - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        return max(seconds_left - self.CREDENTIALS_REFRESH_MARGIN, 0)
+
+    def get_credentials(self):
+        if time.monotonic() >= self._credentials_valid_until:
+            with self._credentials_lock:
+                if time.monotonic() >= self._credentials_valid_until:
+                    self._credentials = get_credentials(self._refreshable_credentials)
+                    self._credentials_valid_until = time.monotonic() + self._credentials_lifetime()
+        return self._credentials
+
+    async def get_credentials_async(self):
+        if time.monotonic() < self._credentials_valid_until:
+            return self._credentials
+        # Resolving credentials can reach the network (e.g. instance metadata), keep it off the event loop
+        return await asyncio.get_event_loop().run_in_executor(None, self.get_credentials)
+
+    def get_aws_request_headers_handler(self, r):
+        return self.get_aws_request_headers(r, **self.get_credentials())
+
+    async def sign_async(self, r):
+        """
+        Sign a requests.PreparedRequest from a coroutine
+        """
+        r.headers.update(self.get_aws_request_headers(r, **await self.get_credentials_async()))
+        return r
+
+    def get_aws_request_headers(self, r, aws_access_key, aws_secret_access_key, aws_token):
+        # Same signing process as AWSRequestsAuth.get_aws_request_headers, with the signing key cached
+        amzdate = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+        datestamp = amzdate[:8]
+
+        canonical_headers = f'host:{self.aws_host}\nx-amz-date:{amzdate}\n'
+        signed_headers = 'host;x-amz-date'
+        if aws_token:
+            canonical_headers += f'x-amz-security-token:{aws_token}\n'
+            signed_headers += ';x-amz-security-token'
+
+        body = r.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        payload_hash = hashlib.sha256(body).hexdigest()
+
+        canonical_request = '\n'.join((r.method, self.get_canonical_path(r), self.get_canonical_querystring(r),
+                                       canonical_headers, signed_headers, payload_hash))
+
+        algorithm = 'AWS4-HMAC-SHA256'
+        credential_scope = f'{datestamp}/{self.aws_region}/{self.service}/aws4_request'
+        string_to_sign = '\n'.join((algorithm, amzdate, credential_scope,
+                                    hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()))
+
+        signing_key = get_signing_key(aws_secret_access_key, datestamp, self.aws_region, self.service)
+        signature = hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+        headers = {
+            'Authorization': f'{algorithm} Credential={aws_access_key}/{credential_scope}, '
+                             f'SignedHeaders={signed_headers}, Signature={signature}',
+            'x-amz-date': amzdate,
+            'x-amz-content-sha256': payload_hash,
+        }
+        if aws_token:
+            headers['X-Amz-Security-Token'] = aws_token
+        return headers
+
+
+SIGNING_AUTHS = {}
+SIGNING_AUTHS_LOCK = threading.Lock()
+
+
+def get_signing_auth(aws_host, aws_region, aws_service):
+    """
+    Process wide CachedBotoAWSRequestsAuth for an endpoint, shared by its sync and async clients
+    """
+    return get_or_create(SIGNING_AUTHS, SIGNING_AUTHS_LOCK, (aws_host, aws_region, aws_service),
+                         lambda: CachedBotoAWSRequestsAuth(aws_host=aws_host, aws_region=aws_region,
+                                                           aws_service=aws_service))
+
+
+ROUTE_PLACEHOLDER = re.compile(r'<(?:(?P<converter>[a-z]+):)?(?P<name>\w+)>')
+
+ROUTE_CONVERTERS = {
+    'str': r'[^/]+',
+    'int': r'[0-9]+',
+    'uuid': r'(?i:[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12})',
+}
+
+
+def compile_route_templates(templates):
+    """
+    Compile route templates such as 'devices/<device_id>/shadow' into a single regex with one group per template,
+    and the generic endpoints reported for them. A placeholder matches a path segment, or the values of a
+    converter with '<converter:name>' (see ROUTE_CONVERTERS).
+    """
+    sources, generic_endpoints = [], []
+    for template in templates:
+        source, position = [], 0
+        for placeholder in ROUTE_PLACEHOLDER.finditer(template):
+            source.append(re.escape(template[position:placeholder.start()]))
+            source.append(f'(?:{ROUTE_CONVERTERS[placeholder.group("converter") or "str"]})')
+            position = placeholder.end()
+        source.append(re.escape(template[position:]))
+
+        sources.append(f'({"".join(source)})')
+        generic_endpoints.append(ROUTE_PLACEHOLDER.sub(r'<\g<name>>', template))
+
+    return re.compile('|'.join(sources)) if sources else None, generic_endpoints
+
+
+class BaseAWSClient:
+    """
+    Transport agnostic parts of the clients for SigV4 signed AWS API Gateway endpoints: configuration,
+    metric names and the mapping of error responses to AWSIoTError.
+    """
 
-class AWSClient:
     @property
     def url(self):
         raise NotImplementedError
 
     @property
-    def session(self):
+    def aws_host(self):
         raise NotImplementedError
 
+    # Name of the service in settings.HTTP_TRANSPORT and settings.RATE_LIMITS
+    service_name = None
+
+    aws_region = 'us-east-1'
+    aws_service = 'execute-api'
+
     METHOD_POST = 'post'
     METHOD_PUT = 'put'
     METHOD_GET = 'get'
@@ -45,48 +216,141 @@ class AWSClient:
 
     RESPONSE_200_METHODS = [METHOD_PUT, METHOD_GET, METHOD_DELETE]
 
-    def _call(self, http_method, endpoint, payload=None, params=None):
-        metric_name = self._get_generic_endpoint_for_metric(http_method, endpoint)
-        calling_url = f'{self.url}/{endpoint}'
+    # Maximum number of concurrent requests made by the bulk operations
+    bulk_concurrency = 16
 
-        if payload:
-            payload = json.dumps(payload, cls=DecimalEncoder)
+    # Paginated list responses are {PAGINATION_ITEMS_KEY: [items], PAGINATION_TOKEN_KEY: token of the next page},
+    # the token being sent back in the PAGINATION_TOKEN_KEY query parameter to get the next page
+    PAGINATION_ITEMS_KEY = 'items'
+    PAGINATION_TOKEN_KEY = 'nextToken'
 
-        try:
+    # Requests throttled with a 429 are retried after their Retry-After delay plus jitter (or the policy's backoff
+    # when there is none). A Retry-After longer than the policy's max_delay is not waited for.
+    throttle_retry_policy = RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=10)
 
-            with TimingMetric('python_common_aws.call', tags={'method': metric_name}) as timer:
+    # Endpoints are reported in metrics as '<metric_prefix>::<http_method>::<generic endpoint>'. The generic endpoint
+    # is the first of the `route_templates` that matches, e.g. 'devices/<device_id>/shadow' for 'devices/1234/shadow'.
+    metric_prefix = None
+    route_templates = ()
 
-                if http_method == self.METHOD_POST:
-                    response = self.session.post(calling_url, data=payload, params=params)
-                    response_json = response.json()
+    _route_pattern, _generic_endpoints = compile_route_templates(route_templates)
 
-                    if response.status_code != status.HTTP_201_CREATED:
-                        self._process_error_object(metric_name, response, response_json)
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._route_pattern, cls._generic_endpoints = compile_route_templates(cls.route_templates)
 
-                elif http_method in self.RESPONSE_200_METHODS:
-                    response = getattr(self.session, http_method)(calling_url, data=payload, params=params)
-                    response_json = response.json()
+    @classmethod
+    def get_auth(cls):
+        return get_signing_auth(cls.aws_host, cls.aws_region, cls.aws_service)
 
-                    if response.status_code != status.HTTP_200_OK:
-                        self._process_error_object(metric_name, response, response_json)
+    @property
+    def rate_limiter(self):
+        # TokenBucket configured in settings.RATE_LIMITS[service_name], None when the service is not rate limited
+        return get_rate_limiter(self.service_name) if self.service_name else None
 
-                else:
-                    log_metric('python_common_aws.error', tags={'method': metric_name, 'code': 'InvalidHTTPMethod'})
-                    LOG.error('aws_client(%s) error: %s', metric_name, 'Invalid HTTP Method')
-                    raise AWSIoTError(f'Invalid HTTP Method {http_method}')
+    @property
+    def latency_histograms(self):
+        # Latency of every call by metric name, see LatencyHistograms.snapshot and flush_latency_histograms
+        return get_latency_histograms('python_common_aws')
 
-                LOG.info('aws_client(%s) duration: %.3f', metric_name, timer.elapsed)
+    @property
+    def slow_call_sampler(self):
+        # SlowCallSampler configured in settings.SLOW_CALL_SAMPLING[service_name], None when not sampling
+        return get_slow_call_sampler(self.service_name) if self.service_name else None
+
+    def _observe_call(self, metric_name, elapsed, status_code, request_bytes, response_bytes, get_breakdown):
+        """
+        Record the latency of a call, and log the details of the sampled slow calls.
+        `get_breakdown()` returns the seconds spent by phase of the call, it is only called for sampled calls.
+        """
+        self.latency_histograms.record(metric_name, elapsed)
+
+        sampler = self.slow_call_sampler
+        if not sampler or not sampler.should_sample(elapsed):
+            return
+
+        breakdown = get_breakdown()
+        LOG.warning('aws_client(%s) slow call: %.3f, status: %s, request: %d bytes, response: %d bytes, %s',
+                    metric_name, elapsed, status_code, request_bytes, response_bytes,
+                    ', '.join(f'{phase}: {seconds:.3f}' for phase, seconds in breakdown.items()))
+        log_metric('python_common_aws.slow_call', tags={'method': metric_name, 'code': status_code}, fields={
+            'value': elapsed, 'request_bytes': request_bytes, 'response_bytes': response_bytes, **breakdown})
 
-        except requests.exceptions.ConnectionError:
-            log_metric('python_common_aws.error', tags={'method': metric_name, 'code': 'ConnectionError'})
-            raise AWSIoTError("Service temporarily unavailable, try again later", status.HTTP_503_SERVICE_UNAVAILABLE,
-                              'service_unavailable')
+    @staticmethod
+    def _log_rate_limit_wait(metric_name, waited):
+        log_metric('python_common_aws.rate_limit_wait', tags={'method': metric_name}, fields={'value': waited})
+        if waited:
+            LOG.info('aws_client(%s) waited %.3f for the rate limit', metric_name, waited)
+
+    def _get_throttle_delay(self, metric_name, attempt, retry_after_header):
+        """
+        Seconds to wait before retrying a request throttled with a 429, None if it should not be retried
+        """
+        policy = self.throttle_retry_policy
+        if not policy or not policy.should_retry(attempt):
+            return None
+
+        retry_after = parse_retry_after(retry_after_header)
+        if retry_after is not None and retry_after > policy.max_delay:
+            return None
+
+        LOG.warning('aws_client(%s) throttled on attempt %d, retrying', metric_name, attempt)
+        log_metric('python_common_aws.retry', tags={'method': metric_name, 'reason': status.HTTP_429_TOO_MANY_REQUESTS,
+                                                    'attempt': attempt})
+        return (retry_after or 0) + policy.get_delay(attempt)
+
+    def _get_expected_status(self, metric_name, http_method):
+        if http_method == self.METHOD_POST:
+            return status.HTTP_201_CREATED
+
+        if http_method in self.RESPONSE_200_METHODS:
+            return status.HTTP_200_OK
+
+        log_metric('python_common_aws.error', tags={'method': metric_name, 'code': 'InvalidHTTPMethod'})
+        LOG.error('aws_client(%s) error: %s', metric_name, 'Invalid HTTP Method')
+        raise AWSIoTError(f'Invalid HTTP Method {http_method}')
 
-        except Exception as exception:
-            log_metric('python_common_aws.error', tags={'method': metric_name, 'code': 'exception'})
-            raise AWSIoTError(str(exception))
+    @staticmethod
+    def _connection_error(metric_name):
+        log_metric('python_common_aws.error', tags={'method': metric_name, 'code': 'ConnectionError'})
+        return AWSIoTError("Service temporarily unavailable, try again later", status.HTTP_503_SERVICE_UNAVAILABLE,
+                           'service_unavailable')
 
-        return response_json
+    @staticmethod
+    def _exception_error(metric_name, exception):
+        log_metric('python_common_aws.error', tags={'method': metric_name, 'code': 'exception'})
+        return AWSIoTError(str(exception))
+
+    @staticmethod
+    def _is_ndjson(content_type):
+        return (content_type or '').split(';')[0].strip() in NDJSON_CONTENT_TYPES
+
+    def _get_page_items(self, page):
+        if isinstance(page, list):
+            return page
+        return page.get(self.PAGINATION_ITEMS_KEY) or []
+
+    def _get_next_page_params(self, params, page):
+        """
+        Query parameters of the page after `page`, None if it is the last one
+        """
+        token = page.get(self.PAGINATION_TOKEN_KEY) if isinstance(page, dict) else None
+        if not token:
+            return None
+        return {**(params or {}), self.PAGINATION_TOKEN_KEY: token}
+
+    @staticmethod
+    def _log_stream(metric_name, stream_format, counts):
+        log_metric('python_common_aws.stream', tags={'method': metric_name, 'format': stream_format}, fields=counts)
+        LOG.info('aws_client(%s) streamed %d items in %d pages, %d bytes', metric_name, counts['items'],
+                 counts['pages'], counts['bytes'])
+
+    @staticmethod
+    def _log_bulk_results(timer, metric_name, results):
+        error_count = sum(isinstance(result, AWSIoTError) for result in results.values())
+        timer.tags['errors'] = error_count
+        LOG.info('aws_client(%s[%d]) duration: %.3f, errors: %d', metric_name, len(results), timer.elapsed,
+                 error_count)
 
     def _post(self, endpoint='', payload=None, query_params=None):
         return self._call(self.METHOD_POST, endpoint, payload, params=query_params)
@@ -100,6 +364,9 @@ class AWSClient:
     def _delete(self, endpoint='', query_params=None):
         return self._call(self.METHOD_DELETE, endpoint, params=query_params)
 
+    def _call(self, http_method, endpoint, payload=None, params=None):
+        raise NotImplementedError
+
     @staticmethod
     def _process_error_object(endpoint, response, response_json):
         error_code = response.status_code
@@ -122,24 +389,431 @@ class AWSClient:
         LOG.error('aws_client(%s) error: %s', endpoint, message)
         raise AWSIoTError(f'Error in AWS IoT Request: [{error_code}] {message}')
 
+    @classmethod
+    def _get_unmatched_generic_endpoint(cls, endpoint):
+        # Endpoints that match no route template are reported as is
+        return endpoint
+
+    @classmethod
+    @functools.lru_cache(maxsize=4096)
+    def _get_metric_name(cls, http_method, endpoint):
+        match = cls._route_pattern.fullmatch(endpoint) if cls._route_pattern else None
+        if match:
+            generic_endpoint = cls._generic_endpoints[match.lastindex - 1]
+        else:
+            generic_endpoint = cls._get_unmatched_generic_endpoint(endpoint)
+
+        if cls.metric_prefix:
+            return f'{cls.metric_prefix}::{http_method}::{generic_endpoint}'
+        return f'{http_method}::{generic_endpoint}'
+
     def _get_generic_endpoint_for_metric(self, http_method, endpoint):
-        # This should be overwritten by each usage of this class for added clarity.
-        return f'{http_method}::{endpoint}'
+        # Subclasses should declare `metric_prefix` and `route_templates` for added clarity
+        return self._get_metric_name(http_method, endpoint)
+
 
+class AWSClient(BaseAWSClient):
+    """
+    Client backed by the class' shared requests session, which is set up for JSON requests signed with
+    CachedBotoAWSRequestsAuth on the first instantiation.
+    """
 
-class URLShortenerClient(AWSClient):
-    url = settings.URL_SHORTENER_URL
-    session = requests.session()
+    @classproperty
+    def session(cls):  # pylint: disable=no-self-argument
+        # Built on first use, shared by the clients of the service
+        if cls.service_name is None:
+            raise NotImplementedError
+        return get_session(cls.service_name)
+
+    _signing_lock = threading.Lock()
 
     def __init__(self):
-        aws_auth = BotoAWSRequestsAuth(
-            aws_host=settings.URL_SHORTENER_HOST,
-            aws_region='us-east-1',
-            aws_service='execute-api'
-        )
+        self.install_signing()
+
+    @classmethod
+    def install_signing(cls):
+        auth = cls.get_auth()
+        if cls.session.auth is auth:
+            return
+
+        with AWSClient._signing_lock:
+            cls.session.headers.update({'content-type': 'application/json'})
+            cls.session.auth = auth
+
+    def _send(self, http_method, url, payload, params, metric_name, **kwargs):
+        attempt = 0
+        while True:
+            attempt += 1
+            rate_limiter = self.rate_limiter
+            if rate_limiter:
+                self._log_rate_limit_wait(metric_name, rate_limiter.acquire())
+
+            reset_connection_timings()
+            response = getattr(self.session, http_method)(url, data=payload, params=params, **kwargs)
+
+            if response.status_code != status.HTTP_429_TOO_MANY_REQUESTS:
+                return response
+
+            delay = self._get_throttle_delay(metric_name, attempt, response.headers.get('Retry-After'))
+            if delay is None:
+                return response
+            response.close()
+            time.sleep(delay)
+
+    def _call(self, http_method, endpoint, payload=None, params=None):
+        metric_name = self._get_generic_endpoint_for_metric(http_method, endpoint)
+        calling_url = f'{self.url}/{endpoint}'
 
-        self.session.headers = {'content-type': 'application/json'}
-        self.session.auth = aws_auth
+        codec = get_codec()
+        if payload:
+            payload = codec.dumps(payload)
 
-    def _get_generic_endpoint_for_metric(self, http_method, endpoint):
-        return f'urlshortener::{http_method}::{endpoint}'
+        try:
+
+            with TimingMetric('python_common_aws.call', tags={'method': metric_name}) as timer:
+                expected_status = self._get_expected_status(metric_name, http_method)
+
+                response = self._send(http_method, calling_url, payload, params, metric_name)
+                response_json = codec.load_response(response)
+                self._observe_call(metric_name, timer.elapsed, response.status_code, len(payload or b''),
+                                   self._get_content_length(response),
+                                   lambda: self._get_timing_breakdown(response, timer.elapsed))
+
+                if response.status_code != expected_status:
+                    self._process_error_object(metric_name, response, response_json)
+
+                LOG.info('aws_client(%s) duration: %.3f', metric_name, timer.elapsed)
+
+        except requests.exceptions.ConnectionError:
+            raise self._connection_error(metric_name)
+
+        except Exception as exception:
+            raise self._exception_error(metric_name, exception)
+
+        return response_json
+
+    @staticmethod
+    def _get_content_length(response):
+        content = response.content
+        return len(content) if isinstance(content, bytes) else 0
+
+    @staticmethod
+    def _get_timing_breakdown(response, elapsed):
+        """
+        `connect` (DNS resolution and TCP connect) and `tls` are 0 on reused connections, `server` lasts until the
+        response headers are received and `read` is the remainder: reading and parsing the body, and throttling waits
+        """
+        breakdown = get_connection_timings()
+        until_headers = response.elapsed.total_seconds()
+        breakdown['server'] = max(until_headers - breakdown['connect'] - breakdown['tls'], 0)
+        breakdown['read'] = max(elapsed - until_headers, 0)
+        return breakdown
+
+    def _open_stream(self, http_method, url, payload, params, metric_name):
+        response = self._send(http_method, url, payload, params, metric_name, stream=True)
+        if response.status_code != self._get_expected_status(metric_name, http_method):
+            with response:
+                self._process_error_object(metric_name, response, get_codec().load_response(response))
+        return response
+
+    def _stream(self, http_method, endpoint, payload=None, params=None):
+        """
+        Generator of the items of a list endpoint, read lazily with at most a line or a page in memory:
+        NDJSON responses are parsed line by line, JSON responses page by page, following the pagination
+        token of each page. Bytes, items and pages read are reported as the `python_common_aws.stream` metric.
+        """
+        metric_name = self._get_generic_endpoint_for_metric(http_method, endpoint)
+        calling_url = f'{self.url}/{endpoint}'
+
+        codec = get_codec()
+        if payload:
+            payload = codec.dumps(payload)
+
+        counts = {'bytes': 0, 'items': 0, 'pages': 0}
+        stream_format = 'json'
+        try:
+            while True:
+                response = self._open_stream(http_method, calling_url, payload, params, metric_name)
+                counts['pages'] += 1
+
+                with response:
+                    if self._is_ndjson(response.headers.get('Content-Type')):
+                        stream_format = 'ndjson'
+                        for line in response.iter_lines(chunk_size=STREAM_CHUNK_SIZE):
+                            counts['bytes'] += len(line) + 1
+                            if line.strip():
+                                counts['items'] += 1
+                                yield codec.loads(line)
+                        return
+
+                    content = response.content
+                    counts['bytes'] += len(content)
+                    page = codec.loads(content)
+
+                for item in self._get_page_items(page):
+                    counts['items'] += 1
+                    yield item
+
+                params = self._get_next_page_params(params, page)
+                if params is None:
+                    return
+
+        except AWSIoTError:
+            raise
+
+        except requests.exceptions.ConnectionError:
+            raise self._connection_error(metric_name)
+
+        except Exception as exception:
+            raise self._exception_error(metric_name, exception)
+
+        finally:
+            self._log_stream(metric_name, stream_format, counts)
+
+    def _call_many(self, calls, metric_name):
+        """
+        Run `calls`, a dict of {key: (http_method, endpoint, payload)}, concurrently with at most `bulk_concurrency`
+        requests in flight, and return a dict of {key: response json}. A failed call does not abort the others,
+        its AWSIoTError is returned in place of its response.
+        """
+        results = {}
+        if not calls:
+            return results
+
+        with TimingMetric('python_common_aws.call', tags={'method': metric_name, 'size': len(calls)}) as timer:
+            with ThreadPoolExecutor(max_workers=min(self.bulk_concurrency, len(calls))) as executor:
+                futures = {key: executor.submit(self._call, *call) for key, call in calls.items()}
+
+                for key, future in futures.items():
+                    try:
+                        results[key] = future.result()
+                    except AWSIoTError as aws_error:
+                        results[key] = aws_error
+
+            self._log_bulk_results(timer, metric_name, results)
+
+        return results
+
+
+class AsyncAWSClient(BaseAWSClient):
+    """
+    asyncio counterpart of AWSClient (requires `aiohttp` to be installed), with the same endpoints, errors and
+    metrics; its methods are coroutines. Requests are signed with the same CachedBotoAWSRequestsAuth as the
+    sync client and go through the session shared on the event loop for `service_name`, see get_async_session.
+    """
+
+    def __init__(self, session=None):
+        if import_aiohttp() is None:
+            raise ImportError('AsyncAWSClient requires the aiohttp package')
+        self._session = session
+
+    @property
+    def session(self):
+        return self._session or get_async_session(self.service_name)
+
+    async def _send(self, http_method, url, payload, params, metric_name):
+        # Installed along with aiohttp
+        import yarl  # pylint: disable=import-outside-toplevel
+
+        request = requests.Request(http_method.upper(), url, data=payload, params=params,
+                                   headers={'content-type': 'application/json'}).prepare()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            rate_limiter = self.rate_limiter
+            if rate_limiter:
+                self._log_rate_limit_wait(metric_name, await rate_limiter.acquire_async())
+
+            # Signed again on every attempt, the signature covers the request time
+            await self.get_auth().sign_async(request)
+
+            # The url was encoded while preparing the request and signed as such, it must be sent unchanged
+            async with self.session.request(request.method, yarl.URL(request.url, encoded=True), data=request.body,
+                                            headers=dict(request.headers)) as response:
+                content = await response.read()
+
+            if response.status != status.HTTP_429_TOO_MANY_REQUESTS:
+                return response.status, content
+
+            delay = self._get_throttle_delay(metric_name, attempt, response.headers.get('Retry-After'))
+            if delay is None:
+                return response.status, content
+            await asyncio.sleep(delay)
+
+    async def _call(self, http_method, endpoint, payload=None, params=None):
+        metric_name = self._get_generic_endpoint_for_metric(http_method, endpoint)
+        calling_url = f'{self.url}/{endpoint}'
+
+        codec = get_codec()
+        if payload:
+            payload = codec.dumps(payload)
+
+        try:
+
+            with TimingMetric('python_common_aws.call', tags={'method': metric_name}) as timer:
+                expected_status = self._get_expected_status(metric_name, http_method)
+
+                status_code, content = await self._send(http_method, calling_url, payload, params, metric_name)
+                response_json = codec.loads(content)
+                # Connections are managed by aiohttp, only the totals are known
+                self._observe_call(metric_name, timer.elapsed, status_code, len(payload or b''), len(content), dict)
+
+                if status_code != expected_status:
+                    self._process_error_object(metric_name, SimpleNamespace(status_code=status_code), response_json)
+
+                LOG.info('aws_client(%s) duration: %.3f', metric_name, timer.elapsed)
+
+        except import_aiohttp().ClientConnectionError:
+            raise self._connection_error(metric_name)
+
+        except Exception as exception:
+            raise self._exception_error(metric_name, exception)
+
+        return response_json
+
+    async def _call_many(self, calls, metric_name):
+        """
+        Run `calls` concurrently with at most `bulk_concurrency` requests in flight, see AWSClient._call_many
+        """
+        results = {}
+        if not calls:
+            return results
+
+        semaphore = asyncio.Semaphore(self.bulk_concurrency)
+
+        async def bounded_call(call):
+            async with semaphore:
+                return await self._call(*call)
+
+        with TimingMetric('python_common_aws.call', tags={'method': metric_name, 'size': len(calls)}) as timer:
+            responses = await asyncio.gather(*[bounded_call(call) for call in calls.values()], return_exceptions=True)
+
+            for key, response in zip(calls, responses):
+                if isinstance(response, Exception) and not isinstance(response, AWSIoTError):
+                    raise response
+                results[key] = response
+
+            self._log_bulk_results(timer, metric_name, results)
+
+        return results
+
+
+class BaseURLShortenerClient(BaseAWSClient):
+    url = classproperty(lambda cls: settings.URL_SHORTENER_URL)
+    aws_host = classproperty(lambda cls: settings.URL_SHORTENER_HOST)
+    service_name = 'url_shortener'
+    metric_prefix = 'urlshortener'
+
+    # Endpoint the long urls are POSTed to. It is specific to the deployed URL shortener API: subclasses using
+    # shorten and shorten_many define it, along with _build_shorten_payload and _parse_short_url.
+    SHORTEN_ENDPOINT = None
+
+    # Short urls are cached by long url in the 'url_shortener' TwoTierCache, see settings.TWO_TIER_CACHES
+    short_url_ttl = 24 * 60 * 60
+
+    @property
+    def short_url_cache(self):
+        return get_two_tier_cache(self.service_name)
+
+    @staticmethod
+    def _short_url_key(long_url):
+        return hashlib.sha256(long_url.encode()).hexdigest()
+
+    def _get_shorten_endpoint(self):
+        if self.SHORTEN_ENDPOINT is None:
+            raise NotImplementedError(f'{type(self).__name__} does not define SHORTEN_ENDPOINT')
+        return self.SHORTEN_ENDPOINT
+
+    def _build_shorten_payload(self, long_url):
+        """
+        Request body asking the URL shortener API to shorten `long_url`
+        """
+        raise NotImplementedError
+
+    def _parse_short_url(self, response_json):
+        """
+        Short url in a response of the URL shortener API, raising KeyError or TypeError when it has none
+        """
+        raise NotImplementedError
+
+    def _get_cached_short_url(self, long_url):
+        """
+        Cached short url, or MISSING. Hits and misses are reported as the `python_common_aws.cache` metric.
+        """
+        short_url, tier = self.short_url_cache.get(self._short_url_key(long_url))
+        if tier is None:
+            log_metric('python_common_aws.cache', tags={'method': 'urlshortener::shorten', 'result': 'miss'})
+            return MISSING
+
+        log_metric('python_common_aws.cache', tags={'method': 'urlshortener::shorten', 'result': 'hit', 'tier': tier})
+        return short_url
+
+    def _cache_short_url(self, long_url, response_json):
+        try:
+            short_url = self._parse_short_url(response_json)
+        except (KeyError, TypeError):
+            log_metric('python_common_aws.error', tags={'method': 'urlshortener::shorten', 'code': 'InvalidResponse'})
+            LOG.error('aws_client(%s) error: %s', 'urlshortener::shorten', 'Invalid response')
+            raise AWSIoTError(f'Invalid URL Shortener response: {response_json}')
+
+        self.short_url_cache.set(self._short_url_key(long_url), short_url, self.short_url_ttl)
+        return short_url
+
+    def _split_cached_short_urls(self, long_urls):
+        """
+        Returns ({long_url: short_url} for the distinct `long_urls`, cache hits filled in and misses set to MISSING,
+        the calls shortening the misses)
+        """
+        shorten_endpoint = self._get_shorten_endpoint()
+        short_urls = {long_url: self._get_cached_short_url(long_url) for long_url in dict.fromkeys(long_urls)}
+        calls = {
+            long_url: (self.METHOD_POST, shorten_endpoint, self._build_shorten_payload(long_url))
+            for long_url, short_url in short_urls.items() if short_url is MISSING
+        }
+        return short_urls, calls
+
+    def _merge_shortened(self, short_urls, responses):
+        for long_url, response in responses.items():
+            try:
+                short_urls[long_url] = response if isinstance(response, AWSIoTError) else \
+                    self._cache_short_url(long_url, response)
+            except AWSIoTError as aws_error:
+                short_urls[long_url] = aws_error
+        return short_urls
+
+
+class URLShortenerClient(BaseURLShortenerClient, AWSClient):
+    def shorten(self, long_url):
+        shorten_endpoint = self._get_shorten_endpoint()
+        short_url = self._get_cached_short_url(long_url)
+        if short_url is MISSING:
+            response = self._post(shorten_endpoint, self._build_shorten_payload(long_url))
+            short_url = self._cache_short_url(long_url, response)
+        return short_url
+
+    def shorten_many(self, long_urls):
+        """
+        Shorten several urls, each distinct url once, and the ones not found in the cache concurrently.
+        Returns {long_url: short_url}, with an AWSIoTError for urls that failed.
+        """
+        short_urls, calls = self._split_cached_short_urls(long_urls)
+        return self._merge_shortened(short_urls, self._call_many(calls, 'urlshortener::bulk::shorten'))
+
+
+class AsyncURLShortenerClient(BaseURLShortenerClient, AsyncAWSClient):
+
+    async def shorten(self, long_url):
+        shorten_endpoint = self._get_shorten_endpoint()
+        short_url = self._get_cached_short_url(long_url)
+        if short_url is MISSING:
+            response = await self._post(shorten_endpoint, self._build_shorten_payload(long_url))
+            short_url = self._cache_short_url(long_url, response)
+        return short_url
+
+    async def shorten_many(self, long_urls):
+        """
+        Shorten several urls, see URLShortenerClient.shorten_many
+        """
+        short_urls, calls = self._split_cached_short_urls(long_urls)
+        return self._merge_shortened(short_urls, await self._call_many(calls, 'urlshortener::bulk::shorten'))
@@ -0,0 +1,159 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Returned on a cache miss, so that falsy values (None, [], ...) can be cached too
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread safe in-process cache bounded by entry count, evicting the least recently used entry.
+    Entries expire after their own `ttl` (seconds, None for no expiry).
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TwoTierCache:
+    """
+    An in-process LRUCache in front of the Django cache. Values found in the shared tier are copied
+    into the local one, for at most `local_ttl` seconds so that entries deleted or changed by other
+    processes are not served for long. Keys are namespaced with `name`.
+    Lookups are counted by tier in `local_hits`, `shared_hits` and `misses`.
+    """
+
+    def __init__(self, name, maxsize=1024, local_ttl=60):
+        self.name = name
+        self.local_ttl = local_ttl
+        self.local = LRUCache(maxsize)
+        self.shared_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def local_hits(self):
+        return self.local.hits
+
+    def _shared_key(self, key):
+        return f'{self.name}:{key}'
+
+    def _local_ttl(self, ttl):
+        if ttl is None:
+            return self.local_ttl
+        if self.local_ttl is None:
+            return ttl
+        return min(ttl, self.local_ttl)
+
+    def get(self, key, default=MISSING, ttl=None):
+        """
+        Returns (value, tier) where tier is 'local', 'shared' or None on a miss.
+        Values found in the shared tier are kept locally for at most `ttl` seconds, when known.
+        """
+        value = self.local.get(key)
+        if value is not MISSING:
+            return value, 'local'
+
+        value = cache.get(self._shared_key(key), MISSING)
+        if value is not MISSING:
+            self.local.set(key, value, self._local_ttl(ttl))
+            with self._lock:
+                self.shared_hits += 1
+            return value, 'shared'
+
+        with self._lock:
+            self.misses += 1
+        return default, None
+
+    def set(self, key, value, ttl=None):
+        self.local.set(key, value, self._local_ttl(ttl))
+        cache.set(self._shared_key(key), value, ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        cache.delete(self._shared_key(key))
+
+
+def get_or_create(registry, lock, name, factory):
+    """
+    registry[name], set to factory() on first use. Process wide objects configured from settings are kept in such
+    registries: existing entries (None included) are read without taking the lock, only their creation takes it.
+    """
+    try:
+        return registry[name]
+    except KeyError:
+        pass
+
+    with lock:
+        if name not in registry:
+            registry[name] = factory()
+        return registry[name]
+
+
+CACHES = {}
+CACHES_LOCK = threading.Lock()
+
+
+def get_two_tier_cache(name):
+    """
+    Process wide TwoTierCache, configured on first use from settings.TWO_TIER_CACHES[name]
+    (kwargs of TwoTierCache)
+    """
+    return get_or_create(CACHES, CACHES_LOCK, name, lambda: TwoTierCache(
+        name, **getattr(settings, 'TWO_TIER_CACHES', {}).get(name, {})))
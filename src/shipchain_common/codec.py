@@ -0,0 +1,144 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import decimal
+import json
+
+from django.conf import settings
+
+from .utils import DecimalEncoder, DECIMAL_AS_FLOAT, DECIMAL_AS_STRING
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+
+class JSONCodec:
+    """
+    Serialization of request payloads and parsing of response bodies for the service clients, using the stdlib.
+    Decimals are encoded by DecimalEncoder in the given mode: 'float', or lossless 'string' or 'number'.
+    """
+
+    name = 'json'
+
+    def __init__(self, decimal_mode=DECIMAL_AS_FLOAT):
+        self.decimal_mode = decimal_mode
+
+    def dumps(self, obj):
+        return json.dumps(obj, cls=DecimalEncoder, decimal_mode=self.decimal_mode)
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def load_response(self, response):
+        """
+        Parse a requests Response straight from its raw bytes, skipping the charset detection
+        and intermediate str copy of `response.json()`
+        """
+        content = response.content
+        if not isinstance(content, bytes):
+            # Not a real response body (e.g. a mocked response), let the response parse itself
+            return response.json()
+        return self.loads(content)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    orjson is limited to 64 bit integers, while wei amounts routinely exceed them: payloads holding larger
+    integers are encoded by the stdlib instead. Parsing stays with the stdlib too, as orjson silently turns
+    larger integers into floats, unless `fast_loads` is set for services known to return no such integers.
+    """
+
+    name = 'orjson'
+
+    def __init__(self, decimal_mode=DECIMAL_AS_FLOAT, fast_loads=False):
+        super().__init__(decimal_mode)
+        self.fast_loads = fast_loads
+
+    def _default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return str(obj) if self.decimal_mode == DECIMAL_AS_STRING else float(obj)
+        raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+    def dumps(self, obj):
+        if self.decimal_mode not in (DECIMAL_AS_FLOAT, DECIMAL_AS_STRING):
+            # orjson cannot emit raw numbers for Decimals
+            return super().dumps(obj)
+        try:
+            return orjson.dumps(obj, default=self._default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Integers beyond 64 bits, which the stdlib encodes exactly
+            return super().dumps(obj)
+
+    def loads(self, data):
+        if not self.fast_loads:
+            return super().loads(data)
+        return orjson.loads(data)
+
+
+class UjsonCodec(JSONCodec):
+    name = 'ujson'
+
+    def dumps(self, obj):
+        if self.decimal_mode != DECIMAL_AS_FLOAT:
+            # ujson encodes Decimals natively as floats, without consulting `default`
+            return super().dumps(obj)
+        return ujson.dumps(obj, ensure_ascii=False)
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+CODECS = {
+    JSONCodec.name: (JSONCodec, True),
+    OrjsonCodec.name: (OrjsonCodec, orjson is not None),
+    UjsonCodec.name: (UjsonCodec, ujson is not None),
+}
+
+CODEC_INSTANCES = {}
+
+
+def get_codec():
+    """
+    Codec selected by settings.JSON_CODEC ('json', 'orjson', 'ujson' or 'auto') and settings.JSON_DECIMAL_MODE.
+    'json', the default, uses the stdlib; the faster libraries are opt-in, and 'auto' picks the fastest installed one.
+    settings.JSON_ORJSON_LOADS also parses responses with orjson, only safe if they hold no integers beyond 64 bits.
+    """
+    backend = getattr(settings, 'JSON_CODEC', JSONCodec.name)
+    decimal_mode = getattr(settings, 'JSON_DECIMAL_MODE', DECIMAL_AS_FLOAT)
+    orjson_loads = getattr(settings, 'JSON_ORJSON_LOADS', False)
+
+    cache_key = (backend, decimal_mode, orjson_loads)
+    if cache_key not in CODEC_INSTANCES:
+        if backend == 'auto':
+            backend = next(name for name in (OrjsonCodec.name, UjsonCodec.name, JSONCodec.name) if CODECS[name][1])
+
+        codec_class, available = CODECS.get(backend, (None, False))
+        if not available:
+            raise ImportError(f'JSON_CODEC {backend} is not available')
+
+        if codec_class is OrjsonCodec:
+            CODEC_INSTANCES[cache_key] = codec_class(decimal_mode, fast_loads=orjson_loads)
+        else:
+            CODEC_INSTANCES[cache_key] = codec_class(decimal_mode)
+
+    return CODEC_INSTANCES[cache_key]
@@ -0,0 +1,117 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import threading
+
+from influxdb_metrics.loader import log_metric
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self, done=None):
+        self.done = done
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls from different threads: while a call for a key is in flight, further
+    calls with the same key wait for it and receive its result or exception instead of running again.
+    Calls that joined an in-flight call are reported as the `<name>.coalesced` metric.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _report(self, tags):
+        self.coalesced += 1
+        log_metric(f'{self.name}.coalesced', tags={**(tags or {}), 'module': __name__})
+
+    def do(self, key, func, tags=None):
+        """
+        Returns (result, shared); shared is True when the result was handed to more than one caller,
+        in which case it must not be mutated.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(threading.Event())
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            self._report(tags)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = func()
+        except BaseException as exception:
+            flight.error = exception
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result, flight.waiters > 0
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight, coalescing calls from tasks of a single event loop.
+    The call runs in its own task, so cancelling the caller that started it does not affect the others.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.coalesced = 0
+        self._flights = {}
+
+    def _report(self, tags):
+        self.coalesced += 1
+        log_metric(f'{self.name}.coalesced', tags={**(tags or {}), 'module': __name__})
+
+    def _finish(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key, coroutine_func, tags=None):
+        """
+        Returns (result, shared), see SingleFlight.do. `coroutine_func` is called without arguments.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(coroutine_func()))
+            flight.done.add_done_callback(lambda _: self._finish(key, flight))
+            leader = True
+        else:
+            flight.waiters += 1
+            self._report(tags)
+            leader = False
+
+        result = await asyncio.shield(flight.done)
+        return result, not leader or flight.waiters > 0
@@ -15,12 +15,64 @@ limitations under the License.
 """
 
 import threading
+import weakref
 
 from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
 from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
 
-CURRENT_THREAD = threading.current_thread()
+# State of the request being processed by the current thread: its TokenContext, and the organization and user ids
+# read by the logging filters
+CURRENT_THREAD = threading.local()
+
+
+class TokenContext:
+    """
+    The bearer token of a request, decoded once and shared by UserOrganizationMiddleware, the authentication
+    classes and the logging filters. `validated_token` is None when the token was decoded without verification.
+    The request is only weakly referenced, a context left on the thread does not keep it alive.
+    """
+
+    __slots__ = ('_request', 'raw_token', 'validated_token', 'user', 'organization_id', 'user_id')
+
+    def __init__(self, request, raw_token, user, validated_token=None):
+        self._request = weakref.ref(request)
+        self.raw_token = raw_token
+        self.validated_token = validated_token
+        self.user = user
+        self.organization_id = user.token.payload.get('organization_id')
+        self.user_id = user.id
+
+    @property
+    def request(self):
+        return self._request()
+
+    @property
+    def verified(self):
+        return self.validated_token is not None
+
+
+def get_token_context(request=None):
+    """
+    TokenContext of the current thread's request, None if its token has not been decoded.
+    With `request` (a Django HttpRequest or a DRF Request), None unless the context belongs to that request.
+    """
+    context = getattr(CURRENT_THREAD, 'token_context', None)
+    if context is not None and request is not None and context.request is not getattr(request, '_request', request):
+        return None
+    return context
+
+
+def set_token_context(request, raw_token, user, validated_token=None):
+    context = TokenContext(getattr(request, '_request', request), raw_token, user, validated_token)
+    CURRENT_THREAD.token_context = context
+    return context
+
+
+def clear_token_context():
+    CURRENT_THREAD.token_context = None
+    CURRENT_THREAD.organization_id = None
+    CURRENT_THREAD.user_id = None
 
 
 class UserOrganizationMiddleware(MiddlewareMixin):
@@ -29,7 +81,7 @@ class UserOrganizationMiddleware(MiddlewareMixin):
         # We put this import here to avoid circular imports during app init
         from ..authentication import PASSIVE_JWT_AUTHENTICATION, passive_credentials_auth
 
-        user_id, org_id = None, None
+        clear_token_context()
         header = PASSIVE_JWT_AUTHENTICATION.get_header(request)
 
         if header:
@@ -41,14 +93,18 @@ class UserOrganizationMiddleware(MiddlewareMixin):
                     # We use UntypedToken with verify False here to avoid
                     # unhandled exception to be thrown to the client
                     token_user = PASSIVE_JWT_AUTHENTICATION.get_user(UntypedToken(raw_token, verify=False))
+                    context = set_token_context(request, raw_token, token_user)
                 else:
                     token_user = passive_credentials_auth(raw_token)
+                    context = set_token_context(request, raw_token, token_user, token_user.token)
 
-                org_id = token_user.token.payload.get('organization_id')
-                user_id = token_user.id
+                # Only set by the middleware, which clears them once the response is done
+                CURRENT_THREAD.organization_id = context.organization_id
+                CURRENT_THREAD.user_id = context.user_id
             except (InvalidToken, AuthenticationFailed):
                 # Provided token is expired or invalid
                 pass
 
-        setattr(CURRENT_THREAD, 'organization_id', org_id)
-        setattr(CURRENT_THREAD, 'user_id', user_id)
+    def process_response(self, request, response):
+        clear_token_context()
+        return response
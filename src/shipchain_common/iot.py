@@ -17,31 +17,77 @@ limitations under the License.
 import logging
 import re
 
-import requests
-from aws_requests_auth.boto_utils import BotoAWSRequestsAuth
 from django.conf import settings
 
-from .aws import AWSClient
+from .aws import AsyncAWSClient, AWSClient, BaseAWSClient
+from .utils import classproperty
 
 LOG = logging.getLogger('python-common')
 
+DEVICE_ID_PATTERN = re.compile(r'[0-9A-F]{8}-[0-9A-F]{4}-[4][0-9A-F]{3}-[89AB][0-9A-F]{3}-[0-9A-F]{12}', re.IGNORECASE)
 
-class AWSIoTClient(AWSClient):
-    url = f'https://{settings.IOT_AWS_HOST}/{settings.IOT_GATEWAY_STAGE}'
-    session = requests.session()
 
-    def __init__(self):
-        aws_auth = BotoAWSRequestsAuth(
-            aws_host=settings.IOT_AWS_HOST,
-            aws_region='us-east-1',
-            aws_service='execute-api'
-        )
+class BaseAWSIoTClient(BaseAWSClient):
+    url = classproperty(lambda cls: f'https://{settings.IOT_AWS_HOST}/{settings.IOT_GATEWAY_STAGE}')
+    aws_host = classproperty(lambda cls: settings.IOT_AWS_HOST)
+    service_name = 'aws_iot'
 
-        self.session.headers = {'content-type': 'application/json'}
-        self.session.auth = aws_auth
+    DEVICES_ENDPOINT = 'devices'
+    DEVICE_ENDPOINT = 'devices/{device_id}'
+    DEVICE_SHADOW_ENDPOINT = 'devices/{device_id}/shadow'
 
-    def _get_generic_endpoint_for_metric(self, http_method, endpoint):
-        generic_endpoint = re.sub(r'[0-9A-F]{8}-[0-9A-F]{4}-[4][0-9A-F]{3}-[89AB][0-9A-F]{3}-[0-9A-F]{12}',
-                                  '<device_id>', endpoint, flags=re.IGNORECASE)
+    metric_prefix = 'iot'
+    # Device ids are uuids: other segments (e.g. 'devices/search') keep their own metric names
+    route_templates = (
+        'devices',
+        'devices/<uuid:device_id>',
+        'devices/<uuid:device_id>/shadow',
+    )
 
-        return f'iot::{http_method}::{generic_endpoint}'
+    def get_devices(self, device_ids):
+        """
+        Fetch several devices concurrently. Returns {device_id: device}, with an AWSIoTError for devices that failed.
+        """
+        return self._call_many({
+            device_id: (self.METHOD_GET, self.DEVICE_ENDPOINT.format(device_id=device_id), None)
+            for device_id in device_ids
+        }, 'iot::bulk::get_devices')
+
+    def put_device_shadows(self, shadows):
+        """
+        Update the shadows of several devices concurrently, `shadows` being {device_id: shadow}.
+        Returns {device_id: response}, with an AWSIoTError for devices that failed.
+        """
+        return self._call_many({
+            device_id: (self.METHOD_PUT, self.DEVICE_SHADOW_ENDPOINT.format(device_id=device_id), shadow)
+            for device_id, shadow in shadows.items()
+        }, 'iot::bulk::put_device_shadows')
+
+    def delete_devices(self, device_ids):
+        """
+        Delete several devices concurrently. Returns {device_id: response}, with an AWSIoTError for devices that failed.
+        """
+        return self._call_many({
+            device_id: (self.METHOD_DELETE, self.DEVICE_ENDPOINT.format(device_id=device_id), None)
+            for device_id in device_ids
+        }, 'iot::bulk::delete_devices')
+
+    @classmethod
+    def _get_unmatched_generic_endpoint(cls, endpoint):
+        # Device ids found in undeclared endpoints are still replaced, to keep the metric cardinality bounded
+        return DEVICE_ID_PATTERN.sub('<device_id>', endpoint)
+
+
+class AWSIoTClient(BaseAWSIoTClient, AWSClient):
+
+    def iter_devices(self, query_params=None):
+        """
+        Lazily iterate over all the devices, following the pages of the device list
+        """
+        return self._stream(self.METHOD_GET, self.DEVICES_ENDPOINT, params=query_params)
+
+
+class AsyncAWSIoTClient(BaseAWSIoTClient, AsyncAWSClient):
+    """
+    asyncio counterpart of AWSIoTClient, its bulk operations are coroutines
+    """
@@ -0,0 +1,246 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import logging
+import threading
+import time
+
+import jwt
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.translation import gettext_lazy as _
+from influxdb_metrics.loader import log_metric
+from jwt import InvalidAlgorithmError, InvalidTokenError
+from jwt.algorithms import RSAAlgorithm
+from jwt.exceptions import InvalidKeyError
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from .caching import get_or_create
+from .transport import get_session, get_timeout
+
+LOG = logging.getLogger('python-common')
+
+# Parsers of the JWK key types usable to verify the algorithms supported by simplejwt
+JWK_PARSERS = {
+    'RSA': RSAAlgorithm.from_jwk,
+}
+
+
+def parse_jwks(document):
+    """
+    {kid: public key object} of the signing keys of a JWKS document.
+    Keys without a kid, not used for signatures, of an unsupported type or invalid are skipped.
+    """
+    keys = {}
+    for jwk in document['keys']:
+        kid = jwk.get('kid')
+        parser = JWK_PARSERS.get(jwk.get('kty'))
+        if not kid or not parser or jwk.get('use', 'sig') != 'sig' or 'd' in jwk:
+            LOG.warning('jwks skipping key: %s (%s)', kid, jwk.get('kty'))
+            continue
+
+        try:
+            keys[kid] = parser(json.dumps(jwk))
+        except (InvalidKeyError, KeyError, ValueError) as exc:
+            LOG.warning('jwks skipping invalid key %s: %s', kid, exc)
+    return keys
+
+
+class JWKSKeySet:
+    """
+    Verifying keys of the JWKS document at `url` (or in the file at `path`), indexed by kid and parsed once per load.
+
+    Keys older than `refresh_interval` seconds keep being served while a background thread reloads them
+    (stale while revalidate). A kid missing from the keys triggers a reload, at most once every
+    `min_refresh_interval` seconds, so that tokens signed with a new key are accepted as soon as it is published.
+    Keys that could not be reloaded for `max_stale` seconds are not used anymore.
+    Reloads are reported as the `python_common_auth.jwks_refresh` metric.
+    """
+
+    def __init__(self, name, url=None, path=None, refresh_interval=3600, min_refresh_interval=30, max_stale=86400):
+        if not url and not path:
+            raise ImproperlyConfigured(f'JWKS key set {name} needs either a url or a path')
+
+        self.name = name
+        self.url = url
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.max_stale = max_stale
+
+        self._keys = {}
+        self._loaded_at = None
+        self._attempted_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _load(self):
+        if self.path:
+            with open(self.path) as jwks_file:
+                return json.load(jwks_file)
+
+        response = get_session('jwks').get(self.url, timeout=get_timeout('jwks'))
+        response.raise_for_status()
+        return response.json()
+
+    def refresh(self, if_attempted_before=None):
+        """
+        Reload the keys, unless another reload was attempted since `if_attempted_before` (monotonic time).
+        Returns whether the keys are loaded.
+        """
+        with self._refresh_lock:
+            if if_attempted_before is not None and self._attempted_at is not None \
+                    and self._attempted_at >= if_attempted_before:
+                return self._loaded_at is not None
+
+            self._attempted_at = time.monotonic()
+            try:
+                keys = parse_jwks(self._load())
+            except (OSError, ValueError, TypeError, KeyError) as exc:
+                LOG.error('jwks(%s) refresh error: %s', self.name, exc)
+                log_metric('python_common_auth.jwks_refresh', tags={'key_set': self.name, 'result': 'error'})
+                return self._loaded_at is not None
+
+            self._keys, self._loaded_at = keys, time.monotonic()
+
+        LOG.info('jwks(%s) refreshed: %s', self.name, list(keys))
+        log_metric('python_common_auth.jwks_refresh', tags={'key_set': self.name, 'result': 'success'},
+                   fields={'keys': len(keys)})
+        return True
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name=f'jwks-{self.name}', daemon=True).start()
+
+    def get_key(self, kid):
+        """
+        Public key object for the kid, None if the key set has no such (usable) key
+        """
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at > self.max_stale:
+            self.refresh(if_attempted_before=now - self.min_refresh_interval)
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_stale:
+                return None
+        elif now - self._loaded_at > self.refresh_interval:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and kid:
+            # Possibly signed with a key published since the last load
+            self.refresh(if_attempted_before=now - self.min_refresh_interval)
+            key = self._keys.get(kid)
+        return key
+
+
+JWKS_KEY_SETS = {}
+JWKS_LOCK = threading.Lock()
+JWKS_TOKEN_BACKENDS = {}
+# Backends get their key set while being created, which takes JWKS_LOCK
+JWKS_TOKEN_BACKENDS_LOCK = threading.Lock()
+
+
+def get_jwks_key_set(name):
+    """
+    Process wide JWKSKeySet, configured on first use from settings.JWKS_KEY_SETS[name] (kwargs of JWKSKeySet)
+    """
+    def build():
+        config = getattr(settings, 'JWKS_KEY_SETS', {}).get(name)
+        if config is None:
+            raise ImproperlyConfigured(f'JWKS key set {name} is not configured in JWKS_KEY_SETS')
+        return JWKSKeySet(name, **config)
+
+    return get_or_create(JWKS_KEY_SETS, JWKS_LOCK, name, build)
+
+
+class JWKSTokenBackend(TokenBackend):
+    """
+    TokenBackend verifying tokens with the key of their `kid` header in a JWKSKeySet,
+    instead of the static SIMPLE_JWT['VERIFYING_KEY']
+    """
+
+    def __init__(self, key_set, algorithm='RS256', audience=None, issuer=None):
+        super().__init__(algorithm, audience=audience, issuer=issuer)
+        self.key_set = key_set
+
+    def decode(self, token, verify=True):
+        if not verify:
+            return super().decode(token, verify=False)
+
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+        except InvalidTokenError:
+            raise TokenBackendError(_('Token is invalid or expired'))
+
+        verifying_key = self.key_set.get_key(kid)
+        if verifying_key is None:
+            raise TokenBackendError(_('Token is invalid or expired'))
+
+        try:
+            return jwt.decode(token, verifying_key, algorithms=[self.algorithm], audience=self.audience,
+                              issuer=self.issuer, options={'verify_aud': self.audience is not None})
+        except InvalidAlgorithmError as ex:
+            raise TokenBackendError(_('Invalid algorithm specified')) from ex
+        except InvalidTokenError:
+            raise TokenBackendError(_('Token is invalid or expired'))
+
+
+def get_jwks_token_backend(name):
+    """
+    Process wide JWKSTokenBackend for the named key set, with the SIMPLE_JWT algorithm, audience and issuer
+    """
+    return get_or_create(JWKS_TOKEN_BACKENDS, JWKS_TOKEN_BACKENDS_LOCK, name, lambda: JWKSTokenBackend(
+        get_jwks_key_set(name), api_settings.ALGORITHM, api_settings.AUDIENCE, api_settings.ISSUER))
+
+
+class JWKSUntypedToken(UntypedToken):
+    """
+    UntypedToken verified against the 'oidc' JWKS key set, see settings.JWKS_KEY_SETS.
+    Use it in SIMPLE_JWT['AUTH_TOKEN_CLASSES'] to rotate the signing key without a redeploy.
+    """
+
+    key_set_name = 'oidc'
+
+    def __init__(self, token=None, verify=True):
+        if token is None:
+            super().__init__(token, verify)
+            return
+
+        # Token.__init__, decoding with the JWKS backend instead of simplejwt's static key one
+        self.token = token
+        self.current_time = aware_utcnow()
+        try:
+            self.payload = get_jwks_token_backend(self.key_set_name).decode(token, verify=verify)
+        except TokenBackendError:
+            raise TokenError(_('Token is invalid or expired'))
+
+        if verify:
+            self.verify()
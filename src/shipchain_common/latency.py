@@ -0,0 +1,180 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import bisect
+import logging
+import random
+import threading
+
+from django.conf import settings
+from influxdb_metrics.loader import log_metric
+
+from .caching import get_or_create
+
+LOG = logging.getLogger('python-common')
+
+# Upper bounds in seconds of the histogram buckets, an implicit last bucket holds everything slower
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class LatencyHistogram:
+    """
+    Thread safe count of durations by fixed bucket, along with their total count and sum
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += seconds
+
+    def snapshot(self, reset=False):
+        """
+        Returns {'buckets': {upper bound: cumulative count}, 'count': count, 'sum': sum}, the last
+        upper bound being float('inf'). With `reset`, recording starts over.
+        """
+        with self._lock:
+            counts, count, total = list(self._counts), self._count, self._sum
+            if reset:
+                self._counts = [0] * len(self._counts)
+                self._count = 0
+                self._sum = 0
+
+        cumulative, buckets = 0, {}
+        for upper_bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            buckets[upper_bound] = cumulative
+        return {'buckets': buckets, 'count': count, 'sum': total}
+
+    def quantile(self, quantile):
+        """
+        Estimate of the given quantile (0 to 1), interpolated within its bucket. None if nothing was recorded.
+        Durations beyond the last bucket are reported as its upper bound.
+        """
+        buckets = self.snapshot()['buckets']
+        count = buckets[float('inf')]
+        if not count:
+            return None
+
+        rank = quantile * count
+        lower_bound, below = 0, 0
+        for upper_bound, cumulative in buckets.items():
+            if cumulative >= rank:
+                if upper_bound == float('inf'):
+                    return lower_bound
+                in_bucket = cumulative - below
+                return lower_bound + (upper_bound - lower_bound) * (rank - below) / in_bucket
+            lower_bound, below = upper_bound, cumulative
+        return lower_bound
+
+
+class LatencyHistograms:
+    """
+    LatencyHistogram per key (e.g. per endpoint metric name), created on first record.
+    Histograms are either scraped with snapshot() or periodically sent to influx with flush().
+    """
+
+    def __init__(self, name, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram(self.buckets))
+        return histogram
+
+    def record(self, key, seconds):
+        self[key].record(seconds)
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {key: histogram.snapshot(reset) for key, histogram in histograms.items()}
+
+    def flush(self):
+        """
+        Log every histogram recorded since the last flush as a `<name>.latency` metric, with a field
+        `le_<upper bound>` per bucket holding the cumulative count of durations up to that bound
+        """
+        for key, snapshot in self.snapshot(reset=True).items():
+            if not snapshot['count']:
+                continue
+            fields = {f'le_{upper_bound:g}': count for upper_bound, count in snapshot['buckets'].items()}
+            fields.update(count=snapshot['count'], sum=snapshot['sum'])
+            log_metric(f'{self.name}.latency', tags={'method': key, 'module': __name__}, fields=fields)
+
+
+class SlowCallSampler:
+    """
+    Picks the calls worth logging in detail: a fraction `sample_rate` of the calls slower than `threshold` seconds
+    """
+
+    def __init__(self, threshold=1.0, sample_rate=1.0):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+
+    def should_sample(self, seconds):
+        if seconds < self.threshold:
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate  # nosec #B311 - not used for security
+
+
+LATENCY_HISTOGRAMS = {}
+SLOW_CALL_SAMPLERS = {}
+LATENCY_LOCK = threading.Lock()
+
+
+def get_latency_histograms(name):
+    """
+    Process wide LatencyHistograms, configured on first use from settings.LATENCY_HISTOGRAMS[name]
+    (kwargs of LatencyHistograms)
+    """
+    return get_or_create(LATENCY_HISTOGRAMS, LATENCY_LOCK, name, lambda: LatencyHistograms(
+        name, **getattr(settings, 'LATENCY_HISTOGRAMS', {}).get(name, {})))
+
+
+def flush_latency_histograms():
+    """
+    Flush all the process' histograms, meant to be called periodically (e.g. from a scheduled task)
+    """
+    with LATENCY_LOCK:
+        histograms = list(LATENCY_HISTOGRAMS.values())
+    for service_histograms in histograms:
+        service_histograms.flush()
+
+
+def get_slow_call_sampler(name):
+    """
+    Process wide SlowCallSampler for the named service, configured on first use from
+    settings.SLOW_CALL_SAMPLING[name] (kwargs of SlowCallSampler). None if slow calls are not sampled.
+    """
+    def build():
+        config = getattr(settings, 'SLOW_CALL_SAMPLING', {}).get(name)
+        return SlowCallSampler(**config) if config is not None else None
+
+    return get_or_create(SLOW_CALL_SAMPLERS, LATENCY_LOCK, name, build)
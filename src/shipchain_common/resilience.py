@@ -0,0 +1,293 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import datetime
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from influxdb_metrics.loader import log_metric
+
+from .caching import get_or_create
+
+LOG = logging.getLogger('python-common')
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised by CircuitBreaker.before_call while the circuit is open.
+    """
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter. Only attach a policy to calls that are safe to repeat.
+    `max_attempts` includes the first attempt.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.1, max_delay=2.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, attempt):
+        return attempt < self.max_attempts
+
+    def get_delay(self, attempt):
+        """
+        Seconds to wait after the given (1-based) failed attempt
+        """
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)  # nosec #B311 - jitter, not used for security
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of the last `window_size` calls to a service. Once at least `minimum_calls`
+    have been recorded and the failure rate reaches `failure_threshold`, the circuit opens and calls
+    fail fast for `reset_timeout` seconds. A single trial call is then let through (half open):
+    success closes the circuit, failure opens it again.
+    State changes are reported as the `<name>.circuit_breaker` metric.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=0.5, window_size=50, minimum_calls=20, reset_timeout=30,
+                 enabled=True):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.minimum_calls = minimum_calls
+        self.reset_timeout = reset_timeout
+        self.enabled = enabled
+
+        self._outcomes = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        return self._state
+
+    def _transition(self, state):
+        # Must be called with the lock held; returns the state to report once the lock is released
+        self._state = state
+        self._trial_in_flight = False
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+        else:
+            self._outcomes.clear()
+        return state
+
+    def _report(self, state):
+        if state:
+            LOG.warning('circuit_breaker(%s) state: %s', self.name, state)
+            log_metric(f'{self.name}.circuit_breaker', tags={'state': state, 'module': __name__})
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError if the call should not be attempted.
+        Every call allowed through must be followed by record_success or record_failure.
+        """
+        if not self.enabled:
+            return
+
+        changed = None
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError(self.name)
+                changed = self._transition(self.HALF_OPEN)
+
+            if self._state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    raise CircuitOpenError(self.name)
+                self._trial_in_flight = True
+
+        self._report(changed)
+
+    def record_success(self):
+        if not self.enabled:
+            return
+
+        changed = None
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                changed = self._transition(self.CLOSED)
+            self._outcomes.append(True)
+
+        self._report(changed)
+
+    def record_failure(self):
+        if not self.enabled:
+            return
+
+        changed = None
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                changed = self._transition(self.OPEN)
+            elif self._state == self.CLOSED:
+                self._outcomes.append(False)
+                if len(self._outcomes) >= self.minimum_calls:
+                    failure_rate = self._outcomes.count(False) / len(self._outcomes)
+                    if failure_rate >= self.failure_threshold:
+                        changed = self._transition(self.OPEN)
+
+        self._report(changed)
+
+    def reset(self):
+        with self._lock:
+            self._transition(self.CLOSED)
+
+
+CIRCUIT_BREAKERS = {}
+CIRCUIT_BREAKERS_LOCK = threading.Lock()
+
+
+def get_circuit_breaker(name):
+    """
+    Process wide CircuitBreaker for the named service,
+    configured on first use from settings.CIRCUIT_BREAKERS[name] (kwargs of CircuitBreaker)
+    """
+    return get_or_create(CIRCUIT_BREAKERS, CIRCUIT_BREAKERS_LOCK, name, lambda: CircuitBreaker(
+        name, **getattr(settings, 'CIRCUIT_BREAKERS', {}).get(name, {})))
+
+
+def parse_retry_after(value):
+    """
+    Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date. None if invalid.
+    """
+    try:
+        return max(float(value), 0)
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_at is None:
+        return None
+    return max((retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
+
+
+class TokenBucket:
+    """
+    Rate limiter allowing `rate` calls per second on average, in bursts of up to `burst` calls.
+    Callers over the limit wait their turn: acquire() blocks (or acquire_async() sleeps) and returns the
+    seconds spent waiting.
+
+    With `shared`, the limit applies to all the processes using the same Django cache. It is then enforced
+    as `burst` calls per window of burst / rate seconds, counted in the cache.
+    """
+
+    def __init__(self, name, rate, burst=None, shared=False):
+        self.name = name
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.shared = shared
+
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+        self._window = self.burst / self.rate
+
+    def _reserve(self):
+        """
+        Take a token. Returns (seconds to wait, whether the token is reserved once they have elapsed)
+        """
+        if self.shared:
+            return self._reserve_shared()
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+            # Tokens can go negative: callers queue up for the tokens yet to come
+            self._tokens -= 1
+            return max(0, -self._tokens / self.rate), True
+
+    def _reserve_shared(self):
+        now = time.time()
+        window = int(now // self._window)
+        key = f'rate_limit:{self.name}:{window}'
+
+        cache.add(key, 0, timeout=math.ceil(self._window) + 1)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # The window's counter expired in between, try again
+            return 0, False
+
+        if count <= self.burst:
+            return 0, True
+
+        # Jittered, so that the processes waiting for the next window don't all try at once
+        wait = (window + 1) * self._window - now
+        return wait + random.uniform(0, self._window / self.burst), False  # nosec #B311 - not used for security
+
+    def acquire(self):
+        waited = 0
+        while True:
+            wait, reserved = self._reserve()
+            if wait:
+                time.sleep(wait)
+                waited += wait
+            if reserved:
+                return waited
+
+    async def acquire_async(self):
+        loop = asyncio.get_event_loop()
+        waited = 0
+        while True:
+            if self.shared:
+                # The Django cache is blocking
+                wait, reserved = await loop.run_in_executor(None, self._reserve)
+            else:
+                wait, reserved = self._reserve()
+            if wait:
+                await asyncio.sleep(wait)
+                waited += wait
+            if reserved:
+                return waited
+
+
+RATE_LIMITERS = {}
+RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(name):
+    """
+    Process wide TokenBucket for the named service, configured on first use from settings.RATE_LIMITS[name]
+    (kwargs of TokenBucket). None if the service is not rate limited.
+    """
+    def build():
+        config = getattr(settings, 'RATE_LIMITS', {}).get(name)
+        return TokenBucket(name, **config) if config else None
+
+    return get_or_create(RATE_LIMITERS, RATE_LIMITERS_LOCK, name, build)
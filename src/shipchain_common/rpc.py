@@ -14,100 +14,657 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import asyncio
+import copy
+import hashlib
+import itertools
 import json
 import logging
+import threading
+import time
+import weakref
+from collections import namedtuple
 
 import requests
 from django.conf import settings
 from rest_framework import status
 from influxdb_metrics.loader import log_metric, TimingMetric
 
+from .caching import MISSING, get_two_tier_cache
+from .codec import get_codec
+from .concurrency import AsyncSingleFlight, SingleFlight
 from .exceptions import RPCError
-from .utils import DecimalEncoder
+from .resilience import CircuitOpenError, get_circuit_breaker
+from .transport import PooledHTTPAdapter, get_async_session, get_session, get_timeout, \
+    import_aiohttp, mount_pooled_adapter
+from .utils import DecimalEncoder, DECIMAL_AS_STRING
 
 LOG = logging.getLogger('python-common')
 
+# Shared by the RPCClients of the process, so that identical calls from different threads are coalesced
+ENGINE_RPC_CALLS = SingleFlight('engine_rpc')
+
+
+class RPCRequest(namedtuple('RPCRequest', ['id', 'method', 'params'])):
+    """
+    Immutable JSON-RPC 2.0 request envelope, built once per call.
+    """
+    __slots__ = ()
+
+    def as_payload(self):
+        return {"jsonrpc": "2.0", "id": self.id, "method": self.method, "params": self.params}
+
+
+class BaseRPCClient:
+    """
+    Transport agnostic parts of the Engine RPC clients: request building,
+    response processing and the mapping of failures to RPCError and engine_rpc metrics.
+
+    Clients hold no per-call state. Every call gets its own RPCRequest with a request id that is unique
+    for the instance, and the id of Engine's response is checked against it. A single instance can
+    therefore be shared by any number of threads (or asyncio tasks) at once.
+
+    All clients in the process share the `engine_rpc` CircuitBreaker, and calls to the methods listed in
+    `retry_policies` are retried on connection errors and 502/503/504 responses.
+
+    Results of the methods listed in `cache_ttls` are cached in the process wide `engine_rpc`
+    TwoTierCache (an in-process LRU in front of the Django cache), keyed by method and params.
+    Batched calls always go to Engine.
+
+    Concurrent identical calls (same method and params) to the methods in `single_flight_methods` share
+    a single request to Engine, and all receive its result or error.
+    """
+
+    # Disable to accept responses that do not echo the request id, e.g. static mocks in tests
+    verify_response_id = True
+
+    # RetryPolicy by Engine method. Only list idempotent methods, e.g. {'wallet.balance': RetryPolicy()}
+    retry_policies = {}
+
+    # Cache TTL in seconds by Engine method. Only list pure reads, e.g. {'wallet.balance': 5}
+    cache_ttls = {}
+
+    # Engine methods whose concurrent identical calls are coalesced. Only list reads, e.g. {'wallet.balance'}
+    single_flight_methods = frozenset()
+
+    RETRYABLE_STATUS_CODES = (status.HTTP_502_BAD_GATEWAY, status.HTTP_503_SERVICE_UNAVAILABLE,
+                              status.HTTP_504_GATEWAY_TIMEOUT)
 
-class RPCClient:
     def __init__(self):
         self.url = settings.ENGINE_RPC_URL
-        self.payload = {"jsonrpc": "2.0", "id": 0, "params": {}}
+        self._request_ids = itertools.count()
+        self._request_id_lock = threading.Lock()
+
+    def _next_request_id(self):
+        with self._request_id_lock:
+            return next(self._request_ids)
+
+    @property
+    def circuit_breaker(self):
+        return get_circuit_breaker('engine_rpc')
+
+    @property
+    def response_cache(self):
+        return get_two_tier_cache('engine_rpc')
+
+    @staticmethod
+    def _request_key(method, args):
+        # Canonical params: key order and Decimal formatting do not change the key
+        params = json.dumps(args or {}, sort_keys=True, separators=(',', ':'), cls=DecimalEncoder,
+                            decimal_mode=DECIMAL_AS_STRING)
+        return f'{method}:{hashlib.sha256(params.encode()).hexdigest()}'
+
+    def _get_cached(self, method, args):
+        """
+        Cached result of a call, or MISSING. Hits and misses are reported as the `engine_rpc.cache` metric.
+        """
+        if method not in self.cache_ttls:
+            return MISSING
+
+        result, tier = self.response_cache.get(self._request_key(method, args), ttl=self.cache_ttls[method])
+        if tier is None:
+            log_metric('engine_rpc.cache', tags={'method': method, 'result': 'miss', 'module': __name__})
+            return MISSING
+
+        log_metric('engine_rpc.cache', tags={'method': method, 'result': 'hit', 'tier': tier, 'module': __name__})
+        # Callers get their own copy, the cached result must not be mutated
+        return copy.deepcopy(result)
+
+    def _set_cached(self, method, args, result):
+        if method in self.cache_ttls:
+            self.response_cache.set(self._request_key(method, args), copy.deepcopy(result), self.cache_ttls[method])
+
+    def invalidate_cache(self, method, args=None):
+        """
+        Drop the cached result of a call, e.g. after a write that changes it. Other processes may still
+        serve it from their in-process tier for up to the cache's `local_ttl`.
+        """
+        self.response_cache.delete(self._request_key(method, args))
+
+    def _single_flight_key(self, method, args):
+        return self.url, self._request_key(method, args)
+
+    @staticmethod
+    def _own_result(result, shared):
+        # A result handed to several coalesced callers is copied, so that they can't alter each other's
+        return copy.deepcopy(result) if shared else result
+
+    def _get_retry_policy(self, methods):
+        """
+        A batch is only retried when every one of its methods may be, using the most restrictive policy
+        """
+        policies = [self.retry_policies.get(method) for method in methods]
+        if not policies or None in policies:
+            return None
+        return min(policies, key=lambda policy: policy.max_attempts)
+
+    @staticmethod
+    def _should_retry(retry_policy, attempt, metric_method, reason):
+        if not retry_policy or not retry_policy.should_retry(attempt):
+            return False
+
+        LOG.warning('rpc_client(%s) retrying after %s on attempt %d', metric_method, reason, attempt)
+        log_metric('engine_rpc.retry', tags={'method': metric_method, 'reason': reason, 'attempt': attempt,
+                                             'module': __name__})
+        return True
+
+    def _record_response_status(self, status_code):
+        """
+        Feed a response status to the circuit breaker. Returns whether the request is worth retrying.
+        """
+        if status.is_server_error(status_code):
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+        return status_code in self.RETRYABLE_STATUS_CODES
+
+    @staticmethod
+    def _get_timeout():
+        # (connect, read) from settings.HTTP_TRANSPORT['engine_rpc'], read defaulting to settings.REQUESTS_TIMEOUT
+        return get_timeout('engine_rpc')
+
+    @staticmethod
+    def _serialize(payload):
+        return get_codec().dumps(payload)
+
+    @staticmethod
+    def _process_http_error(metric_method, status_code, content):
+        # It's an unexpected error not handled by engine
+        log_metric('engine_rpc.error', tags={'method': metric_method, 'code': status_code, 'module': __name__})
+        LOG.error('rpc_client(%s) error: %s', metric_method, content)
+        raise RPCError(content)
+
+    @staticmethod
+    def _connection_error(metric_method, code='ConnectionError'):
+        # Don't return the true ConnectionError as it can contain internal URLs
+        log_metric('engine_rpc.error', tags={'method': metric_method, 'code': code, 'module': __name__})
+        return RPCError("Service temporarily unavailable, try again later",
+                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE, code='service_unavailable')
+
+    @staticmethod
+    def _exception_error(metric_method, exception):
+        log_metric('engine_rpc.error', tags={'method': metric_method, 'code': 'Exception', 'module': __name__})
+        return RPCError(str(exception))
+
+    @staticmethod
+    def _process_engine_error(method, error):
+        # It's an error properly handled by engine
+        log_metric('engine_rpc.error', tags={'method': method, 'code': error['code'], 'module': __name__})
+        LOG.error('rpc_client(%s) error: %s', method, error)
+        raise RPCError(error['message'])
+
+    def _process_response_object(self, rpc_request, response_json):
+        if 'error' in response_json:
+            self._process_engine_error(rpc_request.method, response_json['error'])
+
+        if self.verify_response_id and response_json.get('id') != rpc_request.id:
+            log_metric('engine_rpc.error', tags={'method': rpc_request.method, 'code': 'InvalidResponseId',
+                                                 'module': __name__})
+            LOG.error('rpc_client(%s) error: response id %s does not match request id %s',
+                      rpc_request.method, response_json.get('id'), rpc_request.id)
+            raise RPCError("Invalid response from Engine")
+
+        return response_json['result']
+
+    def _build_request(self, method, args):
+        if args and not isinstance(args, object):
+            raise RPCError("Invalid parameter type for Engine RPC call")
+
+        return RPCRequest(self._next_request_id(), method, args or {})
+
+    @staticmethod
+    def _log_batch_timing(rpc_requests, elapsed):
+        # Each item of the batch is still recorded individually against the shared round trip
+        for rpc_request in rpc_requests:
+            log_metric('engine_rpc.call', fields={'count': 1, 'value': elapsed},
+                       tags={'method': rpc_request.method, 'batch': True})
+
+    def _process_batch_response(self, rpc_requests, response_json, raise_on_error):
+        if not isinstance(response_json, list):
+            if isinstance(response_json, dict) and 'error' in response_json:
+                # Engine rejected the batch as a whole (e.g. an invalid request object)
+                self._process_engine_error('batch', response_json['error'])
+            raise RPCError("Invalid response from Engine")
+
+        responses_by_id = {item.get('id'): item for item in response_json}
+
+        results = []
+        for rpc_request in rpc_requests:
+            try:
+                if rpc_request.id not in responses_by_id:
+                    log_metric('engine_rpc.error', tags={'method': rpc_request.method, 'code': 'MissingResponse',
+                                                         'module': __name__})
+                    raise RPCError("Invalid response from Engine")
+                results.append(self._process_response_object(rpc_request, responses_by_id[rpc_request.id]))
+            except RPCError as rpc_error:
+                results.append(rpc_error)
+
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, RPCError):
+                    raise result
+
+        return results
+
+    @staticmethod
+    def _build_sign_params(wallet_id, transaction):
+        return {
+            "signerWallet": wallet_id,
+            "txUnsigned": transaction
+        }
+
+    @staticmethod
+    def _build_send_params(signed_transaction, callback_url):
+        return {
+            "callbackUrl": callback_url,
+            "txSigned": signed_transaction
+        }
+
+    @staticmethod
+    def _process_sign_result(result):
+        if 'success' in result and result['success']:
+            if 'transaction' in result:
+                LOG.debug('Successful signing of transaction.')
+                return result['transaction'], result['hash']
+
+        log_metric('engine_rpc.error', tags={'method': 'RPCClient.sign_transaction', 'module': __name__})
+        raise RPCError("Invalid response from Engine")
+
+    @staticmethod
+    def _process_send_result(result):
+        if 'success' in result and result['success']:
+            if 'receipt' in result:
+                LOG.debug('Successful sending of transaction.')
+                return result['receipt']
+
+        log_metric('engine_rpc.error', tags={'method': 'RPCClient.send_transaction', 'module': __name__})
+        raise RPCError("Invalid response from Engine")
+
+    @staticmethod
+    def _process_batch_results(results, processor, raise_on_error):
+        processed = []
+        for result in results:
+            if not isinstance(result, RPCError):
+                try:
+                    result = processor(result)
+                except RPCError as rpc_error:
+                    if raise_on_error:
+                        raise
+                    result = rpc_error
+            processed.append(result)
+        return processed
+
+
+class RPCClient(BaseRPCClient):
+    @property
+    def session(self):
+        requests_session = getattr(settings, 'REQUESTS_SESSION', None)
+        if requests_session is None:
+            return get_session('engine_rpc')
+
+        # Deprecated: settings.REQUESTS_SESSION keeps its configuration and gets the engine_rpc pooled transport
+        if not isinstance(requests_session.adapters.get('https://'), PooledHTTPAdapter):
+            LOG.warning('rpc_client settings.REQUESTS_SESSION is deprecated, configure the engine_rpc transport '
+                        'through settings.HTTP_TRANSPORT instead')
+        return mount_pooled_adapter('engine_rpc', requests_session)
+
+    def _post(self, payload, metric_method, retry_policy=None):
+        """
+        POST a JSON-RPC payload (single request or batch) to Engine and return the decoded body.
+        Non-2xx responses are raised as RPCError.
+        """
+        data = self._serialize(payload)
+        attempt = 0
+
+        while True:
+            attempt += 1
+            self.circuit_breaker.before_call()
+
+            try:
+                response = self.session.post(self.url, data=data, timeout=self._get_timeout())
+            except Exception as exception:
+                self.circuit_breaker.record_failure()
+                if isinstance(exception, requests.exceptions.ConnectionError) and \
+                        self._should_retry(retry_policy, attempt, metric_method, 'ConnectionError'):
+                    time.sleep(retry_policy.get_delay(attempt))
+                    continue
+                raise
+
+            if self._record_response_status(response.status_code) and \
+                    self._should_retry(retry_policy, attempt, metric_method, response.status_code):
+                time.sleep(retry_policy.get_delay(attempt))
+                continue
+
+            break
+
+        if not status.is_success(response.status_code):
+            self._process_http_error(metric_method, response.status_code, response.content)
+
+        return get_codec().load_response(response)
 
     def call(self, method, args=None):
         LOG.debug('Calling RPCClient with method %s', method)
         log_metric('python_common.info', tags={'method': 'RPCClient.call', 'module': __name__})
 
-        if args and not isinstance(args, object):
-            raise RPCError("Invalid parameter type for Engine RPC call")
+        result = self._get_cached(method, args)
+        if result is not MISSING:
+            return result
 
-        self.payload['method'] = method
-        self.payload['params'] = args or {}
+        if method in self.single_flight_methods:
+            return self._own_result(*ENGINE_RPC_CALLS.do(self._single_flight_key(method, args),
+                                                         lambda: self._call(method, args), tags={'method': method}))
+
+        return self._call(method, args)
+
+    def _call(self, method, args):
+        rpc_request = self._build_request(method, args)
 
         try:
             with TimingMetric('engine_rpc.call', tags={'method': method}) as timer:
-                response = settings.REQUESTS_SESSION.post(self.url, data=json.dumps(self.payload, cls=DecimalEncoder),
-                                                          timeout=getattr(settings, 'REQUESTS_TIMEOUT', 270))
+                response_json = self._post(rpc_request.as_payload(), method, self._get_retry_policy([method]))
 
                 LOG.info('rpc_client(%s) duration: %.3f', method, timer.elapsed)
 
-            if status.is_success(response.status_code):
-                response_json = response.json()
+            result = self._process_response_object(rpc_request, response_json)
 
-                if 'error' in response_json:
-                    # It's an error properly handled by engine
-                    log_metric('engine_rpc.error', tags={'method': method, 'code': response_json['error']['code'],
-                                                         'module': __name__})
-                    LOG.error('rpc_client(%s) error: %s', method, response_json['error'])
-                    raise RPCError(response_json['error']['message'])
-            else:
-                # It's an unexpected error not handled by engine
-                log_metric('engine_rpc.error', tags={'method': method, 'code': response.status_code,
-                                                     'module': __name__})
-                LOG.error('rpc_client(%s) error: %s', method, response.content)
-                raise RPCError(response.content)
+        except CircuitOpenError:
+            raise self._connection_error(method, code='CircuitOpen')
 
         except requests.exceptions.ConnectionError:
-            # Don't return the true ConnectionError as it can contain internal URLs
-            log_metric('engine_rpc.error', tags={'method': method, 'code': 'ConnectionError', 'module': __name__})
-            raise RPCError("Service temporarily unavailable, try again later",
-                           status_code=status.HTTP_503_SERVICE_UNAVAILABLE, code='service_unavailable')
+            raise self._connection_error(method)
 
         except Exception as exception:
-            log_metric('engine_rpc.error', tags={'method': method, 'code': 'Exception', 'module': __name__})
-            raise RPCError(str(exception))
+            raise self._exception_error(method, exception)
 
-        return response_json['result']
+        self._set_cached(method, args, result)
+        return result
+
+    def call_batch(self, calls, raise_on_error=True):
+        """
+        Send several calls to Engine in a single JSON-RPC 2.0 batch request.
+        `calls` is an iterable of (method, args) tuples; results are returned in the same order.
+        Responses are matched back to their request by `id`, as Engine is free to reorder them.
+        If raise_on_error is False, a failed item is returned as an RPCError instance instead of raising.
+        """
+        calls = list(calls)
+        if not calls:
+            return []
+
+        LOG.debug('Calling RPCClient with batch of %d methods', len(calls))
+        log_metric('python_common.info', tags={'method': 'RPCClient.call_batch', 'module': __name__})
+
+        rpc_requests = [self._build_request(method, args) for method, args in calls]
+
+        try:
+            with TimingMetric('engine_rpc.call_batch', tags={'size': len(calls)}) as timer:
+                try:
+                    response_json = self._post([rpc_request.as_payload() for rpc_request in rpc_requests],
+                                               'batch', self._get_retry_policy([method for method, _ in calls]))
+                finally:
+                    self._log_batch_timing(rpc_requests, timer.elapsed)
+
+                LOG.info('rpc_client(batch[%d]) duration: %.3f', len(calls), timer.elapsed)
+
+            return self._process_batch_response(rpc_requests, response_json, raise_on_error)
+
+        except RPCError:
+            raise
+
+        except CircuitOpenError:
+            raise self._connection_error('batch', code='CircuitOpen')
+
+        except requests.exceptions.ConnectionError:
+            raise self._connection_error('batch')
+
+        except Exception as exception:
+            raise self._exception_error('batch', exception)
 
     def sign_transaction(self, wallet_id, transaction):
         LOG.debug('Signing transaction %s with wallet_id %s.', transaction, wallet_id)
         log_metric('python_common.info', tags={'method': 'RPCClient.sign_transaction', 'module': __name__})
 
-        result = self.call('transaction.sign', {
-            "signerWallet": wallet_id,
-            "txUnsigned": transaction
-        })
+        result = self.call('transaction.sign', self._build_sign_params(wallet_id, transaction))
 
-        if 'success' in result and result['success']:
-            if 'transaction' in result:
-                LOG.debug('Successful signing of transaction.')
-                return result['transaction'], result['hash']
+        return self._process_sign_result(result)
 
-        log_metric('engine_rpc.error', tags={'method': 'RPCClient.sign_transaction', 'module': __name__})
-        raise RPCError("Invalid response from Engine")
+    def sign_transactions(self, transactions, raise_on_error=True):
+        """
+        Batch variant of sign_transaction. `transactions` is an iterable of (wallet_id, transaction) tuples
+        and a list of (signed_transaction, hash) tuples is returned in the same order.
+        """
+        LOG.debug('Signing batch of transactions.')
+        log_metric('python_common.info', tags={'method': 'RPCClient.sign_transactions', 'module': __name__})
+
+        results = self.call_batch([('transaction.sign', self._build_sign_params(wallet_id, transaction))
+                                   for wallet_id, transaction in transactions], raise_on_error=raise_on_error)
+
+        return self._process_batch_results(results, self._process_sign_result, raise_on_error)
 
     def send_transaction(self, signed_transaction, callback_url):
         LOG.debug('Sending transaction %s with callback_url %s.', signed_transaction, callback_url)
         log_metric('python_common.info', tags={'method': 'RPCClient.send_transaction', 'module': __name__})
 
-        result = self.call('transaction.send', {
-            "callbackUrl": callback_url,
-            "txSigned": signed_transaction
-        })
+        result = self.call('transaction.send', self._build_send_params(signed_transaction, callback_url))
 
-        if 'success' in result and result['success']:
-            if 'receipt' in result:
-                LOG.debug('Successful sending of transaction.')
-                return result['receipt']
+        return self._process_send_result(result)
 
-        log_metric('engine_rpc.error', tags={'method': 'RPCClient.sign_transaction', 'module': __name__})
-        raise RPCError("Invalid response from Engine")
+    def send_transactions(self, signed_transactions, raise_on_error=True):
+        """
+        Batch variant of send_transaction. `signed_transactions` is an iterable of
+        (signed_transaction, callback_url) tuples and a list of receipts is returned in the same order.
+        """
+        LOG.debug('Sending batch of transactions.')
+        log_metric('python_common.info', tags={'method': 'RPCClient.send_transactions', 'module': __name__})
+
+        results = self.call_batch([('transaction.send', self._build_send_params(signed_transaction, callback_url))
+                                   for signed_transaction, callback_url in signed_transactions],
+                                  raise_on_error=raise_on_error)
+
+        return self._process_batch_results(results, self._process_send_result, raise_on_error)
+
+
+class AsyncRPCClient(BaseRPCClient):
+    """
+    asyncio counterpart of RPCClient (requires `aiohttp` to be installed).
+    Errors and metrics match RPCClient; at most `concurrency` requests to Engine are in flight at once per event loop.
+
+    An instance can be used from several event loops in turn (e.g. a module level client in tasks that each run
+    their own loop): requests go through the 'engine_rpc' session shared on the current loop, see get_async_session,
+    and the concurrency limit and coalesced calls are tracked per loop. A `session` passed in is used as is,
+    which ties the instance to that session's loop.
+    `close()` (or `async with`) only releases a session passed in: the shared sessions are still used by the other
+    clients of the loop, release them with close_async_sessions() before the loop is closed.
+    """
+
+    def __init__(self, concurrency=None, session=None):
+        if import_aiohttp() is None:
+            raise ImportError('AsyncRPCClient requires the aiohttp package')
+
+        super().__init__()
+        self.concurrency = concurrency or getattr(settings, 'ENGINE_RPC_CONCURRENCY', 32)
+        self._session = session
+        # {event loop: (Semaphore, AsyncSingleFlight)}, both being bound to the loop they are used from
+        self._loop_state = weakref.WeakKeyDictionary()
+
+    @property
+    def session(self):
+        return self._session or get_async_session('engine_rpc')
+
+    def _get_loop_state(self):
+        loop = asyncio.get_event_loop()
+        state = self._loop_state.get(loop)
+        if state is None:
+            state = self._loop_state[loop] = (asyncio.Semaphore(self.concurrency), AsyncSingleFlight('engine_rpc'))
+        return state
+
+    @property
+    def semaphore(self):
+        return self._get_loop_state()[0]
+
+    @property
+    def _single_flight(self):
+        return self._get_loop_state()[1]
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _post(self, payload, metric_method, retry_policy=None):
+        data = self._serialize(payload)
+        attempt = 0
+
+        while True:
+            attempt += 1
+            self.circuit_breaker.before_call()
+
+            try:
+                async with self.semaphore:
+                    async with self.session.post(self.url, data=data,
+                                                 headers={'content-type': 'application/json'}) as response:
+                        content = await response.read()
+            except Exception as exception:
+                self.circuit_breaker.record_failure()
+                if isinstance(exception, import_aiohttp().ClientConnectionError) and \
+                        self._should_retry(retry_policy, attempt, metric_method, 'ConnectionError'):
+                    await asyncio.sleep(retry_policy.get_delay(attempt))
+                    continue
+                raise
+
+            if self._record_response_status(response.status) and \
+                    self._should_retry(retry_policy, attempt, metric_method, response.status):
+                await asyncio.sleep(retry_policy.get_delay(attempt))
+                continue
+
+            break
+
+        if not status.is_success(response.status):
+            self._process_http_error(metric_method, response.status, content)
+
+        return get_codec().loads(content)
+
+    async def call(self, method, args=None):
+        LOG.debug('Calling AsyncRPCClient with method %s', method)
+        log_metric('python_common.info', tags={'method': 'AsyncRPCClient.call', 'module': __name__})
+
+        result = self._get_cached(method, args)
+        if result is not MISSING:
+            return result
+
+        if method in self.single_flight_methods:
+            return self._own_result(*await self._single_flight.do(self._single_flight_key(method, args),
+                                                                  lambda: self._call(method, args),
+                                                                  tags={'method': method}))
+
+        return await self._call(method, args)
+
+    async def _call(self, method, args):
+        rpc_request = self._build_request(method, args)
+
+        try:
+            with TimingMetric('engine_rpc.call', tags={'method': method}) as timer:
+                response_json = await self._post(rpc_request.as_payload(), method, self._get_retry_policy([method]))
+
+                LOG.info('rpc_client(%s) duration: %.3f', method, timer.elapsed)
+
+            result = self._process_response_object(rpc_request, response_json)
+
+        except CircuitOpenError:
+            raise self._connection_error(method, code='CircuitOpen')
+
+        except import_aiohttp().ClientConnectionError:
+            raise self._connection_error(method)
+
+        except Exception as exception:
+            raise self._exception_error(method, exception)
+
+        self._set_cached(method, args, result)
+        return result
+
+    async def call_batch(self, calls, raise_on_error=True):
+        """
+        Send several calls to Engine in a single JSON-RPC 2.0 batch request, see RPCClient.call_batch.
+        """
+        calls = list(calls)
+        if not calls:
+            return []
+
+        LOG.debug('Calling AsyncRPCClient with batch of %d methods', len(calls))
+        log_metric('python_common.info', tags={'method': 'AsyncRPCClient.call_batch', 'module': __name__})
+
+        rpc_requests = [self._build_request(method, args) for method, args in calls]
+
+        try:
+            with TimingMetric('engine_rpc.call_batch', tags={'size': len(calls)}) as timer:
+                try:
+                    response_json = await self._post([rpc_request.as_payload() for rpc_request in rpc_requests],
+                                                     'batch', self._get_retry_policy([method for method, _ in calls]))
+                finally:
+                    self._log_batch_timing(rpc_requests, timer.elapsed)
+
+                LOG.info('rpc_client(batch[%d]) duration: %.3f', len(calls), timer.elapsed)
+
+            return self._process_batch_response(rpc_requests, response_json, raise_on_error)
+
+        except RPCError:
+            raise
+
+        except CircuitOpenError:
+            raise self._connection_error('batch', code='CircuitOpen')
+
+        except import_aiohttp().ClientConnectionError:
+            raise self._connection_error('batch')
+
+        except Exception as exception:
+            raise self._exception_error('batch', exception)
+
+    async def gather(self, calls, return_exceptions=False):
+        """
+        Run several (method, args) calls concurrently, each as its own request, and return their results in order.
+        Concurrency is bounded by the client's `concurrency`; with return_exceptions=True failed
+        calls are returned as RPCError instances, as with asyncio.gather.
+        """
+        return await asyncio.gather(*[self.call(method, args) for method, args in calls],
+                                    return_exceptions=return_exceptions)
+
+    async def sign_transaction(self, wallet_id, transaction):
+        LOG.debug('Signing transaction %s with wallet_id %s.', transaction, wallet_id)
+        log_metric('python_common.info', tags={'method': 'AsyncRPCClient.sign_transaction', 'module': __name__})
+
+        result = await self.call('transaction.sign', self._build_sign_params(wallet_id, transaction))
+
+        return self._process_sign_result(result)
+
+    async def send_transaction(self, signed_transaction, callback_url):
+        LOG.debug('Sending transaction %s with callback_url %s.', signed_transaction, callback_url)
+        log_metric('python_common.info', tags={'method': 'AsyncRPCClient.send_transaction', 'module': __name__})
+
+        result = await self.call('transaction.send', self._build_send_params(signed_transaction, callback_url))
+
+        return self._process_send_result(result)
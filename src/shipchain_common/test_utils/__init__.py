@@ -29,13 +29,29 @@ from .helpers import\
 
 from .mocked_rpc_responses import \
     mocked_rpc_response, \
+    mocked_rpc_side_effect, \
+    rpc_echo, \
     mocked_wallet_error_creation,\
+    mocked_wallet_error_creation_side_effect, \
     mocked_wallet_invalid_creation, \
+    mocked_wallet_invalid_creation_side_effect, \
     mocked_wallet_valid_creation, \
+    mocked_wallet_valid_creation_side_effect, \
     second_mocked_wallet_valid_creation,\
+    second_mocked_wallet_valid_creation_side_effect, \
     invalid_eth_amount, \
+    invalid_eth_amount_side_effect, \
     invalid_ship_amount, \
-    valid_eth_amount
+    invalid_ship_amount_side_effect, \
+    valid_eth_amount, \
+    valid_eth_amount_side_effect
+
+from .rpc_server import \
+    EngineRPCServer, \
+    StandInServer
+
+from .aws_server import \
+    APIGatewayServer
 
 from .httpretty_asserter import \
     HTTPrettyAsserter, \
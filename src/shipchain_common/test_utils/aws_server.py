@@ -0,0 +1,147 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import hashlib
+import hmac
+import json
+import re
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from aws_requests_auth.aws_auth import AWSRequestsAuth, getSignatureKey
+
+from .rpc_server import StandInServer
+
+AUTHORIZATION_PATTERN = re.compile(
+    r'AWS4-HMAC-SHA256 Credential=(?P<access_key>[^/]+)/(?P<scope>[^,]+), '
+    r'SignedHeaders=(?P<signed_headers>[^,]+), Signature=(?P<signature>[0-9a-f]+)')
+
+# Requests signed longer ago than this are rejected, as by AWS
+MAX_CLOCK_SKEW = datetime.timedelta(minutes=5)
+
+
+def default_api_result(method, path, data):
+    return {'method': method, 'path': path, 'data': data}
+
+
+class APIGatewayServer(StandInServer):
+    """
+    Stand-in for an AWS API Gateway stage, rejecting requests that are not SigV4 signed for `aws_host`, `region` and
+    `service` with the given credentials (403). Signed requests then get, at random:
+      - a 429 with a `retry_after` Retry-After header, for a fraction `throttle_rate` of them
+      - a 404, for a fraction `client_error_rate`
+      - a success delayed by `slow_latency` seconds, for a fraction `slow_rate`
+      - `error_status` (a 5xx), for a fraction `error_rate`, and a `latency` delay for all, see StandInServer
+    Successes are a 201 for POST and a 200 otherwise, with the body built by `respond_ok`
+    (an echo of the request unless overridden).
+    Responses are counted by status in `status_counts`.
+    """
+
+    def __init__(self, aws_host, access_key, secret_key, region='us-east-1', service='execute-api',
+                 throttle_rate=0, retry_after=1, client_error_rate=0, slow_rate=0, slow_latency=1, **kwargs):
+        super().__init__(**kwargs)
+        self.aws_host = aws_host
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.service = service
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.client_error_rate = client_error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.status_counts = Counter()
+
+    def _get_signature_error(self, handler, body):
+        """
+        Message of the 403 for requests that are not correctly signed, None for the others
+        """
+        match = AUTHORIZATION_PATTERN.fullmatch(handler.headers.get('Authorization', ''))
+        if not match:
+            return 'Missing Authentication Token'
+
+        if match.group('access_key') != self.access_key:
+            return 'The security token included in the request is invalid.'
+
+        amzdate = handler.headers.get('x-amz-date', '')
+        try:
+            signed_at = datetime.datetime.strptime(amzdate, '%Y%m%dT%H%M%SZ')
+        except ValueError:
+            return 'Missing or invalid x-amz-date.'
+        if abs(datetime.datetime.utcnow() - signed_at) > MAX_CLOCK_SKEW:
+            return 'Signature expired.'
+
+        credential_scope = f'{amzdate[:8]}/{self.region}/{self.service}/aws4_request'
+        if match.group('scope') != credential_scope:
+            return f'Credential should be scoped to {credential_scope}.'
+
+        signed_headers = match.group('signed_headers')
+        # API Gateway sees its own host, the stand-in is reached through localhost instead
+        header_values = {'host': self.aws_host}
+        canonical_headers = ''.join(
+            f'{name}:{header_values.get(name, handler.headers.get(name, "")).strip()}\n'
+            for name in signed_headers.split(';'))
+
+        # Canonical path and query string as computed by the signing library, the url being the one requested
+        url = SimpleNamespace(url=f'https://{self.aws_host}{handler.path}')
+        canonical_request = '\n'.join((handler.command, AWSRequestsAuth.get_canonical_path(url),
+                                       AWSRequestsAuth.get_canonical_querystring(url), canonical_headers,
+                                       signed_headers, hashlib.sha256(body).hexdigest()))
+        string_to_sign = '\n'.join(('AWS4-HMAC-SHA256', amzdate, credential_scope,
+                                    hashlib.sha256(canonical_request.encode()).hexdigest()))
+        signing_key = getSignatureKey(self.secret_key, amzdate[:8], self.region, self.service)
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+        if not hmac.compare_digest(signature, match.group('signature')):
+            return 'The request signature we calculated does not match the signature you provided.'
+        return None
+
+    def handle(self, handler, body):
+        signature_error = self._get_signature_error(handler, body)
+        if signature_error:
+            with self._lock:
+                self.request_count += 1
+            response = 403, json.dumps({'message': signature_error}).encode()
+        else:
+            response = super().handle(handler, body)
+
+        with self._lock:
+            self.status_counts[response[0]] += 1
+        return response
+
+    def respond(self, handler, body):
+        with self._lock:
+            roll = self._random.random()
+
+        if roll < self.throttle_rate:
+            return 429, b'{"message": "Too Many Requests"}', {'Retry-After': str(self.retry_after)}
+        roll -= self.throttle_rate
+
+        if roll < self.client_error_rate:
+            return 404, b'{"message": "Not Found"}'
+        roll -= self.client_error_rate
+
+        if roll < self.slow_rate:
+            time.sleep(self.slow_latency)
+
+        data = json.loads(body) if body else None
+        result = self.respond_ok(handler.command, handler.path, data)
+        return 201 if handler.command == 'POST' else 200, json.dumps(result).encode()
+
+    def respond_ok(self, method, path, data):
+        return default_api_result(method, path, data)
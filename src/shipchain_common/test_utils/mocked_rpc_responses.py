@@ -14,6 +14,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import json as jsonlib
 from unittest.mock import Mock
 from requests.models import Response
 
@@ -26,6 +27,28 @@ def mocked_rpc_response(json, content=None, code=200):
     return response
 
 
+def rpc_echo(build_response, code=200):
+    """
+    side_effect for a mocked requests.Session.post; `build_response` builds the response json from the decoded
+    request payload, e.g. to echo its id as RPCClient requires
+    """
+    def side_effect(url, data=None, **kwargs):
+        return mocked_rpc_response(build_response(jsonlib.loads(data)), code=code)
+    return side_effect
+
+
+def mocked_rpc_side_effect(json, code=200):
+    """
+    side_effect for a mocked requests.Session.post answering every Engine call with `json`, under the id of the
+    request (or of each request of a batch)
+    """
+    def build_response(payload):
+        if isinstance(payload, list):
+            return [{**json, 'id': request['id']} for request in payload]
+        return {**json, 'id': payload['id']}
+    return rpc_echo(build_response, code=code)
+
+
 def invalid_eth_amount():
     return mocked_rpc_response({
         "jsonrpc": "2.0",
@@ -114,4 +137,33 @@ def valid_eth_amount():
             "ship": "1000000000000000000"
         },
         "id": 0
-    })
\ No newline at end of file
+    })
+
+
+# side_effect variants of the responses above, answering under the id of each request
+def invalid_eth_amount_side_effect():
+    return mocked_rpc_side_effect(invalid_eth_amount().json.return_value)
+
+
+def invalid_ship_amount_side_effect():
+    return mocked_rpc_side_effect(invalid_ship_amount().json.return_value)
+
+
+def mocked_wallet_valid_creation_side_effect():
+    return mocked_rpc_side_effect(mocked_wallet_valid_creation().json.return_value)
+
+
+def mocked_wallet_invalid_creation_side_effect():
+    return mocked_rpc_side_effect(mocked_wallet_invalid_creation().json.return_value)
+
+
+def mocked_wallet_error_creation_side_effect():
+    return mocked_rpc_side_effect(mocked_wallet_error_creation().json.return_value)
+
+
+def second_mocked_wallet_valid_creation_side_effect():
+    return mocked_rpc_side_effect(second_mocked_wallet_valid_creation().json.return_value)
+
+
+def valid_eth_amount_side_effect():
+    return mocked_rpc_side_effect(valid_eth_amount().json.return_value)
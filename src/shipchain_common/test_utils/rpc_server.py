@@ -0,0 +1,153 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer is only available from python 3.7
+    daemon_threads = True
+
+
+def default_rpc_result(method, params):
+    if method == 'transaction.sign':
+        return {'success': True, 'transaction': params.get('txUnsigned'),
+                'hash': '0x' + '0' * 64}
+    if method == 'transaction.send':
+        return {'success': True, 'receipt': {'transactionHash': '0x' + '0' * 64, 'status': True}}
+    return {'success': True, 'method': method, 'params': params}
+
+
+class StandInServer:
+    """
+    In-process HTTP server on a free localhost port, for exercising the service clients over real sockets.
+    Every request is delayed by `latency` seconds, and a fraction `error_rate` of them fail with `error_status`.
+    Subclasses implement `respond(handler, body)`, returning (status, response body) or
+    (status, response body, {header: value}).
+    """
+
+    def __init__(self, latency=0, error_rate=0, error_status=503, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.request_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def _build_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately, Nagle + delayed ACKs would add ~40ms to every response
+            disable_nagle_algorithm = True
+
+            def do_POST(self):  # noqa: N802 pylint: disable=invalid-name
+                self._handle()
+
+            def do_GET(self):  # noqa: N802 pylint: disable=invalid-name
+                self._handle()
+
+            def do_PUT(self):  # noqa: N802 pylint: disable=invalid-name
+                self._handle()
+
+            def do_DELETE(self):  # noqa: N802 pylint: disable=invalid-name
+                self._handle()
+
+            def _handle(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                status, content, *headers = server.handle(self, body)
+                headers = {'Content-Type': 'application/json', **(headers[0] if headers else {})}
+                self.send_response(status)
+                for header, value in headers.items():
+                    self.send_header(header, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def handle(self, handler, body):
+        with self._lock:
+            self.request_count += 1
+            fail = self.error_rate and self._random.random() < self.error_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            return self.error_status, b'{"message": "Service Unavailable"}'
+        return self.respond(handler, body)
+
+    def respond(self, handler, body):
+        raise NotImplementedError
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._build_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class EngineRPCServer(StandInServer):
+    """
+    Stand-in for Engine's JSON-RPC endpoint, answering single and batch requests.
+    Results are built by `handlers[method](params)`, falling back to default_rpc_result.
+    """
+
+    def __init__(self, handlers=None, **kwargs):
+        super().__init__(**kwargs)
+        self.handlers = handlers or {}
+
+    def _rpc_response(self, request):
+        method, params = request.get('method'), request.get('params') or {}
+        handler = self.handlers.get(method)
+        result = handler(params) if handler else default_rpc_result(method, params)
+        return {'jsonrpc': '2.0', 'result': result, 'id': request.get('id')}
+
+    def respond(self, handler, body):
+        payload = json.loads(body)
+        if isinstance(payload, list):
+            response = [self._rpc_response(request) for request in payload]
+        else:
+            response = self._rpc_response(payload)
+        return 200, json.dumps(response).encode()
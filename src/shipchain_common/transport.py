@@ -0,0 +1,279 @@
+"""
+Copyright 2020 ShipChain, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import logging
+import socket
+import threading
+import time
+import weakref
+
+import requests
+from django.conf import settings
+from influxdb_metrics.loader import log_metric
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from .caching import get_or_create
+
+LOG = logging.getLogger('python-common')
+
+
+def import_aiohttp():
+    """
+    The aiohttp module, or None if it is not installed. It is only imported once an async client is used,
+    importing it takes longer than importing the rest of this package.
+    """
+    try:
+        import aiohttp  # pylint: disable=import-outside-toplevel
+    except ImportError:  # pragma: no cover
+        return None
+    return aiohttp
+
+
+# Package defaults of specific services, applied over settings.HTTP_TRANSPORT['default']
+SERVICE_DEFAULTS = {
+    # Keys are fetched on the request thread on a cold start or an unknown kid, holding the requests queued behind
+    'jwks': {'connect_timeout': 2, 'read_timeout': 5},
+}
+
+
+def get_transport_config(service):
+    """
+    Transport settings for a service: the package defaults, overridden by settings.HTTP_TRANSPORT['default'],
+    the package defaults of the service (SERVICE_DEFAULTS) and then by settings.HTTP_TRANSPORT[service]
+    """
+    config = {
+        'pool_connections': 10,
+        'pool_maxsize': 50,
+        'pool_block': False,
+        'connect_retries': 1,
+        'connect_timeout': 5,
+        'read_timeout': getattr(settings, 'REQUESTS_TIMEOUT', 270),
+        'tcp_keepalive': True,
+    }
+    transport_settings = getattr(settings, 'HTTP_TRANSPORT', {})
+    config.update(transport_settings.get('default', {}))
+    config.update(SERVICE_DEFAULTS.get(service, {}))
+    config.update(transport_settings.get(service, {}))
+    return config
+
+
+def get_timeout(service):
+    """
+    (connect, read) timeout tuple for a service, as accepted by requests
+    """
+    config = get_transport_config(service)
+    return config['connect_timeout'], config['read_timeout']
+
+
+# Time the current thread spent opening connections since reset_connection_timings, see get_connection_timings
+CONNECTION_TIMINGS = threading.local()
+
+
+def reset_connection_timings():
+    CONNECTION_TIMINGS.connect = 0
+    CONNECTION_TIMINGS.setup = 0
+
+
+def get_connection_timings():
+    """
+    Seconds spent by the current thread resolving and connecting (`connect`) and in TLS handshakes (`tls`)
+    since reset_connection_timings. Both are 0 when pooled connections were reused.
+    """
+    connect = getattr(CONNECTION_TIMINGS, 'connect', 0)
+    return {'connect': connect, 'tls': max(getattr(CONNECTION_TIMINGS, 'setup', 0) - connect, 0)}
+
+
+class TimedConnectionMixin:
+    """
+    Adds the DNS resolution and TCP connect time (_new_conn), and the whole connection setup including
+    the TLS handshake (connect), to the current thread's CONNECTION_TIMINGS
+    """
+
+    def _new_conn(self):
+        started = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            CONNECTION_TIMINGS.connect = getattr(CONNECTION_TIMINGS, 'connect', 0) + time.perf_counter() - started
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            CONNECTION_TIMINGS.setup = getattr(CONNECTION_TIMINGS, 'setup', 0) + time.perf_counter() - started
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter applying a service's default timeouts and TCP keep-alive to its connections.
+    Requests started while `pool_maxsize` requests are already in flight are reported as the
+    `python_common.http_pool.exhausted` metric: they either block (pool_block) or use a connection
+    that is discarded afterwards instead of being reused.
+    Its connections record their setup time, see get_connection_timings.
+    """
+
+    def __init__(self, service, config):
+        self.service = service
+        self.timeout = (config['connect_timeout'], config['read_timeout'])
+        self.tcp_keepalive = config['tcp_keepalive']
+        self._pool_maxsize = config['pool_maxsize']
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+        super().__init__(
+            pool_connections=config['pool_connections'],
+            pool_maxsize=config['pool_maxsize'],
+            pool_block=config['pool_block'],
+            # Only connection failures are retried here, the request has not reached the server yet
+            max_retries=Retry(total=config['connect_retries'], connect=config['connect_retries'], read=0, status=0,
+                              backoff_factor=0.1, raise_on_status=False),
+        )
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if getattr(self, 'tcp_keepalive', False):
+            pool_kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            ]
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        with self._in_flight_lock:
+            self._in_flight += 1
+            exhausted = self._in_flight > self._pool_maxsize
+
+        if exhausted:
+            LOG.warning('http_transport(%s) connection pool exhausted', self.service)
+            log_metric('python_common.http_pool.exhausted', tags={'service': self.service, 'module': __name__})
+
+        try:
+            return super().send(request, stream=stream, timeout=timeout or self.timeout, verify=verify, cert=cert,
+                                proxies=proxies)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+
+
+def _mount_adapter(service, session):
+    adapter = PooledHTTPAdapter(service, get_transport_config(service))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def build_session(service, headers=None):
+    """
+    Build a requests Session for a service with a pooled, tuned adapter configured
+    through settings.HTTP_TRANSPORT (see get_transport_config)
+    """
+    session = _mount_adapter(service, requests.Session())
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def _has_pooled_adapter(service, session):
+    adapter = session.adapters.get('https://')
+    return isinstance(adapter, PooledHTTPAdapter) and adapter.service == service
+
+
+# Serializes mounting adapters on sessions built elsewhere, see mount_pooled_adapter
+MOUNT_LOCK = threading.Lock()
+
+
+def mount_pooled_adapter(service, session):
+    """
+    Mount the PooledHTTPAdapter of a service on an existing requests Session, unless it already has one.
+    The session keeps the rest of its configuration (cert, verify, headers, auth, proxies, ...).
+    """
+    if not _has_pooled_adapter(service, session):
+        with MOUNT_LOCK:
+            if not _has_pooled_adapter(service, session):
+                _mount_adapter(service, session)
+    return session
+
+
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+
+
+def get_session(service):
+    """
+    Process wide session for a service, built with build_session on first use
+    """
+    return get_or_create(SESSIONS, SESSIONS_LOCK, service, lambda: build_session(service))
+
+
+# aiohttp sessions are bound to an event loop: {loop: {service: ClientSession}}
+ASYNC_SESSIONS = weakref.WeakKeyDictionary()
+
+
+def get_async_session(service):
+    """
+    aiohttp ClientSession for a service shared by the clients running on the current event loop, configured
+    like build_session through settings.HTTP_TRANSPORT (requires `aiohttp` to be installed).
+    Sessions should be released with close_async_sessions before the loop is closed.
+    """
+    aiohttp = import_aiohttp()
+    if aiohttp is None:
+        raise ImportError('Async clients require the aiohttp package')
+
+    sessions = ASYNC_SESSIONS.setdefault(asyncio.get_event_loop(), {})
+    session = sessions.get(service)
+    if session is None or session.closed:
+        config = get_transport_config(service)
+        session = sessions[service] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=config['pool_maxsize'], keepalive_timeout=30),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=config['connect_timeout'],
+                                          sock_read=config['read_timeout']),
+        )
+    return session
+
+
+async def close_async_sessions(*services):
+    """
+    Close the sessions created by get_async_session on the current event loop, only those of `services` if given
+    """
+    loop = asyncio.get_event_loop()
+    if not services:
+        sessions = ASYNC_SESSIONS.pop(loop, {})
+    else:
+        loop_sessions = ASYNC_SESSIONS.get(loop, {})
+        sessions = {service: loop_sessions.pop(service) for service in services if service in loop_sessions}
+
+    for session in sessions.values():
+        await session.close()
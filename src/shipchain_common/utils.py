@@ -17,7 +17,7 @@ limitations under the License.
 import decimal
 import json
 import re
-from uuid import UUID
+from uuid import UUID, uuid4
 from urllib.parse import parse_qs
 
 from dateutil.parser import parse
@@ -31,6 +31,14 @@ from rest_framework.exceptions import ValidationError
 
 DN_REGEX = re.compile(r'(?:/?)(.+?)(?:=)([^/]+)')
 
+DECIMAL_AS_FLOAT = 'float'
+DECIMAL_AS_STRING = 'string'
+DECIMAL_AS_NUMBER = 'number'
+
+# In 'number' mode Decimals pass through the stdlib encoder as strings wrapped in this marker, which is then removed
+# along with the quotes. It is random per process so that encoded data cannot realistically contain it.
+DECIMAL_NUMBER_MARKER = f'~{uuid4().hex[:8]}~'
+
 
 def assertDeepAlmostEqual(test_case, expected, actual, *args, **kwargs):  # nopep8 pylint: disable=invalid-name
     """
@@ -204,6 +212,19 @@ def parse_dn(ssl_dn):
     return dict(DN_REGEX.findall(ssl_dn))
 
 
+class classproperty:  # pylint: disable=invalid-name
+    """
+    Read-only property computed on every access, from the class as well as from its instances,
+    e.g. for class level configuration read from the settings on use rather than on import
+    """
+
+    def __init__(self, fget):
+        self.fget = fget
+
+    def __get__(self, instance, owner):
+        return self.fget(owner)
+
+
 class AliasField(models.Field):
     def contribute_to_class(self, cls, name, private_only=False):
         """
@@ -216,9 +237,55 @@ class AliasField(models.Field):
         return getattr(instance, self.db_column)
 
 
+def convert_sequence_decimals(obj, converter):
+    """
+    Return a list copy of a list or tuple with its Decimal items replaced by converter(decimal).
+    Other objects are returned as is.
+    The items are checked inline, so a builtin converter (e.g. `str`) runs without a Python call per Decimal.
+    Only the items of the sequence itself are converted: walking nested containers in Python costs more than
+    the encoder's `default` calls it saves.
+    """
+    if isinstance(obj, (list, tuple)):
+        return [converter(item) if type(item) is decimal.Decimal else item  # pylint: disable=unidiomatic-typecheck
+                for item in obj]
+    return obj
+
+
+_mark_decimal = f'{DECIMAL_NUMBER_MARKER}%s{DECIMAL_NUMBER_MARKER}'.__mod__
+
+
 class DecimalEncoder(json.JSONEncoder):
+    """
+    Encodes Decimals according to `decimal_mode`, which defaults to settings.JSON_DECIMAL_MODE:
+      'float' (default): converted to float, which is lossy for large or very precise values
+      'string': the exact value as a JSON string
+      'number': the exact value as a JSON number
+    The lossless modes convert the Decimals of a flat list in one pass before encoding, so the C encoder
+    never has to call back into `default` for each one.
+    """
+
+    def __init__(self, *args, decimal_mode=None, **kwargs):
+        super(DecimalEncoder, self).__init__(*args, **kwargs)
+        self.decimal_mode = decimal_mode or getattr(settings, 'JSON_DECIMAL_MODE', DECIMAL_AS_FLOAT)
+
+    def iterencode(self, o, _one_shot=False):
+        if self.decimal_mode == DECIMAL_AS_STRING:
+            return super(DecimalEncoder, self).iterencode(convert_sequence_decimals(o, str), _one_shot)
+
+        if self.decimal_mode == DECIMAL_AS_NUMBER:
+            encoded = ''.join(super(DecimalEncoder, self).iterencode(convert_sequence_decimals(o, _mark_decimal),
+                                                                      _one_shot))
+            return [encoded.replace(f'"{DECIMAL_NUMBER_MARKER}', '').replace(f'{DECIMAL_NUMBER_MARKER}"', '')]
+
+        return super(DecimalEncoder, self).iterencode(o, _one_shot)
+
     def default(self, o):  # pylint: disable=method-hidden
         if isinstance(o, decimal.Decimal):
+            # Lossless modes get here for the Decimals convert_sequence_decimals leaves, e.g. nested ones
+            if self.decimal_mode == DECIMAL_AS_STRING:
+                return str(o)
+            if self.decimal_mode == DECIMAL_AS_NUMBER:
+                return _mark_decimal(o)
             return float(o)
         return super(DecimalEncoder, self).default(o)
 
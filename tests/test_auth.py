@@ -9,13 +9,25 @@ try:
 except Exception as exc:
     raise exc
 
+import gc
+import logging
+
 import pytest
+from unittest import mock
+from django.core.cache import cache
 from django.http.request import HttpRequest
 from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework_simplejwt.tokens import UntypedToken
 
+from src.shipchain_common import authentication
 from src.shipchain_common.authentication import EngineRequest, passive_credentials_auth, PermissionedTokenUser, \
-    TransmissionRequest, LambdaRequest
+    TransmissionRequest, LambdaRequest, CachedJWTTokenUserAuthentication, get_jwt_from_request
+from src.shipchain_common.caching import get_two_tier_cache
+from src.shipchain_common.custom_logging.filter import OrganizationIdFilter, UserIdFilter
+from src.shipchain_common.custom_logging.middleware import UserOrganizationMiddleware, get_token_context
 from src.shipchain_common.test_utils import get_jwt
 from src.shipchain_common.utils import random_id
 
@@ -65,6 +77,106 @@ def test_organization_jwt_auth(username, organization_id):
     assert user.token.get('organization_id', None) == organization_id
 
 
+def test_verified_token_cache(username):
+    authentication.VERIFIED_TOKENS.clear()
+    raw_token = get_jwt(username=username)
+
+    with mock.patch.object(TokenBackend, 'decode', autospec=True, side_effect=TokenBackend.decode) as mock_decode:
+        user = passive_credentials_auth(raw_token)
+        assert user.username == username
+
+        # Verified once, whether by passive_credentials_auth or the DRF authenticator
+        assert passive_credentials_auth(raw_token).username == username
+        assert CachedJWTTokenUserAuthentication().get_validated_token(raw_token.encode()).payload['sub'] == user.id
+        assert mock_decode.call_count == 1
+
+        # Distinct tokens are verified on their own
+        passive_credentials_auth(get_jwt(username=username))
+        assert mock_decode.call_count == 2
+
+    # Invalid tokens are never cached
+    with pytest.raises(InvalidToken):
+        passive_credentials_auth(raw_token[:-4] + 'AAAA')
+    with pytest.raises(InvalidToken):
+        passive_credentials_auth(raw_token[:-4] + 'AAAA')
+
+    # Nor expired ones, and entries expire with their token
+    with mock.patch('src.shipchain_common.authentication.time.time', return_value=user.token['exp'] + 1):
+        validated = authentication.get_verified_token(b'expired', lambda raw_token: user.token)
+        assert validated is user.token
+    assert len(authentication.VERIFIED_TOKENS) == 2
+
+
+def test_token_context(username, organization_id, settings):
+    settings.PROFILES_ENABLED = True
+    raw_token = get_jwt(username=username, organization_id=organization_id)
+    request = HttpRequest()
+    request.META['HTTP_AUTHORIZATION'] = f'JWT {raw_token}'
+
+    UserOrganizationMiddleware(lambda request: None).process_request(request)
+    context = get_token_context(request)
+    assert context.verified
+    assert context.raw_token == raw_token.encode()
+    assert context.organization_id == organization_id
+
+    record = logging.makeLogRecord({})
+    OrganizationIdFilter().filter(record)
+    UserIdFilter().filter(record)
+    assert record.organization_id == organization_id
+    assert record.user_id == context.user.id
+
+    # The DRF authentication and get_jwt_from_request reuse what the middleware decoded
+    with mock.patch.object(CachedJWTTokenUserAuthentication, 'get_validated_token') as mock_validate:
+        drf_request = Request(request, authenticators=[CachedJWTTokenUserAuthentication()])
+        assert drf_request.user is context.user
+        assert drf_request.auth is context.validated_token
+        assert get_jwt_from_request(drf_request) == raw_token
+        assert not mock_validate.called
+
+    # Another request has to be authenticated on its own
+    other_request = HttpRequest()
+    other_request.META['HTTP_AUTHORIZATION'] = f'JWT {raw_token}'
+    assert get_token_context(other_request) is None
+    user, _ = CachedJWTTokenUserAuthentication().authenticate(Request(other_request))
+    assert user is not context.user
+    assert get_token_context(other_request).user is user
+
+    # Requests without a token clear the context
+    UserOrganizationMiddleware(lambda request: None).process_request(HttpRequest())
+    assert get_token_context() is None
+    OrganizationIdFilter().filter(record)
+    assert record.organization_id is None
+
+
+def test_token_context_cleared(username, organization_id):
+    raw_token = get_jwt(username=username, organization_id=organization_id)
+    request = HttpRequest()
+    request.META['HTTP_AUTHORIZATION'] = f'JWT {raw_token}'
+    record = logging.makeLogRecord({})
+
+    # Nothing is left on the thread once the response is done
+    middleware = UserOrganizationMiddleware(lambda request: None)
+    middleware.process_request(request)
+    assert get_token_context(request)
+    response = object()
+    assert middleware.process_response(request, response) is response
+    assert get_token_context() is None
+    OrganizationIdFilter().filter(record)
+    UserIdFilter().filter(record)
+    assert record.organization_id is None
+    assert record.user_id is None
+
+    # Without the middleware, the logging ids are not set for later requests of the thread to inherit
+    user, _ = CachedJWTTokenUserAuthentication().authenticate(Request(request))
+    assert get_token_context(request).user is user
+    OrganizationIdFilter().filter(record)
+    assert record.organization_id is None
+
+    # And the context does not keep its request alive
+    del request
+    gc.collect()
+    assert get_token_context().request is None
+
 def test_engine_auth_requires_header(engine_request):
     request = HttpRequest()
 
@@ -268,3 +380,76 @@ def test_token_user_does_not_has_perm(many_feature):
     assert not token_user.has_perm('not_a_permission')
     assert not token_user.has_perm(many_feature[1][0].split('.')[0])  # doesn't match on just feature
     assert not token_user.has_perm(many_feature[1][0].split('.')[1])  # doesn't match on just permission
+
+
+@pytest.fixture
+def permission_cache():
+    cache.clear()
+    with mock.patch.dict('src.shipchain_common.caching.CACHES', clear=True):
+        yield get_two_tier_cache('permissions')
+
+
+def test_token_user_permissions_loaded_once(many_feature, permission_cache):
+    jwt = get_jwt(features=many_feature[0])
+    token = UntypedToken(jwt)
+    token_user = PermissionedTokenUser(token)
+
+    with mock.patch.object(permission_cache, 'get', wraps=permission_cache.get) as mock_get:
+        assert token_user.has_perms(many_feature[1])
+        assert token_user.has_perms(many_feature[1][:2])
+        assert not token_user.has_perms(many_feature[1] + ['feature3.permission'])
+        assert token_user.has_perm(many_feature[1][0])
+        assert token_user.get_all_permissions() == many_feature[1]
+
+    mock_get.assert_called_once_with(token_user._get_permission_cache_key(),
+                                     ttl=token_user._get_permission_cache_life())
+    assert token_user.permission_set == frozenset(many_feature[1])
+
+
+def test_token_user_permission_cache(many_feature, permission_cache):
+    token = UntypedToken(get_jwt(features=many_feature[0]))
+
+    assert PermissionedTokenUser(token).has_perms(many_feature[1])
+    assert (permission_cache.local_hits, permission_cache.shared_hits, permission_cache.misses) == (0, 0, 1)
+
+    # Other requests with the same token are served from the process
+    assert PermissionedTokenUser(token).has_perms(many_feature[1])
+    assert (permission_cache.local_hits, permission_cache.shared_hits, permission_cache.misses) == (1, 0, 1)
+
+    # And other processes from the shared cache
+    permission_cache.local.clear()
+    assert PermissionedTokenUser(token).get_all_permissions() == many_feature[1]
+    assert (permission_cache.local_hits, permission_cache.shared_hits, permission_cache.misses) == (1, 1, 1)
+
+    # Not parsed again, even with the features gone
+    token.payload['features'] = {}
+    assert PermissionedTokenUser(token).get_all_permissions() == many_feature[1]
+
+
+def test_token_user_permission_cache_empty(permission_cache):
+    token = UntypedToken(get_jwt())
+    token_user = PermissionedTokenUser(token)
+
+    with mock.patch.object(permission_cache, 'set', wraps=permission_cache.set) as mock_set:
+        assert token_user.get_all_permissions() == []
+        assert not token_user.has_perm('feature.permission')
+    mock_set.assert_called_once_with(token_user._get_permission_cache_key(), ((), frozenset()),
+                                     token_user._get_permission_cache_life())
+
+    assert PermissionedTokenUser(token).get_all_permissions() == []
+    assert (permission_cache.local_hits, permission_cache.misses) == (1, 1)
+
+
+def test_token_user_permission_cache_life(permission_cache):
+    iat = datetime_to_epoch(aware_utcnow())
+    token = UntypedToken(get_jwt(features={'feature': ['permission']}, exp=iat+15, iat=iat))
+
+    with mock.patch.object(permission_cache.local, 'set') as mock_local_set:
+        PermissionedTokenUser(token).get_all_permissions()
+    assert mock_local_set.call_args[0][2] == 15
+
+    # Tokens without a unique key are not cached
+    del token.payload['jti'], token.payload['sub']
+    with mock.patch.object(permission_cache, 'set') as mock_set:
+        assert PermissionedTokenUser(token).get_all_permissions() == ['feature.permission']
+    mock_set.assert_not_called()
@@ -1,16 +1,49 @@
+import asyncio
+import datetime
+
 import pytest
 from unittest import mock
 
 import requests
+from aws_requests_auth.aws_auth import AWSRequestsAuth
+from botocore.credentials import Credentials
+from django.core.cache import cache
 
+from src.shipchain_common import aws
 from src.shipchain_common.exceptions import AWSIoTError
-from src.shipchain_common.aws import URLShortenerClient
-from src.shipchain_common.test_utils import mocked_rpc_response
+from src.shipchain_common.resilience import RetryPolicy
+from src.shipchain_common.aws import AsyncURLShortenerClient, CachedBotoAWSRequestsAuth, URLShortenerClient
+from src.shipchain_common.test_utils import APIGatewayServer, mocked_rpc_response
+from src.shipchain_common.transport import PooledHTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class ShortLinkContract:
+    # The shortening API is specific to each deployment, these tests use their own
+    SHORTEN_ENDPOINT = 'shorten'
+
+    def _build_shorten_payload(self, long_url):
+        return {'long_url': long_url}
+
+    def _parse_short_url(self, response_json):
+        return response_json['short_url']
+
+
+class ShortLinkClient(ShortLinkContract, URLShortenerClient):
+    pass
+
+
+class AsyncShortLinkClient(ShortLinkContract, AsyncURLShortenerClient):
+    pass
 
 
 @pytest.fixture()
 def aws_url_client():
-    return URLShortenerClient()
+    return ShortLinkClient()
 
 
 def test_init(aws_url_client):
@@ -20,6 +53,7 @@ def test_init(aws_url_client):
     assert aws_url_client.session.auth.aws_secret_access_key is None
     assert 'content-type' in aws_url_client.session.headers
     assert aws_url_client.session.headers['content-type'] == 'application/json'
+    assert isinstance(aws_url_client.session.get_adapter('https://not-really-aws.com'), PooledHTTPAdapter)
 
 
 def test_get(aws_url_client):
@@ -120,3 +154,198 @@ def test_call(aws_url_client):
             aws_url_client._call('patch', 'test_method', None)
             assert aws_error.status_code == 500
             assert 'Invalid HTTP Method' in aws_error.detail
+
+
+def test_signing_installed_once(aws_url_client):
+    auth = aws_url_client.session.auth
+    assert isinstance(auth, CachedBotoAWSRequestsAuth)
+
+    with mock.patch.object(CachedBotoAWSRequestsAuth, '__init__') as mock_init:
+        URLShortenerClient()
+        assert not mock_init.called
+    assert aws_url_client.session.auth is auth
+
+
+def test_cached_signing():
+    credentials = Credentials('AKIDEXAMPLE', 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY', 'session-token')
+    request = requests.Request('POST', 'https://not-really-aws.com/stage/path%20with/space?b=2&a=1',
+                               data=b'{"url": "https://example.com"}').prepare()
+
+    with mock.patch('aws_requests_auth.boto_utils.Session') as mock_session:
+        mock_session.return_value.get_credentials.return_value = credentials
+        auth = CachedBotoAWSRequestsAuth('not-really-aws.com', 'us-east-1', 'execute-api')
+
+    expected = AWSRequestsAuth('AKIDEXAMPLE', 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY', 'not-really-aws.com',
+                               'us-east-1', 'execute-api', aws_token='session-token')
+
+    now = datetime.datetime(2020, 6, 1, 12, 30, 45)
+    # Both implementations read the clock from datetime.datetime.utcnow
+    with mock.patch.object(datetime, 'datetime') as mock_datetime, \
+            mock.patch('src.shipchain_common.aws.getSignatureKey', wraps=aws.getSignatureKey) as mock_signing_key, \
+            mock.patch('src.shipchain_common.aws.get_credentials', wraps=aws.get_credentials) as mock_credentials:
+        mock_datetime.utcnow.return_value = now
+        aws.SIGNING_KEYS.clear()
+
+        # Same signature as the uncached implementation
+        assert auth(request.copy()).headers == expected(request.copy()).headers
+
+        # Credentials and signing key are only derived once
+        auth(request.copy())
+        assert mock_credentials.call_count == 1
+        assert mock_signing_key.call_count == 1
+
+        # A new day needs a new signing key
+        mock_datetime.utcnow.return_value = now + datetime.timedelta(days=1)
+        assert auth(request.copy()).headers == expected(request.copy()).headers
+        assert mock_signing_key.call_count == 2
+
+
+def test_cached_signing_credentials_expiry():
+    with mock.patch('aws_requests_auth.boto_utils.Session'):
+        auth = CachedBotoAWSRequestsAuth('not-really-aws.com', 'us-east-1', 'execute-api')
+
+    # Refreshable credentials are kept until botocore would refresh them
+    auth._refreshable_credentials = mock.Mock(
+        _expiry_time=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1))
+    assert 2600 < auth._credentials_lifetime() <= 2700
+
+    auth._refreshable_credentials._expiry_time = datetime.datetime.now(datetime.timezone.utc)
+    assert auth._credentials_lifetime() == 0
+
+    auth._refreshable_credentials = Credentials('AKIDEXAMPLE', 'secret')
+    assert auth._credentials_lifetime() == float('inf')
+
+
+@pytest.fixture()
+def short_url_cache():
+    cache.clear()
+    with mock.patch.dict('src.shipchain_common.caching.CACHES', clear=True):
+        yield
+
+
+def shorten_response(request_payload, code=201):
+    long_url = request_payload['long_url']
+    return mocked_rpc_response({'short_url': f'https://shp.ch/{long_url[-1]}'}, code=code)
+
+
+def test_shorten(aws_url_client, short_url_cache):
+    with mock.patch.object(requests.Session, 'post') as mock_post:
+        mock_post.side_effect = lambda url, data, params: shorten_response(aws.get_codec().loads(data))
+
+        assert aws_url_client.shorten('https://example.com/shipments/1') == 'https://shp.ch/1'
+        assert mock_post.call_args[0][0] == f'{aws_url_client.url}/shorten'
+
+        # Served from the cache, by this client or any other
+        assert ShortLinkClient().shorten('https://example.com/shipments/1') == 'https://shp.ch/1'
+        assert mock_post.call_count == 1
+
+        mock_post.side_effect = lambda url, data, params: mocked_rpc_response({'unexpected': True}, code=201)
+        with pytest.raises(AWSIoTError) as aws_error:
+            aws_url_client.shorten('https://example.com/shipments/2')
+        assert 'Invalid URL Shortener response' in aws_error.value.detail
+
+
+def test_shorten_contract(short_url_cache):
+    # The shortening API contract has to be defined by a subclass
+    with mock.patch.object(requests.Session, 'post') as mock_post:
+        with pytest.raises(NotImplementedError):
+            URLShortenerClient().shorten('https://example.com/shipments/1')
+        with pytest.raises(NotImplementedError):
+            URLShortenerClient().shorten_many(['https://example.com/shipments/1'])
+
+        class EndpointOnlyClient(URLShortenerClient):
+            SHORTEN_ENDPOINT = 'shorten'
+
+        with pytest.raises(NotImplementedError):
+            EndpointOnlyClient().shorten('https://example.com/shipments/1')
+    assert not mock_post.called
+
+
+def test_shorten_many(aws_url_client, short_url_cache):
+    def respond(url, data, params):
+        payload = aws.get_codec().loads(data)
+        if payload['long_url'].endswith('9'):
+            return mocked_rpc_response({'error': 'Invalid url'}, code=400)
+        return shorten_response(payload)
+
+    with mock.patch.object(requests.Session, 'post') as mock_post:
+        mock_post.side_effect = respond
+        aws_url_client.shorten('https://example.com/shipments/1')
+
+        long_urls = ['https://example.com/shipments/2', 'https://example.com/shipments/1',
+                     'https://example.com/shipments/9', 'https://example.com/shipments/2']
+        results = aws_url_client.shorten_many(long_urls)
+
+        # Distinct urls only, the cached one is not shortened again
+        assert list(results) == long_urls[:3]
+        assert mock_post.call_count == 1 + 2
+        assert results['https://example.com/shipments/1'] == 'https://shp.ch/1'
+        assert results['https://example.com/shipments/2'] == 'https://shp.ch/2'
+        assert isinstance(results['https://example.com/shipments/9'], AWSIoTError)
+
+        # Failures are not cached
+        assert aws_url_client.shorten_many(long_urls[:3])['https://example.com/shipments/2'] == 'https://shp.ch/2'
+        assert mock_post.call_count == 3 + 1
+
+
+@pytest.mark.skipif(aiohttp is None, reason='aiohttp is not installed')
+def test_async_shorten_many(short_url_cache):
+    async def call(http_method, endpoint, payload=None, params=None):
+        return {'short_url': f'https://shp.ch/{payload["long_url"][-1]}'}
+
+    async def scenario():
+        client = AsyncShortLinkClient(session=mock.Mock())
+        with mock.patch.object(client, '_call', side_effect=call) as mock_call:
+            assert await client.shorten('https://example.com/shipments/1') == 'https://shp.ch/1'
+            assert await client.shorten_many(['https://example.com/shipments/1', 'https://example.com/shipments/2',
+                                              'https://example.com/shipments/2']) == {
+                'https://example.com/shipments/1': 'https://shp.ch/1',
+                'https://example.com/shipments/2': 'https://shp.ch/2',
+            }
+            assert mock_call.call_count == 2
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+
+
+@pytest.fixture()
+def gateway_credentials():
+    with mock.patch('src.shipchain_common.aws.get_credentials', return_value={
+            'aws_access_key': 'AKIDEXAMPLE', 'aws_secret_access_key': 'secret', 'aws_token': 'session-token'}):
+        URLShortenerClient.get_auth()._credentials_valid_until = 0
+        yield
+    URLShortenerClient.get_auth()._credentials_valid_until = 0
+
+
+def test_api_gateway_server(gateway_credentials):
+    with APIGatewayServer('not-really-aws.com', 'AKIDEXAMPLE', 'secret', seed=0) as server:
+        class LocalURLShortenerClient(URLShortenerClient):
+            url = f'{server.url}/stage'
+            throttle_retry_policy = RetryPolicy(max_attempts=3, base_delay=0)
+
+        client = LocalURLShortenerClient()
+        assert client._post('shorten', {'long_url': 'https://example.com'}, {'b': 'x y', 'a': 1})['data'] == {
+            'long_url': 'https://example.com'}
+        assert client._get('path with/space')['path'] == '/stage/path%20with/space'
+
+        server.secret_key = 'other secret'
+        with pytest.raises(AWSIoTError) as aws_error:
+            client._get('devices')
+        assert 'signature we calculated does not match' in aws_error.value.detail
+
+        server.secret_key, server.client_error_rate = 'secret', 1
+        with pytest.raises(AWSIoTError) as aws_error:
+            client._get('devices')
+        assert '[404] Not Found' in aws_error.value.detail
+
+        # Throttled requests are retried after Retry-After
+        server.client_error_rate, server.throttle_rate, server.retry_after = 0, 1, 0
+        with pytest.raises(AWSIoTError) as aws_error:
+            client._get('devices')
+        assert '[429] Too Many Requests' in aws_error.value.detail
+
+        assert server.status_counts == {201: 1, 200: 1, 403: 1, 404: 1, 429: 3}
+        assert server.request_count == 7
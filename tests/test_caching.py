@@ -0,0 +1,99 @@
+from unittest import mock
+
+from django.core.cache import cache
+
+from src.shipchain_common.caching import LRUCache, MISSING, TwoTierCache, get_two_tier_cache
+
+
+def test_lru_cache_eviction():
+    lru = LRUCache(maxsize=2)
+
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1
+
+    # 'b' is now the least recently used entry
+    lru.set('c', 3)
+    assert lru.get('b') is MISSING
+    assert lru.get('a') == 1
+    assert lru.get('c') == 3
+    assert len(lru) == 2
+    assert (lru.hits, lru.misses) == (3, 1)
+
+    # Falsy values are cached too
+    lru.set('a', None)
+    assert lru.get('a') is None
+
+    lru.delete('a')
+    assert lru.get('a', 'default') == 'default'
+
+
+def test_lru_cache_ttl():
+    lru = LRUCache()
+
+    with mock.patch('src.shipchain_common.caching.time.monotonic', return_value=100):
+        lru.set('a', 1, ttl=10)
+        lru.set('b', 2)
+
+    with mock.patch('src.shipchain_common.caching.time.monotonic', return_value=109):
+        assert lru.get('a') == 1
+
+    with mock.patch('src.shipchain_common.caching.time.monotonic', return_value=111):
+        assert lru.get('a') is MISSING
+        assert lru.get('b') == 2
+    assert len(lru) == 1
+
+
+def test_two_tier_cache():
+    two_tier = TwoTierCache('test', maxsize=10, local_ttl=30)
+    cache.delete('test:key')
+
+    assert two_tier.get('key') == (MISSING, None)
+
+    two_tier.set('key', [])
+    assert cache.get('test:key') == []
+    assert two_tier.get('key') == ([], 'local')
+
+    # Entries set by another process are found in the shared tier, then kept locally
+    two_tier.local.clear()
+    assert two_tier.get('key') == ([], 'shared')
+    assert two_tier.get('key') == ([], 'local')
+
+    two_tier.delete('key')
+    assert two_tier.get('key') == (MISSING, None)
+
+
+def test_two_tier_cache_local_ttl():
+    two_tier = TwoTierCache('test', local_ttl=30)
+
+    with mock.patch.object(two_tier.local, 'set') as mock_set:
+        two_tier.set('short', 1, ttl=5)
+        two_tier.set('long', 1, ttl=300)
+        two_tier.set('forever', 1)
+
+    assert [call[0][2] for call in mock_set.call_args_list] == [5, 30, 30]
+
+
+def test_get_two_tier_cache(settings):
+    settings.TWO_TIER_CACHES = {'test_configured': {'maxsize': 5, 'local_ttl': 10}}
+
+    two_tier = get_two_tier_cache('test_configured')
+    assert two_tier is get_two_tier_cache('test_configured')
+    assert two_tier.local.maxsize == 5
+    assert two_tier.local_ttl == 10
+
+
+def test_two_tier_cache_counters():
+    cache.clear()
+    two_tier = TwoTierCache('test_counters', local_ttl=30)
+
+    assert two_tier.get('key') == (MISSING, None)
+    two_tier.set('key', ())
+    assert two_tier.get('key') == ((), 'local')
+    two_tier.local.clear()
+
+    with mock.patch.object(two_tier.local, 'set', wraps=two_tier.local.set) as mock_set:
+        assert two_tier.get('key', ttl=5) == ((), 'shared')
+    mock_set.assert_called_once_with('key', (), 5)
+
+    assert (two_tier.local_hits, two_tier.shared_hits, two_tier.misses) == (1, 1, 1)
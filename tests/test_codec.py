@@ -0,0 +1,115 @@
+import json
+from decimal import Decimal
+
+import pytest
+from unittest import mock
+
+from requests.models import Response
+
+from src.shipchain_common import codec
+from src.shipchain_common.codec import CODECS, JSONCodec, get_codec
+from src.shipchain_common.test_utils import mocked_rpc_response
+
+AVAILABLE_CODECS = [codec_class for codec_class, available in CODECS.values() if available]
+
+PAYLOAD = {
+    "jsonrpc": "2.0",
+    "params": {"txUnsigned": {"value": Decimal('1.5'), "nonce": 7, "data": "0x00"}, "amounts": [Decimal('0.25')]},
+}
+
+
+@pytest.fixture(autouse=True)
+def reset_codecs():
+    codec.CODEC_INSTANCES.clear()
+    yield
+    codec.CODEC_INSTANCES.clear()
+
+
+@pytest.mark.parametrize('codec_class', AVAILABLE_CODECS)
+def test_dumps_decimal_as_float(codec_class):
+    encoded = codec_class().dumps(PAYLOAD)
+    decoded = json.loads(encoded)
+    assert decoded['params']['txUnsigned']['value'] == 1.5
+    assert decoded['params']['amounts'] == [0.25]
+    assert decoded == json.loads(JSONCodec().dumps(PAYLOAD))
+
+
+@pytest.mark.parametrize('codec_class', AVAILABLE_CODECS)
+def test_dumps_decimal_as_string(codec_class):
+    amount = Decimal('1000000000000000000.000000000000000001')
+    decoded = json.loads(codec_class('string').dumps({'amount': amount}))
+    assert decoded['amount'] == '1000000000000000000.000000000000000001'
+    assert Decimal(decoded['amount']) == amount
+
+
+@pytest.mark.parametrize('codec_class', AVAILABLE_CODECS)
+def test_loads(codec_class):
+    body = b'{"jsonrpc": "2.0", "result": {"success": true, "ids": [1, 2]}, "id": 3}'
+    assert codec_class().loads(body) == json.loads(body)
+    assert codec_class().loads(body.decode()) == json.loads(body)
+
+    response = Response()
+    response.status_code = 200
+    response._content = body
+    assert codec_class().load_response(response) == json.loads(body)
+
+    # Mocked responses without a real body are parsed by the response itself
+    assert codec_class().load_response(mocked_rpc_response({'mocked': True})) == {'mocked': True}
+
+    with pytest.raises(ValueError):
+        codec_class().loads(b'not json')
+
+
+def test_get_codec(settings):
+    settings.JSON_CODEC = 'json'
+    settings.JSON_DECIMAL_MODE = 'string'
+    selected = get_codec()
+    assert type(selected) is JSONCodec
+    assert selected.decimal_mode == 'string'
+    assert selected is get_codec()
+
+    # The stdlib is the default
+    del settings.JSON_CODEC
+    assert type(get_codec()) is JSONCodec
+
+    # The fastest installed library is preferred
+    settings.JSON_CODEC = 'auto'
+    assert get_codec().name == next(name for name in ('orjson', 'ujson', 'json') if CODECS[name][1])
+
+    settings.JSON_CODEC = 'simdjson'
+    with pytest.raises(ImportError):
+        get_codec()
+
+    with mock.patch.dict(CODECS, {'orjson': (CODECS['orjson'][0], False), 'ujson': (CODECS['ujson'][0], False)}):
+        settings.JSON_CODEC = 'auto'
+        settings.JSON_DECIMAL_MODE = 'float'
+        assert type(get_codec()) is JSONCodec
+
+
+@pytest.mark.parametrize('codec_class', AVAILABLE_CODECS)
+def test_dumps_decimal_as_number(codec_class):
+    amount = Decimal('1000000000000000000.000000000000000001')
+    encoded = codec_class('number').dumps({'amounts': [amount, Decimal('2')]})
+    assert json.loads(encoded, parse_float=Decimal) == {'amounts': [amount, 2]}
+
+
+@pytest.mark.parametrize('codec_class', AVAILABLE_CODECS)
+def test_big_integers(codec_class):
+    # wei amounts exceed 64 bits
+    payload = {'txUnsigned': {'value': 10**21}, 'amounts': [10**21, -10**21, 2**64]}
+    assert json.loads(codec_class().dumps(payload)) == payload
+
+    body = b'{"result": {"balance": 123456789012345678901234567890, "value": 1000000000000000000000}}'
+    assert codec_class().loads(body) == {'result': {'balance': 123456789012345678901234567890, 'value': 10**21}}
+
+
+@pytest.mark.skipif(not CODECS['orjson'][1], reason='orjson is not installed')
+def test_orjson_fast_loads(settings):
+    settings.JSON_CODEC = 'orjson'
+    assert not get_codec().fast_loads
+
+    settings.JSON_ORJSON_LOADS = True
+    assert get_codec().fast_loads
+    with mock.patch.object(codec.orjson, 'loads', return_value={}) as mock_loads:
+        assert get_codec().loads(b'{}') == {}
+    mock_loads.assert_called_once_with(b'{}')
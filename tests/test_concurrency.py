@@ -0,0 +1,127 @@
+import asyncio
+import threading
+
+import pytest
+from unittest import mock
+
+from src.shipchain_common.concurrency import AsyncSingleFlight, SingleFlight
+
+
+def run_async(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_single_flight_threads():
+    single_flight = SingleFlight('test')
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {'value': 1}
+
+    results = []
+
+    def worker():
+        results.append(single_flight.do('key', slow_call, tags={'method': 'test'}))
+
+    with mock.patch('src.shipchain_common.concurrency.log_metric') as mock_metric:
+        leader = threading.Thread(target=worker)
+        leader.start()
+        started.wait(5)
+
+        followers = [threading.Thread(target=worker) for _ in range(4)]
+        for follower in followers:
+            follower.start()
+        while single_flight.coalesced < 4:
+            pass
+        release.set()
+
+        for thread in [leader] + followers:
+            thread.join()
+
+        mock_metric.assert_called_with('test.coalesced', tags={
+            'method': 'test', 'module': 'src.shipchain_common.concurrency'})
+
+    assert len(calls) == 1
+    assert results == [({'value': 1}, True)] * 5
+
+    # Once done, the next call runs again
+    assert single_flight.do('key', lambda: 2) == (2, False)
+
+
+def test_single_flight_errors():
+    single_flight = SingleFlight('test')
+    release = threading.Event()
+    errors = []
+
+    def failing_call():
+        release.wait(5)
+        raise ValueError('failed')
+
+    def worker():
+        try:
+            single_flight.do('key', failing_call)
+        except ValueError as error:
+            errors.append(error)
+
+    with mock.patch('src.shipchain_common.concurrency.log_metric'):
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while single_flight.coalesced < 2:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+
+    assert len(errors) == 3
+    assert not single_flight._flights
+
+
+def test_async_single_flight():
+    single_flight = AsyncSingleFlight('test')
+    calls = []
+
+    async def slow_call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'value': 1}
+
+    async def failing_call():
+        await asyncio.sleep(0.01)
+        raise ValueError('failed')
+
+    async def run():
+        results = await asyncio.gather(*[single_flight.do('key', slow_call) for _ in range(5)])
+        assert results == [({'value': 1}, True)] * 5
+        assert len(calls) == 1
+
+        assert await single_flight.do('key', slow_call) == ({'value': 1}, False)
+        assert len(calls) == 2
+
+        errors = await asyncio.gather(*[single_flight.do('error', failing_call) for _ in range(3)],
+                                      return_exceptions=True)
+        assert all(isinstance(error, ValueError) for error in errors)
+
+        # Cancelling the caller that started the call does not cancel it for the others
+        leader = asyncio.ensure_future(single_flight.do('key', slow_call))
+        follower = asyncio.ensure_future(single_flight.do('key', slow_call))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == ({'value': 1}, True)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    with mock.patch('src.shipchain_common.concurrency.log_metric'):
+        run_async(run())
+
+    assert single_flight.coalesced == 7
+    assert not single_flight._flights
@@ -1,11 +1,35 @@
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+from uuid import uuid4
+
 import pytest
 from unittest import mock
 
 import requests
+from influxdb_metrics.loader import TimingMetric
 
 from src.shipchain_common.exceptions import AWSIoTError
-from src.shipchain_common.iot import AWSIoTClient
-from src.shipchain_common.test_utils import mocked_rpc_response
+from src.shipchain_common.iot import AsyncAWSIoTClient, AWSIoTClient
+from src.shipchain_common.test_utils import mocked_rpc_response, StandInServer
+from src.shipchain_common.transport import PooledHTTPAdapter, close_async_sessions
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+requires_aiohttp = pytest.mark.skipif(aiohttp is None, reason='aiohttp is not installed')
+
+
+def run_async(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
 
 
 @pytest.fixture()
@@ -21,6 +45,16 @@ def test_init(aws_iot_client):
     assert aws_iot_client.session.auth.aws_secret_access_key is None
     assert 'content-type' in aws_iot_client.session.headers
     assert aws_iot_client.session.headers['content-type'] == 'application/json'
+    assert isinstance(aws_iot_client.session.get_adapter('https://not-really-aws.com'), PooledHTTPAdapter)
+
+
+def test_settings_read_on_use(settings):
+    settings.IOT_AWS_HOST = 'other-aws.com'
+    settings.IOT_GATEWAY_STAGE = 'prod'
+
+    assert AWSIoTClient.url == 'https://other-aws.com/prod'
+    assert AWSIoTClient.aws_host == 'other-aws.com'
+    assert AsyncAWSIoTClient.aws_host == 'other-aws.com'
 
 
 def test_get(aws_iot_client):
@@ -121,3 +155,304 @@ def test_call(aws_iot_client):
             aws_iot_client._call('patch', 'test_method')
             assert aws_error.status_code == 500
             assert 'Invalid HTTP Method' in aws_error.detail
+
+
+def test_bulk_operations(aws_iot_client):
+    device_ids = [str(uuid4()) for _ in range(20)]
+    failing_device = device_ids[3]
+    in_flight = {'current': 0, 'max': 0}
+    lock = threading.Lock()
+
+    def respond(url, data=None, **kwargs):
+        with lock:
+            in_flight['current'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['current'])
+        time.sleep(0.005)
+        with lock:
+            in_flight['current'] -= 1
+
+        if failing_device in url:
+            return mocked_rpc_response({"error": {"code": 404, "message": "Device not found"}}, code=404)
+        return mocked_rpc_response({"url": url, "data": json.loads(data) if data else None})
+
+    with mock.patch.object(requests.Session, 'get') as mock_get, \
+            mock.patch('src.shipchain_common.aws.TimingMetric', wraps=TimingMetric) as mock_timing:
+        mock_get.side_effect = respond
+        aws_iot_client.bulk_concurrency = 4
+
+        results = aws_iot_client.get_devices(device_ids)
+
+        assert mock_get.call_count == 20
+        assert in_flight['max'] == 4
+        assert list(results) == device_ids
+        for device_id in device_ids:
+            if device_id == failing_device:
+                assert isinstance(results[device_id], AWSIoTError)
+                assert 'Device not found' in results[device_id].detail
+            else:
+                assert results[device_id]['url'].endswith(f'/devices/{device_id}')
+
+        # Every call is timed, as well as the whole operation
+        timed_methods = [call[1]['tags']['method'] for call in mock_timing.call_args_list]
+        assert timed_methods.count('iot::get::devices/<device_id>') == 20
+        assert mock_timing.call_args_list[0] == mock.call('python_common_aws.call', tags={
+            'method': 'iot::bulk::get_devices', 'size': 20, 'errors': 1, 'success': 'False', 'exception': ''})
+
+    with mock.patch.object(requests.Session, 'put') as mock_put:
+        mock_put.side_effect = respond
+        results = aws_iot_client.put_device_shadows({device_id: {'state': {'desired': {'index': index}}}
+                                                     for index, device_id in enumerate(device_ids[:2])})
+        assert results[device_ids[1]] == {'url': f'{aws_iot_client.url}/devices/{device_ids[1]}/shadow',
+                                          'data': {'state': {'desired': {'index': 1}}}}
+
+    with mock.patch.object(requests.Session, 'delete') as mock_delete:
+        mock_delete.side_effect = respond
+        results = aws_iot_client.delete_devices(device_ids[2:4])
+        assert results[device_ids[2]]['url'].endswith(f'/devices/{device_ids[2]}')
+        assert isinstance(results[failing_device], AWSIoTError)
+
+        assert aws_iot_client.delete_devices([]) == {}
+
+
+def throttled_response(retry_after=None):
+    response = mocked_rpc_response({"message": "Too Many Requests"}, code=429)
+    response.headers = {'Retry-After': retry_after} if retry_after else {}
+    return response
+
+
+def test_throttling(aws_iot_client, settings):
+    device_id = str(uuid4())
+    success = mocked_rpc_response({"deviceId": device_id}, code=200)
+
+    with mock.patch.object(requests.Session, 'get') as mock_get, \
+            mock.patch('src.shipchain_common.aws.time.sleep') as mock_sleep:
+        # Retried after Retry-After plus jitter
+        mock_get.side_effect = [throttled_response('2'), success]
+        assert aws_iot_client._get(f'devices/{device_id}') == {"deviceId": device_id}
+        assert 2 <= mock_sleep.call_args[0][0] <= 2.5
+
+        # Up to throttle_retry_policy.max_attempts
+        mock_get.side_effect = [throttled_response(), throttled_response(), throttled_response(), success]
+        with pytest.raises(AWSIoTError) as aws_error:
+            aws_iot_client._get(f'devices/{device_id}')
+        assert '[429] Too Many Requests' in aws_error.value.detail
+        assert mock_get.call_count == 2 + 3
+
+        # Retry-After beyond the policy's max_delay is not waited for
+        mock_sleep.reset_mock()
+        mock_get.side_effect = [throttled_response('60'), success]
+        with pytest.raises(AWSIoTError):
+            aws_iot_client._get(f'devices/{device_id}')
+        mock_sleep.assert_not_called()
+
+    settings.RATE_LIMITS = {'aws_iot': {'rate': 5, 'burst': 1}}
+    with mock.patch.dict('src.shipchain_common.resilience.RATE_LIMITERS', clear=True), \
+            mock.patch.object(requests.Session, 'get', return_value=success), \
+            mock.patch('src.shipchain_common.aws.log_metric') as mock_metric, \
+            mock.patch('src.shipchain_common.resilience.time.sleep') as mock_sleep:
+        aws_iot_client._get(f'devices/{device_id}')
+        aws_iot_client._get(f'devices/{device_id}')
+
+        assert mock_sleep.call_args[0][0] == pytest.approx(0.2, abs=0.01)
+        waits = [call[1]['fields']['value'] for call in mock_metric.call_args_list
+                 if call[0][0] == 'python_common_aws.rate_limit_wait']
+        assert waits[0] == 0
+        assert waits[1] == pytest.approx(0.2, abs=0.01)
+
+
+class DeviceServer(StandInServer):
+    """
+    Stand-in IoT gateway echoing the request, 404 for unknown devices
+    """
+    def respond(self, handler, body):
+        if 'unknown' in handler.path:
+            return 404, json.dumps({"error": {"code": 404, "message": "Device not found"}}).encode()
+        return 200, json.dumps({
+            "method": handler.command,
+            "path": handler.path,
+            "data": json.loads(body) if body else None,
+            "signed": handler.headers.get('Authorization', '').startswith('AWS4-HMAC-SHA256'),
+        }).encode()
+
+
+@pytest.fixture()
+def aws_credentials():
+    with mock.patch('src.shipchain_common.aws.get_credentials', return_value={
+            'aws_access_key': 'AKIDEXAMPLE', 'aws_secret_access_key': 'secret', 'aws_token': None}):
+        AWSIoTClient.get_auth()._credentials_valid_until = 0
+        yield
+    AWSIoTClient.get_auth()._credentials_valid_until = 0
+
+
+@requires_aiohttp
+def test_async_client(aws_credentials):
+    with DeviceServer() as server:
+        class LocalAsyncAWSIoTClient(AsyncAWSIoTClient):
+            url = f'{server.url}/stage'
+
+        async def scenario():
+            client = LocalAsyncAWSIoTClient()
+
+            response = await client._put('devices/1234/shadow', {'state': {}}, query_params={'version': 2})
+            assert response == {"method": "PUT", "path": "/stage/devices/1234/shadow?version=2",
+                                "data": {'state': {}}, "signed": True}
+
+            with pytest.raises(AWSIoTError) as aws_error:
+                await client._get('devices/unknown')
+            assert aws_error.value.detail == 'Error in AWS IoT Request: [404] Device not found'
+
+            with pytest.raises(AWSIoTError) as aws_error:
+                await client._call('patch', 'devices/1234')
+            assert 'Invalid HTTP Method' in aws_error.value.detail
+
+            results = await client.get_devices(['a', 'unknown', 'b'])
+            assert list(results) == ['a', 'unknown', 'b']
+            assert results['a']['path'] == '/stage/devices/a'
+            assert isinstance(results['unknown'], AWSIoTError)
+
+            # Clients on the loop share their service's session
+            assert client.session is LocalAsyncAWSIoTClient().session
+            await close_async_sessions()
+
+        run_async(scenario())
+
+    async def disconnected():
+        with pytest.raises(AWSIoTError) as aws_error:
+            await LocalAsyncAWSIoTClient()._get('devices/1234')
+        assert aws_error.value.status_code == 503
+        await close_async_sessions()
+
+    run_async(disconnected())
+
+
+class DeviceListServer(StandInServer):
+    """
+    Stand-in IoT gateway listing `device_count` devices, in pages of 2 or as NDJSON
+    """
+    device_count = 5
+
+    def respond(self, handler, body):
+        if 'unknown' in handler.path:
+            return 404, json.dumps({"message": "Not Found"}).encode()
+
+        query = parse_qs(urlparse(handler.path).query)
+        devices = [{"deviceId": f"device-{index}"} for index in range(self.device_count)]
+
+        if query.get('format') == ['ndjson']:
+            lines = b''.join(json.dumps(device).encode() + b'\n' for device in devices)
+            return 200, lines, {'Content-Type': 'application/x-ndjson'}
+
+        start = int(query.get('nextToken', ['0'])[0])
+        page = {"items": devices[start:start + 2]}
+        if start + 2 < len(devices):
+            page["nextToken"] = str(start + 2)
+        return 200, json.dumps(page).encode()
+
+
+def test_iter_devices(aws_credentials):
+    with DeviceListServer() as server:
+        class LocalAWSIoTClient(AWSIoTClient):
+            url = f'{server.url}/stage'
+
+        client = LocalAWSIoTClient()
+        with mock.patch('src.shipchain_common.aws.log_metric') as mock_metric:
+            devices = client.iter_devices()
+            assert server.request_count == 0
+
+            # Pages are only requested as the iteration reaches them
+            assert next(devices) == {"deviceId": "device-0"}
+            assert server.request_count == 1
+            assert [device['deviceId'] for device in devices] == [f'device-{index}' for index in range(1, 5)]
+            assert server.request_count == 3
+
+            stream_metric = mock_metric.call_args_list[-1]
+            assert stream_metric[0][0] == 'python_common_aws.stream'
+            assert stream_metric[1]['tags'] == {'method': 'iot::get::devices', 'format': 'json'}
+            assert stream_metric[1]['fields']['items'] == 5
+            assert stream_metric[1]['fields']['pages'] == 3
+
+            assert len(list(client.iter_devices({'format': 'ndjson'}))) == 5
+            stream_metric = mock_metric.call_args_list[-1]
+            assert stream_metric[1]['tags']['format'] == 'ndjson'
+            assert stream_metric[1]['fields'] == {'bytes': 5 * len(b'{"deviceId": "device-0"}\n'), 'items': 5,
+                                                  'pages': 1}
+
+        with pytest.raises(AWSIoTError) as aws_error:
+            list(client._stream('get', 'devices/unknown'))
+        assert aws_error.value.detail == 'Error in AWS IoT Request: [404] Not Found'
+
+
+def test_slow_call_sampling(aws_credentials, settings):
+    settings.SLOW_CALL_SAMPLING = {'aws_iot': {'threshold': 0.05}}
+    device_id = str(uuid4())
+
+    with DeviceServer(latency=0.1) as server, \
+            mock.patch.dict('src.shipchain_common.latency.SLOW_CALL_SAMPLERS', clear=True), \
+            mock.patch('src.shipchain_common.aws.log_metric') as mock_metric:
+        class LocalAWSIoTClient(AWSIoTClient):
+            url = f'{server.url}/stage'
+
+        client = LocalAWSIoTClient()
+        histogram = client.latency_histograms['iot::put::devices/<device_id>/shadow']
+        recorded = histogram.snapshot()['count']
+
+        client._put(f'devices/{device_id}/shadow', {'state': {}})
+
+        assert histogram.snapshot()['count'] == recorded + 1
+        slow_call = mock_metric.call_args
+        assert slow_call[0][0] == 'python_common_aws.slow_call'
+        assert slow_call[1]['tags'] == {'method': 'iot::put::devices/<device_id>/shadow', 'code': 200}
+
+        fields = slow_call[1]['fields']
+        assert fields['request_bytes'] > 0
+        assert fields['response_bytes'] > 0
+        assert set(fields) == {'value', 'request_bytes', 'response_bytes', 'connect', 'tls', 'server', 'read'}
+        assert fields['connect'] > 0
+        assert fields['server'] >= 0.1
+
+        # Fast calls are only recorded in the histograms
+        server.latency = 0
+        mock_metric.reset_mock()
+        client._put(f'devices/{device_id}/shadow', {'state': {}})
+        assert histogram.snapshot()['count'] == recorded + 2
+        assert mock_metric.call_args is None
+
+
+def test_metric_names(aws_iot_client):
+    device_id = str(uuid4()).upper()
+    assert aws_iot_client._get_generic_endpoint_for_metric('get', 'devices') == 'iot::get::devices'
+    assert aws_iot_client._get_generic_endpoint_for_metric('get', f'devices/{device_id}') == \
+        'iot::get::devices/<device_id>'
+    assert aws_iot_client._get_generic_endpoint_for_metric('put', f'devices/{device_id.lower()}/shadow') == \
+        'iot::put::devices/<device_id>/shadow'
+
+    # Only device ids are generic, other segments keep their names
+    assert aws_iot_client._get_generic_endpoint_for_metric('get', 'devices/search') == 'iot::get::devices/search'
+    assert aws_iot_client._get_generic_endpoint_for_metric('get', 'devices/tracker-01') == \
+        'iot::get::devices/tracker-01'
+    assert aws_iot_client._get_generic_endpoint_for_metric('put', 'devices/tracker-01/shadow') == \
+        'iot::put::devices/tracker-01/shadow'
+
+    # Undeclared endpoints only have their device ids replaced
+    assert aws_iot_client._get_generic_endpoint_for_metric('get', f'devices/{device_id}/config') == \
+        'iot::get::devices/<device_id>/config'
+    assert aws_iot_client._get_generic_endpoint_for_metric('get', 'devices/tracker-01/config') == \
+        'iot::get::devices/tracker-01/config'
+
+    class RoutedAWSIoTClient(AWSIoTClient):
+        metric_prefix = 'tracking'
+        route_templates = ('shipments/<uuid:shipment_id>/devices/<int:index>', 'shipments/<shipment_id>')
+
+    client = RoutedAWSIoTClient()
+    assert client._get_generic_endpoint_for_metric('get', f'shipments/{device_id}/devices/3') == \
+        'tracking::get::shipments/<shipment_id>/devices/<index>'
+    assert client._get_generic_endpoint_for_metric('get', 'shipments/not-a-uuid/devices/3') == \
+        'tracking::get::shipments/not-a-uuid/devices/3'
+    assert client._get_generic_endpoint_for_metric('get', 'shipments/s.1') == 'tracking::get::shipments/<shipment_id>'
+
+    # Names are computed once per endpoint
+    with mock.patch.object(RoutedAWSIoTClient, '_get_unmatched_generic_endpoint') as mock_unmatched:
+        mock_unmatched.return_value = 'other'
+        for _ in range(3):
+            assert client._get_generic_endpoint_for_metric('get', 'other/endpoint') == 'tracking::get::other'
+        assert mock_unmatched.call_count == 1
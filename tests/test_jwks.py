@@ -0,0 +1,155 @@
+import json
+import time
+from unittest import mock
+
+import jwt
+import pytest
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.exceptions import ImproperlyConfigured
+from jwt.algorithms import RSAAlgorithm
+from rest_framework_simplejwt.exceptions import TokenError
+
+from src.shipchain_common import jwks
+from src.shipchain_common.jwks import JWKSKeySet, JWKSUntypedToken, get_jwks_key_set, parse_jwks
+from src.shipchain_common.test_utils import get_jwt
+
+KID = '230498151c214b788dd97f22b85410a5'
+
+
+def build_jwk(public_key, kid, **kwargs):
+    return {**json.loads(RSAAlgorithm.to_jwk(public_key)), 'kid': kid, 'use': 'sig', 'alg': 'RS256', **kwargs}
+
+
+def write_jwks(path, *jwks_keys):
+    path.write_text(json.dumps({'keys': list(jwks_keys)}))
+
+
+@pytest.fixture
+def jwks_path(settings, tmp_path):
+    path = tmp_path / 'jwks.json'
+    write_jwks(path, build_jwk(settings.SIMPLE_JWT['PRIVATE_KEY'].public_key(), KID))
+
+    settings.JWKS_KEY_SETS = {'oidc': {'path': str(path)}}
+    with mock.patch.dict(jwks.JWKS_KEY_SETS, clear=True), mock.patch.dict(jwks.JWKS_TOKEN_BACKENDS, clear=True):
+        yield path
+
+
+def test_parse_jwks(settings):
+    public_key = settings.SIMPLE_JWT['PRIVATE_KEY'].public_key()
+    private_jwk = json.loads(RSAAlgorithm.to_jwk(settings.SIMPLE_JWT['PRIVATE_KEY']))
+
+    keys = parse_jwks({'keys': [
+        build_jwk(public_key, KID),
+        build_jwk(public_key, 'encryption', use='enc'),
+        {**private_jwk, 'kid': 'private'},
+        {'kty': 'EC', 'kid': 'elliptic', 'crv': 'P-256', 'x': 'x', 'y': 'y'},
+        {'kty': 'RSA', 'kid': 'invalid', 'n': 'AQAB'},
+        build_jwk(public_key, None),
+    ]})
+
+    assert list(keys) == [KID]
+    assert keys[KID].public_numbers() == public_key.public_numbers()
+
+
+def test_jwks_untyped_token(jwks_path):
+    token = JWKSUntypedToken(get_jwt(username='jwks@shipchain.io'))
+    assert token['username'] == 'jwks@shipchain.io'
+
+    # Parsed once, served from memory afterwards
+    with mock.patch.object(JWKSKeySet, '_load') as mock_load:
+        JWKSUntypedToken(get_jwt())
+    mock_load.assert_not_called()
+
+    # Tokens are still verified
+    with pytest.raises(TokenError):
+        JWKSUntypedToken(get_jwt()[:-4])
+
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    forged = jwt.encode(payload={'sub': '1', 'exp': int(time.time()) + 60}, key=other_key, algorithm='RS256',
+                        headers={'kid': KID}).decode()
+    with pytest.raises(TokenError):
+        JWKSUntypedToken(forged)
+
+    # Unverified decoding needs no keys
+    assert JWKSUntypedToken(forged, verify=False)['sub'] == '1'
+
+
+def test_jwks_key_rotation(jwks_path, settings):
+    assert JWKSUntypedToken(get_jwt())
+
+    new_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    new_token = jwt.encode(payload={'sub': '1', 'jti': 'new', 'exp': int(time.time()) + 60}, key=new_key,
+                           algorithm='RS256', headers={'kid': 'new'}).decode()
+
+    # Published alongside the current key: reloaded on first sight of the new kid
+    write_jwks(jwks_path, build_jwk(settings.SIMPLE_JWT['PRIVATE_KEY'].public_key(), KID),
+               build_jwk(new_key.public_key(), 'new'))
+    key_set = get_jwks_key_set('oidc')
+    key_set._attempted_at -= key_set.min_refresh_interval
+
+    assert JWKSUntypedToken(new_token)['sub'] == '1'
+    assert JWKSUntypedToken(get_jwt())
+
+    # Unknown kids trigger at most one reload per min_refresh_interval
+    unknown_token = jwt.encode(payload={'sub': '1', 'exp': int(time.time()) + 60}, key=new_key, algorithm='RS256',
+                               headers={'kid': 'unknown'}).decode()
+    with mock.patch.object(JWKSKeySet, '_load') as mock_load:
+        for _ in range(3):
+            with pytest.raises(TokenError):
+                JWKSUntypedToken(unknown_token)
+    mock_load.assert_not_called()
+
+
+def test_jwks_stale_while_revalidate(jwks_path):
+    key_set = get_jwks_key_set('oidc')
+    assert key_set.get_key(KID)
+
+    key_set._loaded_at -= key_set.refresh_interval + 1
+    with mock.patch('src.shipchain_common.jwks.threading.Thread') as mock_thread:
+        # Served stale while a single reload runs in the background
+        assert key_set.get_key(KID)
+        assert key_set.get_key(KID)
+    mock_thread.assert_called_once()
+    mock_thread.return_value.start.assert_called_once()
+
+    mock_thread.call_args[1]['target']()
+    assert time.monotonic() - key_set._loaded_at < key_set.refresh_interval
+    assert not key_set._refreshing
+
+
+def test_jwks_refresh_errors(jwks_path):
+    key_set = get_jwks_key_set('oidc')
+    assert key_set.get_key(KID)
+
+    # Failed reloads keep the keys, until they are older than max_stale
+    jwks_path.write_text('not json')
+    assert key_set.refresh()
+    assert key_set.get_key(KID)
+
+    key_set._loaded_at -= key_set.max_stale + 1
+    key_set._attempted_at -= key_set.min_refresh_interval
+    assert key_set.get_key(KID) is None
+
+    with pytest.raises(TokenError):
+        JWKSUntypedToken(get_jwt())
+
+
+def test_jwks_url(jwks_path, settings):
+    settings.JWKS_KEY_SETS = {'oidc': {'url': 'https://profiles.example.com/openid/jwks'}}
+    key_set = get_jwks_key_set('oidc')
+
+    with mock.patch('src.shipchain_common.jwks.get_session') as mock_session:
+        mock_session.return_value.get.return_value.json.return_value = json.loads(jwks_path.read_text())
+        assert key_set.get_key(KID)
+
+    assert mock_session.return_value.get.call_args[0][0] == 'https://profiles.example.com/openid/jwks'
+
+
+def test_get_jwks_key_set(settings):
+    settings.JWKS_KEY_SETS = {'missing_location': {}}
+    with mock.patch.dict(jwks.JWKS_KEY_SETS, clear=True):
+        with pytest.raises(ImproperlyConfigured):
+            get_jwks_key_set('not_configured')
+        with pytest.raises(ImproperlyConfigured):
+            get_jwks_key_set('missing_location')
@@ -0,0 +1,74 @@
+import pytest
+from unittest import mock
+
+from src.shipchain_common.latency import LatencyHistogram, LatencyHistograms, SlowCallSampler, \
+    flush_latency_histograms, get_latency_histograms, get_slow_call_sampler
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram(buckets=(0.1, 0.5, 1))
+    assert histogram.quantile(0.5) is None
+
+    for seconds in (0.05, 0.1, 0.2, 0.3, 0.7, 3):
+        histogram.record(seconds)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets'] == {0.1: 2, 0.5: 4, 1: 5, float('inf'): 6}
+    assert snapshot['count'] == 6
+    assert snapshot['sum'] == pytest.approx(4.35)
+
+    assert histogram.quantile(0.5) == pytest.approx(0.3)
+    assert histogram.quantile(0.25) == pytest.approx(0.075)
+    assert histogram.quantile(1) == 1
+
+    histogram.snapshot(reset=True)
+    assert histogram.snapshot() == {'buckets': {0.1: 0, 0.5: 0, 1: 0, float('inf'): 0}, 'count': 0, 'sum': 0}
+
+
+def test_latency_histograms_flush():
+    histograms = LatencyHistograms('test', buckets=(0.1, 1))
+    histograms.record('iot::get::devices', 0.05)
+    histograms.record('iot::get::devices', 0.5)
+    histograms['iot::put::devices/<device_id>/shadow']
+
+    with mock.patch('src.shipchain_common.latency.log_metric') as mock_metric:
+        histograms.flush()
+        mock_metric.assert_called_once_with('test.latency', tags={
+            'method': 'iot::get::devices', 'module': 'src.shipchain_common.latency'}, fields={
+            'le_0.1': 1, 'le_1': 2, 'le_inf': 2, 'count': 2, 'sum': 0.55})
+
+        # Histograms start over after a flush
+        mock_metric.reset_mock()
+        histograms.flush()
+        mock_metric.assert_not_called()
+
+
+def test_slow_call_sampler():
+    sampler = SlowCallSampler(threshold=0.5)
+    assert not sampler.should_sample(0.4)
+    assert sampler.should_sample(0.5)
+
+    assert not SlowCallSampler(threshold=0.5, sample_rate=0).should_sample(10)
+
+    with mock.patch('src.shipchain_common.latency.random.random', return_value=0.3):
+        assert SlowCallSampler(threshold=0.5, sample_rate=0.5).should_sample(1)
+        assert not SlowCallSampler(threshold=0.5, sample_rate=0.2).should_sample(1)
+
+
+def test_registries(settings):
+    settings.LATENCY_HISTOGRAMS = {'configured_service': {'buckets': (1, 2)}}
+    settings.SLOW_CALL_SAMPLING = {'sampled_service': {'threshold': 2}}
+
+    with mock.patch.dict('src.shipchain_common.latency.LATENCY_HISTOGRAMS', clear=True), \
+            mock.patch.dict('src.shipchain_common.latency.SLOW_CALL_SAMPLERS', clear=True):
+        histograms = get_latency_histograms('configured_service')
+        assert histograms is get_latency_histograms('configured_service')
+        assert histograms.buckets == (1, 2)
+
+        histograms.record('method', 1.5)
+        with mock.patch('src.shipchain_common.latency.log_metric') as mock_metric:
+            flush_latency_histograms()
+            assert mock_metric.call_args[0][0] == 'configured_service.latency'
+
+        assert get_slow_call_sampler('sampled_service').threshold == 2
+        assert get_slow_call_sampler('other_service') is None
@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+from unittest import mock
+from django.core.cache import cache
+
+from src.shipchain_common.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, TokenBucket, \
+    get_circuit_breaker, get_rate_limiter, parse_retry_after
+
+
+def test_retry_policy():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.1, max_delay=0.3)
+
+    assert policy.should_retry(1)
+    assert policy.should_retry(2)
+    assert not policy.should_retry(3)
+
+    for attempt, ceiling in ((1, 0.1), (2, 0.2), (3, 0.3), (10, 0.3)):
+        for _ in range(20):
+            assert 0 <= policy.get_delay(attempt) <= ceiling
+
+
+def test_circuit_breaker_opens_on_failure_rate():
+    breaker = CircuitBreaker('test', failure_threshold=0.5, window_size=10, minimum_calls=4, reset_timeout=30)
+
+    with mock.patch('src.shipchain_common.resilience.log_metric') as mock_metric:
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+        # Fourth call reaches minimum_calls with a 50% failure rate
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        mock_metric.assert_called_once_with('test.circuit_breaker', tags={
+            'state': 'open', 'module': 'src.shipchain_common.resilience'})
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_circuit_breaker_half_open():
+    breaker = CircuitBreaker('test', window_size=10, minimum_calls=1, reset_timeout=30)
+
+    with mock.patch('src.shipchain_common.resilience.time.monotonic') as mock_monotonic:
+        mock_monotonic.return_value = 1000
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        mock_monotonic.return_value = 1029
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        # After reset_timeout a single trial call is let through
+        mock_monotonic.return_value = 1030
+        breaker.before_call()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        # A failed trial opens the circuit again
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        mock_monotonic.return_value = 1060
+        breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.before_call()
+
+
+def test_circuit_breaker_disabled():
+    breaker = CircuitBreaker('test', minimum_calls=1, enabled=False)
+    breaker.record_failure()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_get_circuit_breaker(settings):
+    settings.CIRCUIT_BREAKERS = {'configured_service': {'minimum_calls': 5, 'reset_timeout': 10}}
+
+    breaker = get_circuit_breaker('configured_service')
+    assert breaker is get_circuit_breaker('configured_service')
+    assert breaker.minimum_calls == 5
+    assert breaker.reset_timeout == 10
+
+    assert get_circuit_breaker('other_service').minimum_calls == 20
+
+    # Configured breakers are looked up without taking the registry lock
+    with mock.patch('src.shipchain_common.resilience.CIRCUIT_BREAKERS_LOCK') as mock_lock:
+        assert get_circuit_breaker('configured_service') is breaker
+    mock_lock.__enter__.assert_not_called()
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('3') == 3
+    assert parse_retry_after('1.5') == 1.5
+    assert parse_retry_after('-1') == 0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert 50 < parse_retry_after('Fri, 31 Dec 9999 23:59:59 GMT')
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+
+
+def test_token_bucket():
+    bucket = TokenBucket('test', rate=10, burst=2)
+
+    with mock.patch('src.shipchain_common.resilience.time') as mock_time:
+        mock_time.monotonic.return_value = 100
+        bucket._updated_at = 100
+
+        # The burst goes through, then callers queue up for the next tokens
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == pytest.approx(0.1)
+        assert bucket.acquire() == pytest.approx(0.2)
+        mock_time.sleep.assert_has_calls([mock.call(pytest.approx(0.1)), mock.call(pytest.approx(0.2))])
+
+        # Tokens refill at `rate`, up to `burst`
+        mock_time.monotonic.return_value = 110
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == pytest.approx(0.1)
+
+        with mock.patch('src.shipchain_common.resilience.asyncio.sleep', side_effect=lambda delay: asyncio.sleep(0)):
+            loop = asyncio.new_event_loop()
+            assert loop.run_until_complete(bucket.acquire_async()) == pytest.approx(0.2)
+            loop.close()
+
+
+def test_token_bucket_shared():
+    cache.clear()
+    bucket = TokenBucket('shared_test', rate=2, burst=2, shared=True)
+    other_process_bucket = TokenBucket('shared_test', rate=2, burst=2, shared=True)
+
+    with mock.patch('src.shipchain_common.resilience.time') as mock_time:
+        mock_time.time.return_value = 1000.2
+        mock_time.sleep.side_effect = lambda delay: setattr(mock_time.time, 'return_value', 1000.2 + delay)
+
+        assert bucket.acquire() == 0
+        assert other_process_bucket.acquire() == 0
+
+        # The window of burst / rate = 1s is used up, wait for the next one
+        waited = bucket.acquire()
+        assert 0.8 <= waited <= 0.8 + 0.5
+        assert cache.get('rate_limit:shared_test:1000') == 3
+        assert cache.get('rate_limit:shared_test:1001') == 1
+
+
+def test_get_rate_limiter(settings):
+    settings.RATE_LIMITS = {'limited_service': {'rate': 5, 'burst': 10}}
+
+    limiter = get_rate_limiter('limited_service')
+    assert limiter is get_rate_limiter('limited_service')
+    assert (limiter.rate, limiter.burst, limiter.shared) == (5, 10, False)
+
+    assert get_rate_limiter('unlimited_service') is None
+
+    # Configured limiters, including None ones, are looked up without taking the registry lock
+    with mock.patch('src.shipchain_common.resilience.RATE_LIMITERS_LOCK') as mock_lock:
+        assert get_rate_limiter('limited_service') is limiter
+        assert get_rate_limiter('unlimited_service') is None
+    mock_lock.__enter__.assert_not_called()
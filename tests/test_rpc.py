@@ -1,12 +1,22 @@
+import asyncio
+import json
+import threading
+import time
+
 import pytest
 from unittest import mock
 
 import requests
 from django.conf import settings
 
+from src.shipchain_common import codec
+from src.shipchain_common.codec import CODECS
 from src.shipchain_common.exceptions import RPCError
-from src.shipchain_common.rpc import RPCClient
-from src.shipchain_common.test_utils import mocked_rpc_response
+from src.shipchain_common.resilience import CircuitBreaker, RetryPolicy, get_circuit_breaker
+from src.shipchain_common.rpc import AsyncRPCClient, RPCClient, RPCRequest
+from src.shipchain_common.transport import PooledHTTPAdapter, close_async_sessions, get_session
+from src.shipchain_common.test_utils import EngineRPCServer, mocked_rpc_response, mocked_wallet_valid_creation, \
+    mocked_wallet_valid_creation_side_effect, rpc_echo, valid_eth_amount_side_effect
 
 
 @pytest.fixture(scope='module')
@@ -19,15 +29,109 @@ def rpc_client(rpc_settings):
     return RPCClient()
 
 
+@pytest.fixture(autouse=True)
+def engine_circuit_breaker():
+    breaker = get_circuit_breaker('engine_rpc')
+    breaker.reset()
+    yield breaker
+    breaker.reset()
+
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+requires_aiohttp = pytest.mark.skipif(aiohttp is None, reason='aiohttp is not installed')
+
+
+class FakeAsyncResponse:
+    def __init__(self, body, status=200, delay=0):
+        self.status = status
+        self.body = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.delay = delay
+
+    async def read(self):
+        return self.body
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class FakeAsyncSession:
+    """
+    Stands in for an aiohttp.ClientSession; `handler` receives the decoded payload and returns a FakeAsyncResponse
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.payloads = []
+
+    def post(self, url, data=None, **kwargs):
+        payload = json.loads(data)
+        self.payloads.append(payload)
+        return self.handler(payload)
+
+    async def close(self):
+        pass
+
+
+def run_async(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
 def test_rpc_init(rpc_client):
     assert rpc_client.url == settings.ENGINE_RPC_URL
 
-    assert 'jsonrpc' in rpc_client.payload
-    assert 'id' in rpc_client.payload
-    assert 'params' in rpc_client.payload
     assert rpc_client.url == 'http://INTENTIONALLY_DISCONNECTED:9999'
-    assert rpc_client.payload['id'] == 0
-    assert rpc_client.payload['params'] == {}
+    assert isinstance(rpc_client.session.get_adapter(rpc_client.url), PooledHTTPAdapter)
+
+    # Every request gets its own immutable envelope with an increasing id
+    first_request = rpc_client._build_request('test_method', None)
+    second_request = rpc_client._build_request('test_method', {'a': 1})
+    assert isinstance(first_request, RPCRequest)
+    assert first_request.as_payload() == {"jsonrpc": "2.0", "id": 0, "method": "test_method", "params": {}}
+    assert second_request.id == 1
+    assert second_request.params == {'a': 1}
+
+    with pytest.raises(AttributeError):
+        first_request.method = 'other_method'
+
+
+def test_rpc_requests_session(rpc_client, settings, monkeypatch):
+    # requests would otherwise override session.verify with the CA bundle from the environment
+    monkeypatch.delenv('REQUESTS_CA_BUNDLE', raising=False)
+    monkeypatch.delenv('CURL_CA_BUNDLE', raising=False)
+
+    # The deprecated settings.REQUESTS_SESSION keeps its configuration and gets the pooled transport
+    requests_session = requests.Session()
+    requests_session.verify = '/certs/engine-ca.pem'
+    requests_session.headers['X-Api-Key'] = 'key'
+    settings.REQUESTS_SESSION = requests_session
+
+    with mock.patch('src.shipchain_common.rpc.LOG') as mock_log:
+        assert rpc_client.session is requests_session
+        assert rpc_client.session is requests_session
+    mock_log.warning.assert_called_once()
+    assert isinstance(requests_session.get_adapter(rpc_client.url), PooledHTTPAdapter)
+    assert requests_session.get_adapter(rpc_client.url).service == 'engine_rpc'
+
+    response = requests.Response()
+    response.status_code = 200
+    with mock.patch.object(requests.adapters.HTTPAdapter, 'send', return_value=response) as mock_send:
+        rpc_client.session.post(rpc_client.url, data='{}')
+    assert mock_send.call_args[1]['verify'] == '/certs/engine-ca.pem'
+    assert mock_send.call_args[0][0].headers['X-Api-Key'] == 'key'
+
+    settings.REQUESTS_SESSION = None
+    assert rpc_client.session is get_session('engine_rpc')
 
 
 def test_call(rpc_client):
@@ -57,7 +161,7 @@ def test_call(rpc_client):
         assert rpc_error.value.detail == 'Error from RPC Server'
 
         # Response object from server should be returned on success
-        mock_method.return_value = mocked_rpc_response({
+        mock_method.side_effect = rpc_echo(lambda payload: {
             "jsonrpc": "2.0",
             "result": {
                 "success": True,
@@ -65,12 +169,23 @@ def test_call(rpc_client):
                     "id": "d5563423-f040-4e0d-8d87-5e941c748d91",
                 }
             },
-            "id": 0
+            "id": payload['id']
         })
 
         response_json = rpc_client.call('test_method')
         assert response_json['test_object'] == {"id": "d5563423-f040-4e0d-8d87-5e941c748d91"}
 
+        # A response for another request id is rejected
+        mock_method.side_effect = rpc_echo(lambda payload: {
+            "jsonrpc": "2.0",
+            "result": {"success": True},
+            "id": payload['id'] + 1
+        })
+
+        with pytest.raises(RPCError) as rpc_error:
+            rpc_client.call('test_method')
+        assert rpc_error.value.detail == 'Invalid response from Engine'
+
     with mock.patch.object(requests.Session, 'post') as mock_request_post:
         unexpected_error = b'Unexpected server error'
         mock_request_post.return_value = mocked_rpc_response(unexpected_error, content=unexpected_error,
@@ -83,3 +198,559 @@ def test_call(rpc_client):
         assert rpc_error.value.status_code == 500
         assert str(rpc_error.value) == str(unexpected_error)
 
+
+
+def test_call_bundled_mocks(rpc_client):
+    # The bundled Engine mocks are static responses, for the first call of a client
+    with mock.patch.object(requests.Session, 'post') as mock_method:
+        mock_method.return_value = mocked_wallet_valid_creation()
+        assert rpc_client.call('wallet.create')['wallet']['id'] == 'd5563423-f040-4e0d-8d87-5e941c748d91'
+
+        # Their side_effect variants answer under the id of each request, for clients reused across calls
+        mock_method.side_effect = mocked_wallet_valid_creation_side_effect()
+        for _ in range(3):
+            assert rpc_client.call('wallet.create')['wallet']['id'] == 'd5563423-f040-4e0d-8d87-5e941c748d91'
+
+        mock_method.side_effect = valid_eth_amount_side_effect()
+        results = rpc_client.call_batch([('wallet.balance', {'wallet': '1'}), ('wallet.balance', {'wallet': '2'})])
+        assert [result['ether'] for result in results] == ['1000000000000000000'] * 2
+
+
+@pytest.mark.parametrize('codec_name', [name for name, (_, available) in CODECS.items() if available])
+def test_call_big_integers(rpc_client, settings, codec_name):
+    settings.JSON_CODEC = codec_name
+    codec.CODEC_INSTANCES.clear()
+
+    def engine(url, data=None, **kwargs):
+        payload = json.loads(data)
+        response = requests.models.Response()
+        response.status_code = 200
+        response._content = json.dumps({"jsonrpc": "2.0", "id": payload['id'], "result": {
+            "success": True, "transaction": payload['params']['txUnsigned'],
+            "balance": 123456789012345678901234567890}}).encode()
+        return response
+
+    try:
+        with mock.patch.object(requests.Session, 'post') as mock_method:
+            mock_method.side_effect = engine
+            result = rpc_client.call('transaction.sign', {'txUnsigned': {'value': 10**21}})
+    finally:
+        codec.CODEC_INSTANCES.clear()
+
+    assert result['transaction'] == {'value': 10**21}
+    assert result['balance'] == 123456789012345678901234567890
+
+
+def test_call_batch(rpc_client):
+    # Empty batches never reach Engine
+    with mock.patch.object(requests.Session, 'post') as mock_method:
+        assert rpc_client.call_batch([]) == []
+        assert not mock_method.called
+
+    # A batch is sent as a single POST and results are matched back by id
+    with mock.patch.object(requests.Session, 'post') as mock_method:
+        mock_method.side_effect = rpc_echo(lambda payload: [
+            {"jsonrpc": "2.0", "result": {"second": True}, "id": payload[1]['id']},
+            {"jsonrpc": "2.0", "result": {"first": True}, "id": payload[0]['id']},
+        ])
+
+        results = rpc_client.call_batch([('first_method', {'a': 1}), ('second_method', None)])
+        assert results == [{"first": True}, {"second": True}]
+        assert mock_method.call_count == 1
+
+        payload = json.loads(mock_method.call_args[1]['data'])
+        assert [item['method'] for item in payload] == ['first_method', 'second_method']
+        assert payload[0]['id'] != payload[1]['id']
+        assert payload[0]['params'] == {'a': 1}
+        assert payload[1]['params'] == {}
+
+    # Per item errors are raised, or returned in place when raise_on_error is False
+    with mock.patch.object(requests.Session, 'post') as mock_method:
+        mock_method.side_effect = rpc_echo(lambda payload: [
+            {"jsonrpc": "2.0", "result": {"first": True}, "id": payload[0]['id']},
+            {"jsonrpc": "2.0", "error": {"code": 1337, "message": "Error from RPC Server"}, "id": payload[1]['id']},
+        ])
+
+        with pytest.raises(RPCError) as rpc_error:
+            rpc_client.call_batch([('first_method', None), ('second_method', None)])
+        assert rpc_error.value.detail == 'Error from RPC Server'
+
+        results = rpc_client.call_batch([('first_method', None), ('second_method', None)], raise_on_error=False)
+        assert results[0] == {"first": True}
+        assert isinstance(results[1], RPCError)
+        assert results[1].detail == 'Error from RPC Server'
+
+        # Items without a matching response id are errors
+        results = rpc_client.call_batch([('first_method', None), ('second_method', None), ('third_method', None)],
+                                        raise_on_error=False)
+        assert isinstance(results[2], RPCError)
+        assert results[2].detail == 'Invalid response from Engine'
+
+    # Errors for the batch as a whole are raised
+    with mock.patch.object(requests.Session, 'post') as mock_method:
+        mock_method.return_value = mocked_rpc_response({
+            "jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": None,
+        })
+        with pytest.raises(RPCError) as rpc_error:
+            rpc_client.call_batch([('first_method', None)], raise_on_error=False)
+        assert rpc_error.value.detail == 'Invalid Request'
+
+        mock_method.side_effect = requests.exceptions.ConnectionError(mock.Mock(status=503), 'not found')
+        with pytest.raises(RPCError) as rpc_error:
+            rpc_client.call_batch([('first_method', None)])
+        assert rpc_error.value.status_code == 503
+
+
+def test_sign_and_send_transactions(rpc_client):
+    with mock.patch.object(requests.Session, 'post') as mock_method:
+        mock_method.side_effect = rpc_echo(lambda payload: [
+            {"jsonrpc": "2.0", "result": {"success": True, "transaction": "signed_0", "hash": "hash_0"},
+             "id": payload[0]['id']},
+            {"jsonrpc": "2.0", "result": {"success": False}, "id": payload[1]['id']},
+        ])
+
+        with pytest.raises(RPCError) as rpc_error:
+            rpc_client.sign_transactions([('wallet_0', {'nonce': 0}), ('wallet_1', {'nonce': 1})])
+        assert rpc_error.value.detail == 'Invalid response from Engine'
+
+        results = rpc_client.sign_transactions([('wallet_0', {'nonce': 0}), ('wallet_1', {'nonce': 1})],
+                                               raise_on_error=False)
+        assert results[0] == ('signed_0', 'hash_0')
+        assert isinstance(results[1], RPCError)
+
+        payload = json.loads(mock_method.call_args[1]['data'])
+        assert payload[1]['method'] == 'transaction.sign'
+        assert payload[1]['params'] == {"signerWallet": "wallet_1", "txUnsigned": {"nonce": 1}}
+
+        mock_method.side_effect = rpc_echo(lambda payload: [
+            {"jsonrpc": "2.0", "result": {"success": True, "receipt": {"id": 1}}, "id": payload[1]['id']},
+            {"jsonrpc": "2.0", "result": {"success": True, "receipt": {"id": 0}}, "id": payload[0]['id']},
+        ])
+        receipts = rpc_client.send_transactions([('signed_0', 'http://callback/0'), ('signed_1', 'http://callback/1')])
+        assert receipts == [{"id": 0}, {"id": 1}]
+
+        payload = json.loads(mock_method.call_args[1]['data'])
+        assert payload[0]['method'] == 'transaction.send'
+        assert payload[0]['params'] == {"callbackUrl": "http://callback/0", "txSigned": "signed_0"}
+
+
+def test_shared_client_across_threads(rpc_client):
+    # One client instance used from many threads at once must never mix up methods, params or ids
+    thread_count, calls_per_thread = 16, 25
+    errors = []
+
+    def slow_echo(url, data=None, **kwargs):
+        payload = json.loads(data)
+        time.sleep(0.001)
+        return mocked_rpc_response({"jsonrpc": "2.0", "id": payload['id'],
+                                    "result": {"method": payload['method'], "params": payload['params']}})
+
+    def worker(thread_index):
+        try:
+            for call_index in range(calls_per_thread):
+                params = {'thread': thread_index, 'call': call_index}
+                result = rpc_client.call(f'method_{thread_index}', params)
+                assert result == {'method': f'method_{thread_index}', 'params': params}
+        except Exception as exc:  # pylint: disable=broad-except
+            errors.append(exc)
+
+    with mock.patch.object(requests.Session, 'post') as mock_method:
+        mock_method.side_effect = slow_echo
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not errors
+        request_ids = [json.loads(call[1]['data'])['id'] for call in mock_method.call_args_list]
+        assert len(request_ids) == thread_count * calls_per_thread
+        assert len(set(request_ids)) == len(request_ids)
+
+
+def test_retry_policy(rpc_settings):
+    class RetryingRPCClient(RPCClient):
+        retry_policies = {'read_method': RetryPolicy(max_attempts=3, base_delay=0)}
+
+    rpc_client = RetryingRPCClient()
+    success = rpc_echo(lambda payload: {"jsonrpc": "2.0", "result": {"success": True}, "id": payload['id']})
+    connection_error = requests.exceptions.ConnectionError(mock.Mock(status=503), 'not found')
+
+    def respond_in_turn(*responses):
+        responses = list(responses)
+
+        def side_effect(url, data=None, **kwargs):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            if isinstance(response, mock.Mock):
+                return response
+            return response(url, data=data, **kwargs)
+        return side_effect
+
+    with mock.patch.object(requests.Session, 'post') as mock_method:
+        # Idempotent methods are retried on connection errors and gateway errors
+        mock_method.side_effect = respond_in_turn(
+            connection_error, mocked_rpc_response(b'Bad gateway', content=b'Bad gateway', code=502), success)
+        assert rpc_client.call('read_method') == {"success": True}
+        assert mock_method.call_count == 3
+
+        # Up to max_attempts
+        mock_method.reset_mock()
+        mock_method.side_effect = [connection_error] * 3
+        with pytest.raises(RPCError) as rpc_error:
+            rpc_client.call('read_method')
+        assert rpc_error.value.status_code == 503
+        assert mock_method.call_count == 3
+
+        # Other methods are never retried
+        mock_method.reset_mock()
+        mock_method.side_effect = respond_in_turn(connection_error, success)
+        with pytest.raises(RPCError):
+            rpc_client.call('write_method')
+        assert mock_method.call_count == 1
+
+        # Neither are engine errors
+        mock_method.reset_mock()
+        mock_method.side_effect = rpc_echo(lambda payload: {
+            "jsonrpc": "2.0", "error": {"code": 1337, "message": "Error from RPC Server"}, "id": payload['id']})
+        with pytest.raises(RPCError):
+            rpc_client.call('read_method')
+        assert mock_method.call_count == 1
+
+        # Batches are retried only if every method may be
+        mock_method.reset_mock()
+        mock_method.side_effect = [connection_error] * 3
+        with pytest.raises(RPCError):
+            rpc_client.call_batch([('read_method', None), ('write_method', None)])
+        assert mock_method.call_count == 1
+
+
+def test_circuit_breaker(rpc_client, engine_circuit_breaker):
+    engine_circuit_breaker.minimum_calls = 2
+
+    with mock.patch.object(requests.Session, 'post') as mock_method:
+        mock_method.side_effect = requests.exceptions.ConnectionError(mock.Mock(status=503), 'not found')
+        for _ in range(2):
+            with pytest.raises(RPCError):
+                rpc_client.call('test_method')
+        assert engine_circuit_breaker.state == CircuitBreaker.OPEN
+
+        # Once open, calls fail fast without reaching Engine
+        mock_method.reset_mock()
+        with pytest.raises(RPCError) as rpc_error:
+            rpc_client.call('test_method')
+        assert rpc_error.value.status_code == 503
+        assert rpc_error.value.detail == 'Service temporarily unavailable, try again later'
+        assert not mock_method.called
+
+        with pytest.raises(RPCError) as rpc_error:
+            rpc_client.call_batch([('test_method', None)])
+        assert rpc_error.value.status_code == 503
+        assert not mock_method.called
+
+
+def test_response_cache(rpc_settings):
+    class CachingRPCClient(RPCClient):
+        cache_ttls = {'wallet.balance': 5}
+
+    rpc_client = CachingRPCClient()
+    rpc_client.response_cache.local.clear()
+    rpc_client.invalidate_cache('wallet.balance', {'wallet': 'a', 'token': 'SHIP'})
+
+    balance = rpc_echo(lambda payload: {"jsonrpc": "2.0", "result": {"balance": 1}, "id": payload['id']})
+
+    with mock.patch.object(requests.Session, 'post') as mock_method, \
+            mock.patch('src.shipchain_common.rpc.log_metric') as mock_metric:
+        mock_method.side_effect = balance
+
+        result = rpc_client.call('wallet.balance', {'wallet': 'a', 'token': 'SHIP'})
+        assert result == {"balance": 1}
+        mock_metric.assert_any_call('engine_rpc.cache', tags={
+            'method': 'wallet.balance', 'result': 'miss', 'module': 'src.shipchain_common.rpc'})
+
+        # Params are canonicalized, and callers cannot alter the cached result
+        result['balance'] = 2
+        assert rpc_client.call('wallet.balance', {'token': 'SHIP', 'wallet': 'a'}) == {"balance": 1}
+        assert mock_method.call_count == 1
+        mock_metric.assert_any_call('engine_rpc.cache', tags={
+            'method': 'wallet.balance', 'result': 'hit', 'tier': 'local', 'module': 'src.shipchain_common.rpc'})
+
+        # Other processes find it in the shared tier
+        rpc_client.response_cache.local.clear()
+        assert rpc_client.call('wallet.balance', {'token': 'SHIP', 'wallet': 'a'}) == {"balance": 1}
+        assert mock_method.call_count == 1
+
+        # Different params, invalidated results and uncached methods reach Engine
+        rpc_client.call('wallet.balance', {'wallet': 'b', 'token': 'SHIP'})
+        assert mock_method.call_count == 2
+
+        rpc_client.invalidate_cache('wallet.balance', {'token': 'SHIP', 'wallet': 'a'})
+        rpc_client.call('wallet.balance', {'wallet': 'a', 'token': 'SHIP'})
+        assert mock_method.call_count == 3
+
+        rpc_client.call('wallet.get', {'wallet': 'a'})
+        rpc_client.call('wallet.get', {'wallet': 'a'})
+        assert mock_method.call_count == 5
+
+        # Errors are not cached
+        mock_method.side_effect = rpc_echo(lambda payload: {
+            "jsonrpc": "2.0", "error": {"code": 1337, "message": "Error from RPC Server"}, "id": payload['id']})
+        for _ in range(2):
+            with pytest.raises(RPCError):
+                rpc_client.call('wallet.balance', {'wallet': 'c'})
+        assert mock_method.call_count == 7
+
+
+def test_response_cache_shared_hit_ttl(rpc_settings):
+    class CachingRPCClient(RPCClient):
+        cache_ttls = {'wallet.balance': 5}
+
+    rpc_client = CachingRPCClient()
+    rpc_client.response_cache.local.clear()
+    rpc_client.invalidate_cache('wallet.balance', {'wallet': 'd'})
+
+    balance = rpc_echo(lambda payload: {"jsonrpc": "2.0", "result": {"balance": 1}, "id": payload['id']})
+
+    with mock.patch.object(requests.Session, 'post') as mock_method:
+        mock_method.side_effect = balance
+        rpc_client.call('wallet.balance', {'wallet': 'd'})
+        rpc_client.response_cache.local.clear()
+
+        # A shared hit is kept locally for the method's ttl, not for the cache's longer local_ttl
+        now = time.monotonic()
+        with mock.patch('src.shipchain_common.caching.time.monotonic', return_value=now):
+            assert rpc_client.call('wallet.balance', {'wallet': 'd'}) == {"balance": 1}
+        assert mock_method.call_count == 1
+
+        # Once the shared entry expired, the local copy has expired too
+        with mock.patch('src.shipchain_common.caching.time.monotonic', return_value=now + 6), \
+                mock.patch('src.shipchain_common.caching.cache.get', side_effect=lambda key, default: default) \
+                as mock_shared:
+            assert rpc_client.call('wallet.balance', {'wallet': 'd'}) == {"balance": 1}
+        mock_shared.assert_called_once()
+        assert mock_method.call_count == 2
+
+
+def test_single_flight(rpc_settings):
+    class CoalescingRPCClient(RPCClient):
+        single_flight_methods = {'wallet.balance'}
+
+    rpc_client = CoalescingRPCClient()
+    release = threading.Event()
+
+    def slow_balance(url, data=None, **kwargs):
+        release.wait(5)
+        return rpc_echo(lambda payload: {"jsonrpc": "2.0", "result": {"balance": 1}, "id": payload['id']})(url, data)
+
+    results = []
+
+    def worker():
+        results.append(rpc_client.call('wallet.balance', {'wallet': 'a'}))
+
+    with mock.patch.object(requests.Session, 'post') as mock_method, \
+            mock.patch('src.shipchain_common.concurrency.log_metric') as mock_metric:
+        mock_method.side_effect = slow_balance
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while mock_metric.call_count < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert mock_method.call_count == 1
+        assert results == [{"balance": 1}] * 5
+        # Each caller gets its own copy of the shared result
+        assert len({id(result) for result in results}) == 5
+        mock_metric.assert_called_with('engine_rpc.coalesced', tags={
+            'method': 'wallet.balance', 'module': 'src.shipchain_common.concurrency'})
+
+
+@requires_aiohttp
+def test_async_single_flight(rpc_settings):
+    class CoalescingRPCClient(AsyncRPCClient):
+        single_flight_methods = {'wallet.balance'}
+
+    def handler(payload):
+        return FakeAsyncResponse({"jsonrpc": "2.0", "result": payload['params'], "id": payload['id']}, delay=0.01)
+
+    async def scenario():
+        client = CoalescingRPCClient(session=FakeAsyncSession(handler))
+        results = await client.gather([('wallet.balance', {'wallet': 'a'})] * 5 +
+                                      [('wallet.balance', {'wallet': 'b'}), ('wallet.get', {'wallet': 'a'})] * 2)
+        assert results == [{'wallet': 'a'}] * 5 + [{'wallet': 'b'}, {'wallet': 'a'}] * 2
+        assert sorted(payload['method'] for payload in client.session.payloads) == \
+            ['wallet.balance', 'wallet.balance', 'wallet.get', 'wallet.get']
+
+    with mock.patch('src.shipchain_common.concurrency.log_metric'):
+        run_async(scenario())
+
+
+@requires_aiohttp
+def test_async_call(rpc_settings):
+    def handler(payload):
+        if payload['method'] == 'fail_method':
+            return FakeAsyncResponse({"jsonrpc": "2.0", "error": {"code": 1337, "message": "Error from RPC Server"},
+                                      "id": payload['id']})
+        if payload['method'] == 'unexpected_method':
+            return FakeAsyncResponse(b'Unexpected server error', status=406)
+        if payload['method'] == 'disconnected_method':
+            raise aiohttp.ClientConnectionError('not found')
+        return FakeAsyncResponse({"jsonrpc": "2.0", "result": {"success": True, "method": payload['method']},
+                                  "id": payload['id']})
+
+    async def scenario():
+        async with AsyncRPCClient(session=FakeAsyncSession(handler)) as client:
+            assert (await client.call('test_method', {'a': 1}))['method'] == 'test_method'
+            assert client.session.payloads[-1]['params'] == {'a': 1}
+
+            with pytest.raises(RPCError) as rpc_error:
+                await client.call('fail_method')
+            assert rpc_error.value.status_code == 500
+            assert rpc_error.value.detail == 'Error from RPC Server'
+
+            with pytest.raises(RPCError) as rpc_error:
+                await client.call('unexpected_method')
+            assert rpc_error.value.status_code == 500
+            assert str(rpc_error.value) == str(b'Unexpected server error')
+
+            with pytest.raises(RPCError) as rpc_error:
+                await client.call('disconnected_method')
+            assert rpc_error.value.status_code == 503
+            assert rpc_error.value.detail == 'Service temporarily unavailable, try again later'
+
+    run_async(scenario())
+
+
+@requires_aiohttp
+def test_async_gather_concurrency(rpc_settings):
+    in_flight = {'current': 0, 'max': 0}
+
+    class TrackedResponse(FakeAsyncResponse):
+        async def __aenter__(self):
+            in_flight['current'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['current'])
+            await asyncio.sleep(0.01)
+            in_flight['current'] -= 1
+            return self
+
+    def handler(payload):
+        if payload['params'].get('fail'):
+            return TrackedResponse({"jsonrpc": "2.0", "error": {"code": 1, "message": "Failed"}, "id": payload['id']})
+        return TrackedResponse({"jsonrpc": "2.0", "result": payload['params'], "id": payload['id']})
+
+    async def scenario():
+        client = AsyncRPCClient(concurrency=3, session=FakeAsyncSession(handler))
+        results = await client.gather([('test_method', {'index': index}) for index in range(10)])
+        assert results == [{'index': index} for index in range(10)]
+        assert in_flight['max'] == 3
+
+        results = await client.gather([('test_method', {'index': 0}), ('test_method', {'fail': True})],
+                                      return_exceptions=True)
+        assert results[0] == {'index': 0}
+        assert isinstance(results[1], RPCError)
+
+        with pytest.raises(RPCError):
+            await client.gather([('test_method', {'fail': True})])
+
+    run_async(scenario())
+
+
+@requires_aiohttp
+def test_async_sign_send_and_batch(rpc_settings):
+    def handler(payload):
+        if isinstance(payload, list):
+            return FakeAsyncResponse([{"jsonrpc": "2.0", "result": item['method'], "id": item['id']}
+                                      for item in reversed(payload)])
+        if payload['method'] == 'transaction.sign':
+            return FakeAsyncResponse({"jsonrpc": "2.0", "id": payload['id'], "result": {
+                "success": True, "transaction": "signed", "hash": "hash"}})
+        return FakeAsyncResponse({"jsonrpc": "2.0", "id": payload['id'], "result": {
+            "success": True, "receipt": {"to": payload['params']['callbackUrl']}}})
+
+    async def scenario():
+        client = AsyncRPCClient(session=FakeAsyncSession(handler))
+        assert await client.sign_transaction('wallet', {'nonce': 0}) == ('signed', 'hash')
+        assert client.session.payloads[-1]['params'] == {"signerWallet": "wallet", "txUnsigned": {'nonce': 0}}
+
+        assert await client.send_transaction('signed', 'http://callback') == {"to": "http://callback"}
+
+        assert await client.call_batch([('first', None), ('second', None)]) == ['first', 'second']
+
+    run_async(scenario())
+
+
+@requires_aiohttp
+def test_async_connection_error(rpc_settings):
+    async def scenario():
+        async with AsyncRPCClient() as client:
+            client.url = 'http://127.0.0.1:1'
+            with pytest.raises(RPCError) as rpc_error:
+                await client.call('test_method')
+            assert rpc_error.value.status_code == 503
+
+    run_async(scenario())
+
+
+@requires_aiohttp
+def test_async_client_across_loops(settings):
+    class CoalescingRPCClient(AsyncRPCClient):
+        single_flight_methods = {'wallet.balance'}
+
+    with EngineRPCServer(handlers={'wallet.balance': lambda params: {'balance': params['wallet']}}) as server:
+        settings.ENGINE_RPC_URL = server.url
+        client = CoalescingRPCClient(concurrency=2)
+
+        calls = [('wallet.balance', {'wallet': 'a'})] * 3 + \
+            [('wallet.balance', {'wallet': str(index)}) for index in range(4)]
+
+        async def scenario():
+            try:
+                return await client.gather(calls)
+            finally:
+                # As done by the task running the loop, the client itself is not closed
+                await close_async_sessions()
+
+        # e.g. a module level client used by tasks that each run their own loop
+        for _ in range(3):
+            assert run_async(scenario()) == [{'balance': wallet['wallet']} for _, wallet in calls]
+
+
+def test_async_clients_share_session(settings):
+    with EngineRPCServer(handlers={'wallet.balance': lambda params: {'balance': params['wallet']}},
+                         latency=0.2) as server:
+        settings.ENGINE_RPC_URL = server.url
+
+        async def balance(wallet, delay):
+            await asyncio.sleep(delay)
+            async with AsyncRPCClient() as client:
+                return await client.call('wallet.balance', {'wallet': wallet})
+
+        async def scenario():
+            try:
+                # Closing a client leaves the loop's shared session to the requests of the other clients
+                return await asyncio.gather(balance('a', 0), balance('b', 0.1))
+            finally:
+                await close_async_sessions()
+
+        assert run_async(scenario()) == [{'balance': 'a'}, {'balance': 'b'}]
+
+def test_engine_rpc_server(settings):
+    with EngineRPCServer(handlers={'wallet.balance': lambda params: {'balance': params['wallet']}}) as server:
+        settings.ENGINE_RPC_URL = server.url
+        rpc_client = RPCClient()
+
+        assert rpc_client.call('wallet.balance', {'wallet': 'a'}) == {'balance': 'a'}
+        assert rpc_client.sign_transaction('wallet', {'nonce': 1}) == ({'nonce': 1}, '0x' + '0' * 64)
+        assert rpc_client.call_batch([('wallet.balance', {'wallet': 'b'}), ('other.method', None)]) == [
+            {'balance': 'b'}, {'success': True, 'method': 'other.method', 'params': {}}]
+        assert server.request_count == 3
+
+        server.error_rate = 1
+        with pytest.raises(RPCError) as rpc_error:
+            rpc_client.call('wallet.balance', {'wallet': 'a'})
+        assert str(rpc_error.value) == str(b'{"message": "Service Unavailable"}')
@@ -0,0 +1,98 @@
+import pytest
+from unittest import mock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.shipchain_common.transport import PooledHTTPAdapter, build_session, get_session, get_timeout, \
+    get_transport_config, mount_pooled_adapter
+
+
+@pytest.fixture()
+def transport_settings(settings):
+    settings.REQUESTS_TIMEOUT = 100
+    settings.HTTP_TRANSPORT = {
+        'default': {'pool_maxsize': 64},
+        'tuned_service': {'pool_maxsize': 2, 'connect_timeout': 1, 'connect_retries': 3},
+    }
+    return settings
+
+
+def test_transport_config(transport_settings):
+    config = get_transport_config('other_service')
+    assert config['pool_maxsize'] == 64
+    assert config['pool_connections'] == 10
+    assert config['read_timeout'] == 100
+
+    config = get_transport_config('tuned_service')
+    assert config['pool_maxsize'] == 2
+    assert config['connect_retries'] == 3
+
+    assert get_timeout('tuned_service') == (1, 100)
+    assert get_timeout('other_service') == (5, 100)
+
+    # JWKS keys are loaded on request threads, with short timeouts unless configured otherwise
+    assert get_timeout('jwks') == (2, 5)
+    transport_settings.HTTP_TRANSPORT['jwks'] = {'read_timeout': 10}
+    assert get_timeout('jwks') == (2, 10)
+
+
+def test_build_session(transport_settings):
+    session = build_session('tuned_service', headers={'content-type': 'application/json'})
+    assert session.headers['content-type'] == 'application/json'
+
+    adapter = session.get_adapter('https://example.com')
+    assert isinstance(adapter, PooledHTTPAdapter)
+    assert adapter is session.get_adapter('http://example.com')
+    assert adapter.service == 'tuned_service'
+    assert adapter.timeout == (1, 100)
+    assert adapter.max_retries.connect == 3
+    assert adapter.max_retries.read == 0
+    assert adapter.poolmanager.connection_pool_kw['maxsize'] == 2
+    assert 'socket_options' in adapter.poolmanager.connection_pool_kw
+
+
+def test_mount_pooled_adapter(transport_settings):
+    session = requests.Session()
+    session.cert = '/certs/client.pem'
+    session.headers['Authorization'] = 'Bearer token'
+
+    assert mount_pooled_adapter('tuned_service', session) is session
+    adapter = session.get_adapter('https://example.com')
+    assert isinstance(adapter, PooledHTTPAdapter)
+    assert adapter.service == 'tuned_service'
+    assert session.cert == '/certs/client.pem'
+    assert session.headers['Authorization'] == 'Bearer token'
+
+    # Mounted once per session and service
+    mount_pooled_adapter('tuned_service', session)
+    assert session.get_adapter('http://example.com') is adapter
+    mount_pooled_adapter('other_service', session)
+    assert session.get_adapter('https://example.com').service == 'other_service'
+
+
+def test_adapter_send(transport_settings):
+    adapter = build_session('tuned_service').get_adapter('https://example.com')
+    request = requests.Request('GET', 'https://example.com').prepare()
+
+    with mock.patch.object(HTTPAdapter, 'send') as mock_send, \
+            mock.patch('src.shipchain_common.transport.log_metric') as mock_metric:
+        # Default timeouts are applied unless the caller provides one
+        adapter.send(request)
+        assert mock_send.call_args[1]['timeout'] == (1, 100)
+        adapter.send(request, timeout=3)
+        assert mock_send.call_args[1]['timeout'] == 3
+        assert not mock_metric.called
+
+        # Requests beyond pool_maxsize in flight are reported
+        adapter._in_flight = 2
+        adapter.send(request)
+        mock_metric.assert_called_once_with('python_common.http_pool.exhausted', tags={
+            'service': 'tuned_service', 'module': 'src.shipchain_common.transport'})
+        assert adapter._in_flight == 2
+
+
+def test_get_session():
+    session = get_session('shared_service')
+    assert session is get_session('shared_service')
+    assert session is not get_session('other_shared_service')
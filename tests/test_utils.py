@@ -1,5 +1,7 @@
+import json
 import pytest
 import uuid
+from decimal import Decimal
 from unittest.mock import patch
 from unittest.case import TestCase
 from datetime import timedelta
@@ -7,7 +9,8 @@ from datetime import timedelta
 from django.conf import settings
 from django.utils import timezone
 
-from src.shipchain_common.utils import assertDeepAlmostEqual, random_id, tznow, snake_to_sentence, validate_uuid4
+from src.shipchain_common.utils import assertDeepAlmostEqual, random_id, tznow, snake_to_sentence, validate_uuid4, \
+    DecimalEncoder
 from src.shipchain_common.test_utils import datetimeAlmostEqual
 
 TEST_UUIDS = ['uuid_{}'.format(i) for i in range(10000)]
@@ -80,6 +83,47 @@ def test_datetimeAlmostEqual(mock_now):
     assert not datetimeAlmostEqual(mock_now, dt2=date_time_4)
 
 
+def test_decimal_encoder_float():
+    wei = Decimal('1000000000000000000.000000000000000001')
+    assert json.dumps({'amount': Decimal('1.5')}, cls=DecimalEncoder) == '{"amount": 1.5}'
+    assert json.loads(json.dumps([wei], cls=DecimalEncoder)) == [1e18]
+
+    with pytest.raises(TypeError):
+        json.dumps({'unserializable': object()}, cls=DecimalEncoder)
+
+
+def test_decimal_encoder_string(settings):
+    wei = Decimal('1000000000000000000.000000000000000001')
+    payload = {'amounts': [wei, Decimal('-0.1')], 'nested': {'total': (wei,)}, 'name': 'ship'}
+
+    encoded = json.dumps(payload, cls=DecimalEncoder, decimal_mode='string')
+    assert json.loads(encoded) == {'amounts': [str(wei), '-0.1'], 'nested': {'total': [str(wei)]}, 'name': 'ship'}
+
+    settings.JSON_DECIMAL_MODE = 'string'
+    assert json.dumps(payload, cls=DecimalEncoder) == encoded
+    assert json.dumps(wei, cls=DecimalEncoder) == f'"{wei}"'
+
+
+def test_decimal_encoder_number(settings):
+    wei = Decimal('1000000000000000000.000000000000000001')
+    payload = {'amounts': [wei, Decimal('-1E+3')], 'nested': {'total': wei}, 'names': ['ship', '"quoted"', '\x00']}
+
+    encoded = json.dumps(payload, cls=DecimalEncoder, decimal_mode='number')
+    assert '"amounts": [1000000000000000000.000000000000000001, -1E+3]' in encoded
+    assert json.loads(encoded, parse_float=Decimal) == {
+        'amounts': [wei, Decimal('-1E+3')], 'nested': {'total': wei}, 'names': ['ship', '"quoted"', '\x00']}
+
+    settings.JSON_DECIMAL_MODE = 'number'
+    assert json.dumps(payload, cls=DecimalEncoder) == encoded
+    assert json.dumps(wei, cls=DecimalEncoder) == str(wei)
+
+    class AmountDecimal(Decimal):
+        pass
+
+    # Decimal subclasses go through `default` and stay exact
+    assert json.dumps([AmountDecimal('0.1')], cls=DecimalEncoder) == '[0.1]'
+
+
 class UtilsTests(TestCase):
     def test_assert_almost_equal(self):
         assertDeepAlmostEqual(self,